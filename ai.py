@@ -1,101 +1,732 @@
 import requests
-import PyPDF2
 import os
+import json
+import re
+import asyncio
+import contextvars
+import time
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from cache import ResponseCache
+from scheduler import RequestScheduler, RETRYABLE_STATUS
+from manifest import BuildManifest, hash_text
+from text_index import load_text_index
+from pptx_text import iter_slides, count_slides
+from transcript import TranscriptWriter, iter_pages, read_page
+from dedup import DuplicateIndex, DEDUP
+from boilerplate import strip_boilerplate, clean_text, BOILERPLATE_STRIP
+from journal import PageJournal
+import metrics
+from flashcards import FlashcardStore, parse_term_pairs, format_term_pairs, normalize_term
 
 # Load environment variables
 load_dotenv()
 
 API_KEY = os.getenv("OPENAI_API_KEY")
-API_URL = "https://api.openai.com/v1/chat/completions"
+API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
 
 headers = {
     "Authorization": f"Bearer {API_KEY}",
     "Content-Type": "application/json"
 }
 
-def query(prompt):
+# Upper bound on requests in flight at once, across every page of every deck
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "8"))
+
+# MAX_PAGES=3 only explains the first three non-empty pages of every deck, to try out prompts
+# without paying for whole decks. Unset, every page is explained.
+MAX_PAGES = int(os.getenv("MAX_PAGES")) if os.getenv("MAX_PAGES") else None
+
+# One keep-alive connection pool shared by every request instead of a fresh
+# connection (and TLS handshake) per page
+session = requests.Session()
+session.headers.update(headers)
+_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_CONCURRENT_REQUESTS)
+session.mount("https://", _adapter)
+session.mount("http://", _adapter)
+
+# Requests are admitted by a scheduler that keeps within the API's requests/tokens per minute
+# (LLM_RPM / LLM_TPM, otherwise learned from the rate limit headers) and adapts the number in
+# flight between 1 and MAX_CONCURRENT_REQUESTS. Throttled and failed requests are retried
+# up to LLM_MAX_RETRIES times with jittered exponential backoff.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+scheduler = RequestScheduler(
+    MAX_CONCURRENT_REQUESTS,
+    rpm=int(os.getenv("LLM_RPM")) if os.getenv("LLM_RPM") else None,
+    tpm=int(os.getenv("LLM_TPM")) if os.getenv("LLM_TPM") else None,
+)
+# The streaming pipeline asks for server-sent event responses and passes each sentence to the
+# voice stage as soon as it is written. Set LLM_STREAM=0 to wait for complete responses.
+LLM_STREAM = os.getenv("LLM_STREAM", "1") != "0"
+
+# Bump whenever the prompts or the way responses are used change, so cached
+# responses from older prompts are never reused
+PROMPT_VERSION = 1
+
+# Responses are cached on disk so re-running the AI stages doesn't pay for the same prompt twice.
+# Set AI_CACHE_BYPASS=1 to always hit the API.
+response_cache = ResponseCache(
+    os.getenv("AI_CACHE_DIR", os.path.join(".cache", "ai_responses")),
+    max_bytes=int(os.getenv("AI_CACHE_MAX_MB", "200")) * 1024 * 1024,
+    enabled=os.getenv("AI_CACHE_BYPASS", "0") != "1"
+)
+
+# Consecutive pages shorter than PACK_SHORT_PAGE_TOKENS are sent together in one request
+# of at most PACK_TOKEN_BUDGET input tokens. Set PACK_TOKEN_BUDGET=0 to send every page on its own.
+PACK_TOKEN_BUDGET = int(os.getenv("PACK_TOKEN_BUDGET", "1500"))
+PACK_SHORT_PAGE_TOKENS = int(os.getenv("PACK_SHORT_PAGE_TOKENS", "250"))
+PACK_MAX_PAGES = 6
+
+# "pptx" reads slide text and speaker notes straight from PPTX/<deck>.pptx when it exists, so the AI
+# stages don't wait for PDF conversion; "pdf" extracts the text from the converted PDFs
+TEXT_SOURCE = os.getenv("TEXT_SOURCE", "pdf")
+PPTX_FOLDER = "PPTX"
+
+# "jsonl" writes indexed, page-addressable transcripts; "txt" the older PAGE N: text format
+TRANSCRIPT_FORMAT = os.getenv("TRANSCRIPT_FORMAT", "jsonl")
+
+brainrot_prompt = "Break this down into smaller, easier-to-understand parts.  Be concise yet thorough so include important procedures, facts, dates, formulas, or core ideas related to this topic. Also, create a memorization technique to remember these core concepts easily for example (but not limited to) using analogies and real-life examples to simplify the concept and make it more relatable. Also dont respond with any human remarks like SURE HERE IS YOUR ANSWR, just give me the text i am requesting. Here's the content to explain: "
+#brainrot_prompt_v2 = "Break this down into smaller, easier-to-understand parts.  Be concise yet thorough so include important procedures, facts, dates, formulas, or core ideas related to this topic. Also, create a memorization technique to remember these core concepts easily for example (but not limited to) using analogies and real-life examples to simplify the concept and make it more relatable. Also dont respond with any human remarks like SURE HERE IS YOUR ANSWER, just give me the text i am requesting. Also dont use asterisks to bold text, dont try to change text formatting in that manner. You can use dashes to separate ideas though. Here's the content to explain: "
+
+def _read_event_stream(response, on_delta):
+    """
+    Read a streamed chat completion, calling on_delta(text) for every piece of content
+    as it arrives. Returns the assembled response in the same shape as a non-streamed one.
+    """
+    content = []
+    result = {"choices": []}
+    finish_reason = None
+    # Event streams don't declare a charset and requests would assume latin-1
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        if not line or not line.startswith("data:"):
+            continue
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            break
+        chunk = json.loads(payload)
+        if "error" in chunk:
+            return chunk
+        if chunk.get("usage"):
+            result["usage"] = chunk["usage"]
+        result["id"] = chunk.get("id")
+        for choice in chunk.get("choices", []):
+            delta = (choice.get("delta") or {}).get("content")
+            if delta:
+                content.append(delta)
+                on_delta(delta)
+            finish_reason = choice.get("finish_reason") or finish_reason
+    else:
+        raise requests.exceptions.ChunkedEncodingError("response stream ended early")
+    if content:
+        result["choices"] = [{"index": 0, "finish_reason": finish_reason,
+                              "message": {"role": "assistant", "content": "".join(content)}}]
+    return result
+
+def query(prompt, use_cache=True, max_tokens=500, on_delta=None):
+    """
+    Send one chat completion request, retrying through the scheduler, and return the response.
+    With on_delta the response is streamed and on_delta(text) is called for every piece of
+    the answer as it arrives. A cached answer is returned without calling on_delta.
+    """
     data = {
         "model": "gpt-3.5-turbo",
         "messages": [{"role": "system", "content": "You are a helpful assistant."},
                      {"role": "user", "content": prompt}],
-        "max_tokens": 500
+        "max_tokens": max_tokens
     }
-    response = requests.post(API_URL, headers=headers, json=data)
-    return response.json()
+    cache_key = ResponseCache.make_key(data["model"], data["messages"], data["max_tokens"], PROMPT_VERSION)
+    streamed = []
+    if on_delta is not None:
+        data = {**data, "stream": True, "stream_options": {"include_usage": True}}
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    # The API counts max_tokens against the tokens-per-minute budget up front
+    budget_tokens = estimate_tokens(prompt) + max_tokens
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        start = time.perf_counter()
+        with scheduler.slot(budget_tokens) as slot:
+            status = None
+            try:
+                response = session.post(API_URL, json=data, timeout=(10, LLM_TIMEOUT), stream=on_delta is not None)
+                status = response.status_code
+                if on_delta is not None and status == 200:
+                    with response:
+                        result = _read_event_stream(response, lambda text: (streamed.append(text), on_delta(text)))
+                else:
+                    result = response.json()
+            except requests.RequestException as e:
+                # Includes a stream cut off part way, which is retried like a failed connection
+                status = None
+                result = {"error": {"message": str(e) or type(e).__name__}}
+            except ValueError:
+                result = {"error": {"message": f"HTTP {status}: response is not JSON"}}
+            usage = result.get("usage") or {}
+            slot.record(status, response.headers if status is not None else {}, usage.get("total_tokens"))
+        succeeded = 'choices' in result and len(result['choices']) > 0
+        metrics.observe("llm_request", time.perf_counter() - start, error=not succeeded)
+        metrics.record_tokens(data["model"], result.get("usage"))
+        if succeeded or (status is not None and status not in RETRYABLE_STATUS) or attempt == LLM_MAX_RETRIES:
+            break
+        if streamed:
+            # Part of the answer was already passed on, a retry would repeat it
+            print(f"Response stream failed ({result['error']['message']}) after it started, not retrying")
+            break
+        delay = scheduler.backoff(attempt, slot.retry_after)
+        print(f"Request failed ({status or result['error']['message']}), retrying in {delay:.1f}s")
+        time.sleep(delay)
+
+    # Only keep successful completions, errors should be retried next run
+    if use_cache and succeeded:
+        response_cache.put(cache_key, result)
+    return result
+
+def _query_streamed(prompt, max_tokens, stream):
+    response = query(prompt, max_tokens=max_tokens, on_delta=stream.feed)
+    if 'choices' in response and len(response['choices']) > 0:
+        stream.close()
+    return response
+
+async def query_async(prompt, limiter, max_tokens=500, stream=None):
+    """
+    Run query() on a worker thread, waiting for a free slot in limiter first.
+    stream gets the answer as it arrives through stream.feed(text), and
+    stream.close() once it is complete (see voice.SentenceStream).
+    """
+    async with limiter:
+        loop = asyncio.get_running_loop()
+        # Executor threads don't inherit the task's context, pass it on so metric labels apply
+        context = contextvars.copy_context()
+        if stream is not None:
+            return await loop.run_in_executor(None, context.run, _query_streamed, prompt, max_tokens, stream)
+        return await loop.run_in_executor(None, lambda: context.run(query, prompt, max_tokens=max_tokens))
 
 def extract_text_from_pdf(pdf_path):
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text()
-    return text
+    if BOILERPLATE_STRIP:
+        return "\n".join(extract_text_by_page(pdf_path))
+    return load_text_index(pdf_path).full_text()
 
 def extract_text_by_page(pdf_path):
     """Extract text from PDF, returning a list where each element contains text from one page"""
-    page_texts = []
-    with open(pdf_path, 'rb') as file:
-        reader = PyPDF2.PdfReader(file)
-        for page in reader.pages:
-            text = page.extract_text()
-            if text.strip():  # Only add non-empty pages
-                page_texts.append(text)
-    return page_texts
-
-#testing the function with a first 3 pdf slides as to not waste tokens
-def create_brainrot_lecture(pdf_path):
+    # Only non-empty pages, use extract_numbered_pages to keep the real page numbers
+    return [text for _, text in extract_numbered_pages(pdf_path)]
+
+def extract_numbered_pages(pdf_path):
+    """Return (page_num, text) for every non-empty page, numbered like the PDF (1-based)"""
+    return list(iter_numbered_pages(pdf_path))
+
+def iter_numbered_pages(path):
+    """
+    (page_num, text) for every non-empty page of a PDF, or slide of a PPTX read lazily.
+    With BOILERPLATE_STRIP the text is cleaned up and a PDF's repeated headers and footers
+    are left out (see boilerplate.py). PPTX slides are only cleaned up, their slide number,
+    date and footer placeholders are never read.
+    """
+    if path.lower().endswith('.pptx'):
+        if BOILERPLATE_STRIP:
+            return ((page_num, text) for page_num, text in
+                    ((page_num, clean_text(text)) for page_num, text in iter_slides(path)) if text)
+        return iter_slides(path)
+    index = load_text_index(path)
+    if not BOILERPLATE_STRIP:
+        return iter(index.non_empty())
+    return iter(_stripped_pages(index))
+
+# Boilerplate-free pages of every PDF read so far, by (absolute path, source stamp)
+_stripped = {}
+
+def _stripped_pages(index):
+    key = (os.path.abspath(index.pdf_path), index.source_stamp)
+    if key not in _stripped:
+        pages, stats = strip_boilerplate(index.non_empty())
+        _stripped[key] = pages
+        before = estimate_tokens("".join(text for _, text in index.non_empty()))
+        after = estimate_tokens("".join(text for _, text in pages))
+        if stats["boilerplate"] or before > after:
+            print(f"Stripped {stats['lines_removed']} boilerplate lines ({len(stats['boilerplate'])} distinct) "
+                  f"from {os.path.basename(index.pdf_path)}: about {before} -> {after} input tokens "
+                  f"({100 * (before - after) // max(before, 1)}% fewer)")
+    return _stripped[key]
+
+def deck_page_count(path):
+    if path.lower().endswith('.pptx'):
+        return count_slides(path)
+    return len(load_text_index(path))
+
+def deck_text_source(pdf_path):
+    """The file a deck's text is read from: its PPTX with TEXT_SOURCE=pptx, otherwise the PDF"""
+    if TEXT_SOURCE == "pptx":
+        pptx_path = os.path.join(PPTX_FOLDER, f"{os.path.splitext(os.path.basename(pdf_path))[0]}.pptx")
+        if os.path.exists(pptx_path):
+            return pptx_path
+    return pdf_path
+
+def list_decks(pdf_folder):
+    """
+    PDF paths of every deck. With TEXT_SOURCE=pptx this includes presentations
+    that haven't been converted yet, under the path their PDF will get.
+    """
+    names = {os.path.splitext(pdf)[0] for pdf in os.listdir(pdf_folder) if pdf.lower().endswith('.pdf')}
+    if TEXT_SOURCE == "pptx" and os.path.exists(PPTX_FOLDER):
+        names.update(os.path.splitext(pptx)[0] for pptx in os.listdir(PPTX_FOLDER)
+                     if pptx.lower().endswith('.pptx'))
+    return [os.path.join(pdf_folder, f"{name}.pdf") for name in sorted(names)]
+
+def _explanation_from_response(response, page_num):
+    if 'choices' in response and len(response['choices']) > 0:
+        return response['choices'][0]['message']['content']
+    return f"Error processing page {page_num}"
+
+def _sentence_stream(on_sentence, page_num):
+    # Imported here so the AI stages don't load the TTS engines unless they stream to them
+    from voice import SentenceStream
+    return SentenceStream(lambda sentence: on_sentence(page_num, sentence))
+
+async def _explain_page(page_num, page_count, page_text, limiter, on_sentence=None):
+    stream = _sentence_stream(on_sentence, page_num) if on_sentence else None
+    with metrics.label_context(page=page_num):
+        response = await query_async(brainrot_prompt + page_text, limiter, stream=stream)
+    print(f"Processed page {page_num} of {page_count}")
+    return _explanation_from_response(response, page_num)
+
+packed_pages_instructions = "The content below is made of several slides, each one starts with a line like === PAGE 1 ===. Explain every slide separately, and start each explanation with the exact same === PAGE N === line as its slide, in the same order. "
+PAGE_MARKER = re.compile(r'^\s*=== PAGE (\d+) ===\s*$', re.MULTILINE)
+
+class _PackedStream:
+    """
+    Splits the streamed answer to a packed request on its === PAGE N === lines and feeds each
+    page's text to its own sentence stream, dropping what split_packed_response would drop.
+    """
+
+    def __init__(self, page_nums, on_sentence):
+        self.page_nums = set(page_nums)
+        self.on_sentence = on_sentence
+        self._seen = set()
+        self._stream = None
+        self._pending = ""
+        self._line_start = True
+
+    def feed(self, text):
+        self._pending += text
+        while self._pending:
+            newline = self._pending.find("\n")
+            if self._line_start and self._pending.lstrip(" \t")[:1] in ("", "="):
+                # Could be a marker, wait for the whole line
+                if newline < 0:
+                    return
+                self._line(self._pending[:newline], "\n")
+                self._pending = self._pending[newline + 1:]
+            elif newline < 0:
+                self._write(self._pending)
+                self._pending, self._line_start = "", False
+            else:
+                self._write(self._pending[:newline + 1])
+                self._pending, self._line_start = self._pending[newline + 1:], True
+
+    def _line(self, line, ending):
+        marker = PAGE_MARKER.fullmatch(line)
+        if not marker:
+            self._write(line + ending)
+            return
+        if self._stream:
+            self._stream.close()
+        page_num = int(marker.group(1))
+        # Repeated or unexpected pages aren't used by split_packed_response either
+        self._stream = None
+        if page_num in self.page_nums and page_num not in self._seen:
+            self._seen.add(page_num)
+            self._stream = _sentence_stream(self.on_sentence, page_num)
+
+    def _write(self, text):
+        if self._stream:
+            self._stream.feed(text)
+
+    def close(self):
+        if self._pending:
+            self._line(self._pending, "")
+            self._pending = ""
+        if self._stream:
+            self._stream.close()
+            self._stream = None
+
+def plan_page_batches(pages, token_budget=PACK_TOKEN_BUDGET,
+                      short_page_tokens=PACK_SHORT_PAGE_TOKENS, max_pages=PACK_MAX_PAGES):
+    """
+    Group consecutive short (page_num, page_text) pages into batches that fit token_budget.
+    Returns a list of batches, each a list of (page_num, page_text). Long pages
+    always get a batch of their own.
+    """
+    batches = []
+    current = []
+    current_tokens = 0
+    for page_num, page_text in pages:
+        page_tokens = estimate_tokens(page_text)
+        if token_budget <= 0 or page_tokens > short_page_tokens:
+            if current:
+                batches.append(current)
+                current, current_tokens = [], 0
+            batches.append([(page_num, page_text)])
+            continue
+        if current and (current_tokens + page_tokens > token_budget or len(current) >= max_pages):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append((page_num, page_text))
+        current_tokens += page_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def split_packed_response(content, page_nums):
+    """
+    Split a packed response on its === PAGE N === markers.
+    Returns {page_num: explanation} for the expected pages that came back non-empty.
+    """
+    markers = list(PAGE_MARKER.finditer(content))
+    explanations = {}
+    for index, marker in enumerate(markers):
+        page_num = int(marker.group(1))
+        end = markers[index + 1].start() if index + 1 < len(markers) else len(content)
+        explanation = content[marker.end():end].strip()
+        if page_num in page_nums and explanation and page_num not in explanations:
+            explanations[page_num] = explanation
+    return explanations
+
+async def _explain_batch(batch, page_count, limiter, on_sentence=None):
+    """Explain several short pages in one request, returning {page_num: explanation}"""
+    page_nums = [page_num for page_num, _ in batch]
+    sections = "\n\n".join(f"=== PAGE {page_num} ===\n{page_text.strip()}" for page_num, page_text in batch)
+    stream = _PackedStream(page_nums, on_sentence) if on_sentence else None
+    with metrics.label_context(page=f"{page_nums[0]}-{page_nums[-1]}"):
+        response = await query_async(brainrot_prompt + packed_pages_instructions + sections, limiter,
+                                     max_tokens=min(500 * len(batch), 3000), stream=stream)
+
+    explanations = {}
+    if 'choices' in response and len(response['choices']) > 0:
+        explanations = split_packed_response(response['choices'][0]['message']['content'], page_nums)
+
+    # Anything the response didn't cover cleanly is asked for again on its own
+    missing = [(page_num, page_text) for page_num, page_text in batch if page_num not in explanations]
+    if missing:
+        print(f"Packed response was missing pages {[page_num for page_num, _ in missing]}, retrying them alone")
+        retried = await asyncio.gather(*(_explain_page(page_num, page_count, page_text, limiter, on_sentence)
+                                         for page_num, page_text in missing))
+        explanations.update(zip([page_num for page_num, _ in missing], retried))
+    print(f"Processed pages {page_nums[0]}-{page_nums[-1]} of {page_count}")
+    return explanations
+
+def _lecture_pages(pdf_path):
+    """(page_num, text) of the deck's non-empty pages, only the first MAX_PAGES of them if set"""
+    return list(itertools.islice(iter_numbered_pages(deck_text_source(pdf_path)), MAX_PAGES))
+
+class SharedExplanations:
+    """
+    Explains every cluster of duplicate pages (see dedup.py) once per run and
+    gives the explanation to the cluster's other pages, in whichever deck they are.
+    A cluster that has a page with an up to date transcript entry reuses that
+    page's explanation without a request.
+
+        shared = SharedExplanations.build(pdf_paths, transcripts_folder, manifest)
+        await brainrot_deck_async(..., shared=shared)
+    """
+
+    def __init__(self, index, input_hashes, transcripts_folder, manifest):
+        self.index = index
+        self.input_hashes = input_hashes
+        self.transcripts_folder = transcripts_folder
+        self.manifest = manifest
+        self.reused = 0
+        # Canonical page key -> future explanation of its cluster
+        self._explanations = {}
+
+    @classmethod
+    def build(cls, pdf_paths, transcripts_folder, manifest):
+        """Fingerprint the pages of every deck that may be explained in this run"""
+        index = DuplicateIndex()
+        input_hashes = {}
+        for pdf_path in pdf_paths:
+            pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+            pages = _lecture_pages(pdf_path)
+            input_hashes.update(_transcript_input_hashes(pdf_name, pages))
+            for page_num, page_text in pages:
+                index.add(f"{pdf_name}/page{page_num}", page_text, pdf_path, page_num)
+        if index.duplicate_count():
+            print(f"{index.duplicate_count()} of {len(index)} pages repeat another page and share its explanation")
+        return cls(index, input_hashes, transcripts_folder, manifest)
+
+    def _published(self, key):
+        """The transcript explanation of a page in key's cluster that is up to date, or None"""
+        for member in self.index.members(key):
+            input_hash = self.input_hashes.get(member)
+            if input_hash is None or not self.manifest.is_up_to_date("transcript", member, input_hash):
+                continue
+            pdf_name, page_num = member.rsplit("/page", 1)
+            transcript_path = os.path.join(self.transcripts_folder, f"{pdf_name}.{TRANSCRIPT_FORMAT}")
+            explanation = read_page(transcript_path, page_num) if os.path.exists(transcript_path) else None
+            if explanation:
+                return explanation
+        return None
+
+    def claim(self, pdf_name, pages):
+        """
+        Split a deck's (page_num, page_text) pages into the ones this deck explains
+        and {page_num: future explanation} for the ones that repeat another page.
+        """
+        loop = asyncio.get_running_loop()
+        own, copies = [], {}
+        for page_num, page_text in pages:
+            key = self.index.canonical(f"{pdf_name}/page{page_num}")
+            if key not in self._explanations:
+                self._explanations[key] = loop.create_future()
+                explanation = self._published(key)
+                if explanation is None:
+                    own.append((page_num, page_text))
+                    continue
+                self._explanations[key].set_result(explanation)
+            copies[page_num] = self._explanations[key]
+        self.reused += len(copies)
+        return own, copies
+
+    def publish(self, pdf_name, explanations):
+        """Hand {page_num: explanation} of claimed pages to the pages that repeat them"""
+        for page_num, explanation in explanations.items():
+            future = self._explanations.get(self.index.canonical(f"{pdf_name}/page{page_num}"))
+            if future is not None and not future.done():
+                future.set_result(explanation)
+
+    def release(self, pdf_name, pages):
+        """Fail the claimed pages that never got an explanation, so nothing waits on them forever"""
+        self.publish(pdf_name, {page_num: f"Error processing page {page_num}" for page_num, _ in pages})
+
+    def stats(self):
+        return f"duplicate pages reused: {self.reused}"
+
+async def create_brainrot_lecture_async(pdf_path, limiter, pages=None, on_page=None, on_sentence=None, shared=None):
+    """Create simplified explanations for each page of a PDF, all pages in flight at once.
+
+    The returned list is in page order regardless of which request finished first.
+    If given, the coroutine on_page(page_num, explanation) is awaited for every page
+    explained successfully as soon as its request finishes.
+    With on_sentence the responses are streamed and on_sentence(page_num, sentence) is
+    called on a worker thread for every sentence as soon as it is written, before the
+    page's on_page. Sentences of a page whose request then fails get no on_page.
+    With shared (a SharedExplanations), pages that repeat another page get its
+    explanation instead of a request of their own.
+    """
+    if pages is None:
+        pages = _lecture_pages(pdf_path)
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]
+    page_count = deck_page_count(deck_text_source(pdf_path))
+    to_send, copies = shared.claim(pdf_name, pages) if shared else (pages, {})
+    batches = plan_page_batches(to_send)
+    print(f"Sending {len(to_send)} pages of {os.path.basename(pdf_path)} in {len(batches)} requests..."
+          + (f" ({len(copies)} pages repeat other pages)" if copies else ""))
+
+    async def run_batch(batch):
+        if len(batch) == 1:
+            page_num, page_text = batch[0]
+            result = {page_num: await _explain_page(page_num, page_count, page_text, limiter, on_sentence)}
+        else:
+            result = await _explain_batch(batch, page_count, limiter, on_sentence)
+        if shared:
+            shared.publish(pdf_name, result)
+        if on_page:
+            for page_num in sorted(result):
+                if not result[page_num].startswith("Error processing page"):
+                    await on_page(page_num, result[page_num])
+        return result
+
+    async def copy_page(page_num, future):
+        explanation = await future
+        if explanation.startswith("Error processing page"):
+            return {page_num: f"Error processing page {page_num}"}
+        if on_page:
+            await on_page(page_num, explanation)
+        return {page_num: explanation}
+
+    explanations = {}
+    try:
+        with metrics.label_context(deck=pdf_name):
+            results = await asyncio.gather(*(run_batch(batch) for batch in batches),
+                                           *(copy_page(page_num, future) for page_num, future in copies.items()))
+    finally:
+        if shared:
+            shared.release(pdf_name, to_send)
+    for result in results:
+        explanations.update(result)
+    return [explanations[page_num] for page_num, _ in pages]
+
+async def run_with_limit(coro_factory, max_concurrency):
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=max_concurrency)
+    loop.set_default_executor(executor)
+    limiter = asyncio.Semaphore(max_concurrency)
+    try:
+        return await coro_factory(limiter)
+    finally:
+        executor.shutdown(wait=False)
+
+def create_brainrot_lecture(pdf_path, max_concurrency=MAX_CONCURRENT_REQUESTS):
     """Create simplified explanations for each page of a PDF"""
-    page_texts = extract_text_by_page(pdf_path)
-    simplified_explanations = []
-    
-    brainrot_prompt = "Break this down into smaller, easier-to-understand parts.  Be concise yet thorough so include important procedures, facts, dates, formulas, or core ideas related to this topic. Also, create a memorization technique to remember these core concepts easily for example (but not limited to) using analogies and real-life examples to simplify the concept and make it more relatable. Also dont respond with any human remarks like SURE HERE IS YOUR ANSWR, just give me the text i am requesting. Here's the content to explain: "
-    #brainrot_prompt_v2 = "Break this down into smaller, easier-to-understand parts.  Be concise yet thorough so include important procedures, facts, dates, formulas, or core ideas related to this topic. Also, create a memorization technique to remember these core concepts easily for example (but not limited to) using analogies and real-life examples to simplify the concept and make it more relatable. Also dont respond with any human remarks like SURE HERE IS YOUR ANSWER, just give me the text i am requesting. Also dont use asterisks to bold text, dont try to change text formatting in that manner. You can use dashes to separate ideas though. Here's the content to explain: "
+    return asyncio.run(run_with_limit(
+        lambda limiter: create_brainrot_lecture_async(pdf_path, limiter), max_concurrency))
 
-    for page_num, page_text in enumerate(page_texts[:3], 1):  # Stop at the third element
-        print(f"Processing page {page_num} of {min(3, len(page_texts))}...")  # Adjust print statement
-        response = query(brainrot_prompt + page_text)
-        
-        if 'choices' in response and len(response['choices']) > 0:
-            explanation = response['choices'][0]['message']['content']
-            simplified_explanations.append(explanation)
+def _transcript_input_hashes(pdf_name, pages):
+    """Manifest keys and input hashes for every page that goes into a deck's transcript"""
+    return {f"{pdf_name}/page{page_num}": hash_text(PROMPT_VERSION, brainrot_prompt, page_text)
+            for page_num, page_text in pages}
+
+def _resumable_pages(pdf_name, pages, input_hashes, journal, manifest, output_file):
+    """
+    {page_num: explanation} of the pages an interrupted or partly failed run already explained:
+    pages in the deck's journal and up to date pages of its existing transcript
+    """
+    page_hashes = {page_num: input_hashes[f"{pdf_name}/page{page_num}"] for page_num, _ in pages}
+    done = {page_num: entry["text"] for page_num, entry in journal.completed(page_hashes).items()}
+    if os.path.exists(output_file):
+        for page_num, input_hash in page_hashes.items():
+            if page_num not in done and manifest.is_up_to_date("transcript", f"{pdf_name}/page{page_num}", input_hash):
+                explanation = read_page(output_file, page_num)
+                if explanation:
+                    done[page_num] = explanation
+    return done
+
+async def brainrot_deck_async(pdf_path, transcripts_folder, limiter, manifest, on_page=None, on_sentence=None,
+                              shared=None, resume=False):
+    """
+    Write the transcript of one deck, skipping it if no page changed since the last run.
+    on_page, on_sentence and shared are passed on to create_brainrot_lecture_async, for a
+    skipped deck on_page gets the pages of the existing transcript instead.
+
+    Every explained page is journaled (see journal.py) as soon as it arrives and the
+    transcript replaces the old one only once the deck is done. With resume, pages
+    journaled by an interrupted run, or already in the transcript, aren't requested again.
+    """
+    pdf_name = os.path.splitext(os.path.basename(pdf_path))[0]  # Get filename without extension
+    output_file = os.path.join(transcripts_folder, f"{pdf_name}.{TRANSCRIPT_FORMAT}")
+
+    pages = _lecture_pages(pdf_path)
+    input_hashes = _transcript_input_hashes(pdf_name, pages)
+    deck_hash = hash_text(*input_hashes.values())
+    if manifest.is_up_to_date("transcript", pdf_name, deck_hash, output_file):
+        print(f"Transcript for {pdf_name} is up to date, skipping")
+        if on_page:
+            for page_num, explanation in iter_pages(output_file):
+                await on_page(page_num, explanation)
+        return
+
+    journal = PageJournal("transcript", pdf_name)
+    resumed = {}
+    if resume:
+        resumed = _resumable_pages(pdf_name, pages, input_hashes, journal, manifest, output_file)
+        if resumed:
+            print(f"Resuming {pdf_name}: {len(resumed)} of {len(pages)} pages already explained")
+    elif journal.exists():
+        print(f"Discarding the journal of an interrupted run of {pdf_name} (use --resume to keep it)")
+        journal.discard()
+
+    async def journal_page(page_num, explanation):
+        journal.append(page_num, input_hashes[f"{pdf_name}/page{page_num}"], explanation)
+        if on_page:
+            await on_page(page_num, explanation)
+
+    remaining = [(page_num, page_text) for page_num, page_text in pages if page_num not in resumed]
+    if on_page:
+        for page_num in sorted(resumed):
+            await on_page(page_num, resumed[page_num])
+    new = []
+    try:
+        if remaining:
+            new = await create_brainrot_lecture_async(pdf_path, limiter, remaining, journal_page, on_sentence, shared)
+    finally:
+        journal.close()
+    new = dict(zip((page_num for page_num, _ in remaining), new))
+    explanations = [resumed[page_num] if page_num in resumed else new[page_num] for page_num, _ in pages]
+
+    # Create individual transcript file, numbered with the real PDF pages
+    write_single_transcript(pdf_name, explanations, output_file,
+                            page_numbers=[page_num for page_num, _ in pages])
+    print(f"Created transcript file: {output_file}")
+
+    # Pages that failed are left out so the next run asks for them again
+    failed = False
+    for (key, input_hash), explanation in zip(input_hashes.items(), explanations):
+        if explanation.startswith("Error processing page"):
+            manifest.forget("transcript", key)
+            failed = True
         else:
-            simplified_explanations.append(f"Error processing page {page_num}")
-    
-    return simplified_explanations
+            manifest.record("transcript", key, input_hash)
+    if failed:
+        manifest.forget("transcript", pdf_name)
+    else:
+        manifest.record("transcript", pdf_name, deck_hash)
+    manifest.save()
+    # Everything in the journal is now in the transcript and the manifest
+    journal.discard()
 
-def process_all_pdfs_brainrot(pdf_folder):
-    """Process all PDFs in the folder for brainrot lectures"""
+def process_all_pdfs_brainrot(pdf_folder, max_concurrency=MAX_CONCURRENT_REQUESTS, resume=False):
+    """
+    Process all PDFs in the folder for brainrot lectures, decks and pages concurrently.
+    resume picks every deck up at the pages an interrupted run didn't finish.
+    """
     # Create Transcripts folder if it doesn't exist
     transcripts_folder = "Transcripts"
     if not os.path.exists(transcripts_folder):
         os.makedirs(transcripts_folder)
 
-    for pdf in os.listdir(pdf_folder):
-        if pdf.lower().endswith('.pdf'):
-            pdf_path = os.path.join(pdf_folder, pdf)
-            pdf_name = os.path.splitext(pdf)[0]  # Get filename without extension
-            
-            print(f"\nProcessing {pdf}...")
-            explanations = create_brainrot_lecture(pdf_path)
-            
-            # Create individual transcript file
-            output_file = os.path.join(transcripts_folder, f"{pdf_name}.txt")
-            write_single_transcript(pdf_name, explanations, output_file)
-            print(f"Created transcript file: {output_file}")
-
-def write_single_transcript(pdf_name, explanations, output_file):
-    """Write explanations for a single PDF to its own file"""
-    with open(output_file, 'w', encoding='utf-8') as file:
+    pdf_paths = list_decks(pdf_folder)
+
+    manifest = BuildManifest()
+    shared = SharedExplanations.build(pdf_paths, transcripts_folder, manifest) if DEDUP else None
+
+    async def run_all(limiter):
+        await asyncio.gather(*(brainrot_deck_async(pdf_path, transcripts_folder, limiter, manifest, shared=shared,
+                                                   resume=resume)
+                               for pdf_path in pdf_paths))
+
+    asyncio.run(run_with_limit(run_all, max_concurrency))
+    print(f"AI response {response_cache.stats()}")
+    if shared:
+        print(f"Explanations {shared.stats()}")
+    print(f"API {scheduler.stats()}")
+
+def write_single_transcript(pdf_name, explanations, output_file, page_numbers=None):
+    """Write explanations for a single PDF to its own file.
+
+    page_numbers gives the PDF page of each explanation, they are numbered 1, 2, 3... if omitted.
+    A .jsonl output_file gets the structured format from transcript.py, anything else the .txt format.
+    """
+    if page_numbers is None:
+        page_numbers = range(1, len(explanations) + 1)
+    # Pages whose request failed after every retry aren't narrated, the next run asks again
+    pages = [(page_num, explanation) for page_num, explanation in zip(page_numbers, explanations)
+             if not explanation.startswith("Error processing page")]
+
+    # Written next to the old transcript and swapped in at the end, so a crash never leaves half a file
+    if output_file.endswith('.jsonl'):
+        with TranscriptWriter(output_file, atomic=True) as writer:
+            for page_num, explanation in pages:
+                if explanation != "Skipped for testing":  # Only write non-skipped pages
+                    writer.append(page_num, explanation)
+        return
+
+    temp_file = f"{output_file}.tmp"
+    with open(temp_file, 'w', encoding='utf-8') as file:
         #file.write(f"BRAINROT LECTURE: {pdf_name}\n")
         #file.write(f"{'='*50}\n\n")
         
-        for page_num, explanation in enumerate(explanations, 1):
+        for page_num, explanation in pages:
             if explanation != "Skipped for testing":  # Only write non-skipped pages
                 file.write(f"\nPAGE {page_num}:\n")
                 file.write(f"{'-'*20}\n")
                 file.write(f"{explanation}\n")
                 file.write(f"{'-'*20}\n")
+    os.replace(temp_file, output_file)
 
 def extract_from_multiple_pdf(pdf_folder):
     pdf_dict = {}
@@ -106,6 +737,20 @@ def extract_from_multiple_pdf(pdf_folder):
             pdf_dict[pdf_name] = extract_text_from_pdf(pdf_path)
     return pdf_dict
 
+def extract_pages_from_multiple_pptx(pptx_folder):
+    """{deck name: page texts} read straight from the presentations, each deck a lazy generator"""
+    return {os.path.splitext(pptx)[0]: (text for _, text in iter_slides(os.path.join(pptx_folder, pptx)))
+            for pptx in os.listdir(pptx_folder) if pptx.lower().endswith('.pptx')}
+
+def extract_pages_from_multiple_pdf(pdf_folder):
+    pdf_dict = {}
+    for pdf in os.listdir(pdf_folder):
+        if pdf.lower().endswith('.pdf'):
+            pdf_path = os.path.join(pdf_folder, pdf)
+            pdf_name = os.path.splitext(pdf)[0]
+            pdf_dict[pdf_name] = extract_text_by_page(pdf_path)
+    return pdf_dict
+
 term_def_generic_prompt = "I'm going to provide you with the content of a PDF document. Please analyze this content and create term-definition pairs that could be used for studying. Follow these guidelines: 1. Separate each term and its definition with an @ symbol. 2. Separate each pair with a \\ symbol. 3. If a term has multiple examples or sub-components, create a separate pair for the main term and another for its examples. 4. For the examples pair, use the format 'Term Examples@Example 1, Example 2, Example 3'. 5. Create individual pairs for each example or sub-component with its own definition. 6. Ensure that you capture all relevant information from the PDF, including main concepts, sub-concepts, examples, and explanations. 7. Keep the definitions concise but informative."
 
 def key_definition_pairs(pdf_dict):
@@ -125,18 +770,144 @@ def key_definition_pairs(pdf_dict):
     
     return term_def_pairs
 
+# Chunked mode splits each deck along page boundaries into prompts of at most
+# FLASHCARD_CHUNK_TOKENS input tokens and extracts terms from all chunks concurrently.
+# FLASHCARD_MODE=single sends each whole deck in one prompt instead.
+FLASHCARD_MODE = os.getenv("FLASHCARD_MODE", "chunked")
+FLASHCARD_CHUNK_TOKENS = int(os.getenv("FLASHCARD_CHUNK_TOKENS", "2000"))
+
+def estimate_tokens(text):
+    """Rough token count for English text (about 4 characters per token)"""
+    return len(text) // 4 + 1
+
+def chunk_pages(page_texts, max_tokens):
+    """
+    Group consecutive pages into chunks of at most max_tokens estimated tokens.
+    Pages are only split when a single page is larger than the budget, then along lines.
+    """
+    return list(iter_chunks(page_texts, max_tokens))
+
+def iter_chunks(page_texts, max_tokens):
+    """chunk_pages as a generator, each chunk is yielded as soon as its pages have been read"""
+    current = []
+    current_tokens = 0
+
+    def pieces(text):
+        if estimate_tokens(text) <= max_tokens:
+            yield text
+            return
+        piece = ""
+        max_chars = max(1, (max_tokens - 1) * 4)
+        for line in text.splitlines(keepends=True):
+            # A single line longer than the budget gets cut into fixed-size slices
+            for start in range(0, len(line), max_chars):
+                part = line[start:start + max_chars]
+                if piece and estimate_tokens(piece + part) > max_tokens:
+                    yield piece
+                    piece = ""
+                piece += part
+        if piece:
+            yield piece
+
+    for page_text in page_texts:
+        for piece in pieces(page_text):
+            piece_tokens = estimate_tokens(piece)
+            if current and current_tokens + piece_tokens > max_tokens:
+                yield "\n".join(current)
+                current = []
+                current_tokens = 0
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        yield "\n".join(current)
+
+def merge_term_pairs(pair_lists):
+    """
+    Merge pair lists from several chunks, keeping the first occurrence of each term.
+    Terms are compared case-insensitively with whitespace collapsed.
+    """
+    merged = {}
+    for pairs in pair_lists:
+        for term, definition in pairs:
+            key = normalize_term(term)
+            if key not in merged:
+                merged[key] = (term, definition)
+    return list(merged.values())
+
+async def _key_definition_pairs_deck(pdf_lecture, page_texts, limiter, max_chunk_tokens):
+    # page_texts may be a lazy generator, each chunk's request starts as soon as the chunk is complete
+    requests_in_flight = []
+    with metrics.label_context(deck=pdf_lecture):
+        for chunk in iter_chunks(page_texts, max_chunk_tokens):
+            requests_in_flight.append(asyncio.ensure_future(
+                query_async(f"{term_def_generic_prompt} {chunk}", limiter)))
+            await asyncio.sleep(0)  # Let the request start before reading more pages
+    print(f"Extracting terms from {pdf_lecture} in {len(requests_in_flight)} chunks...")
+    responses = await asyncio.gather(*requests_in_flight)
+
+    pair_lists = []
+    for chunk_num, output in enumerate(responses, 1):
+        if 'choices' in output and len(output['choices']) > 0:
+            pair_lists.append(parse_term_pairs(output['choices'][0]['message']['content']))
+        else:
+            print(f"Unexpected API response structure for {pdf_lecture} chunk {chunk_num}: {output}")
+
+    if not pair_lists:
+        return "Error: Unable to generate term-definition pairs"
+    return format_term_pairs(merge_term_pairs(pair_lists))
+
+def key_definition_pairs_chunked(pdf_pages_dict, max_chunk_tokens=FLASHCARD_CHUNK_TOKENS,
+                                 max_concurrency=MAX_CONCURRENT_REQUESTS):
+    """
+    Map-reduce version of key_definition_pairs. Takes {deck name: [page texts]}, extracts
+    terms from page-aligned chunks of every deck concurrently and merges the pairs per deck.
+    """
+    names = list(pdf_pages_dict)
+
+    async def run_all(limiter):
+        return await asyncio.gather(*(_key_definition_pairs_deck(name, pdf_pages_dict[name], limiter,
+                                                                 max_chunk_tokens)
+                                      for name in names))
+
+    results = asyncio.run(run_with_limit(run_all, max_concurrency))
+    return dict(zip(names, results))
+
 def write_dict_to_file(dictionary, filename):
     with open(filename, 'w', encoding='utf-8') as file:
         for key, value in dictionary.items():
             file.write(f"{key}: {value}\n\n\n")
 
-def main():
-    pdf_folder = "PDF"
+def create_flashcards(pdf_folder="PDF"):
+    """Extract term/definition pairs from every PDF into pairs.txt and the flashcard store"""
     set_title = "Auto-generated Lecture Flashcards"
     
-    lecture_text = extract_from_multiple_pdf(pdf_folder)
-    term_definition_pairs = key_definition_pairs(lecture_text)
+    if FLASHCARD_MODE == "single":
+        if TEXT_SOURCE == "pptx":
+            lecture_text = {name: "\n".join(pages)
+                            for name, pages in extract_pages_from_multiple_pptx(PPTX_FOLDER).items()}
+        else:
+            lecture_text = extract_from_multiple_pdf(pdf_folder)
+        term_definition_pairs = key_definition_pairs(lecture_text)
+    else:
+        if TEXT_SOURCE == "pptx":
+            lecture_pages = extract_pages_from_multiple_pptx(PPTX_FOLDER)
+        else:
+            lecture_pages = extract_pages_from_multiple_pdf(pdf_folder)
+        term_definition_pairs = key_definition_pairs_chunked(lecture_pages)
     write_dict_to_file(term_definition_pairs, "pairs.txt")
+    print(f"AI response {response_cache.stats()}")
+    print(f"API {scheduler.stats()}")
+
+    # Also keep the cards in the searchable store, with near-duplicate terms across decks collapsed
+    with FlashcardStore() as store:
+        card_count = store.import_pairs_dict(term_definition_pairs)
+        duplicates = store.collapse_near_duplicates()
+    print(f"Stored {card_count} flashcards in flashcards.db ({duplicates} near-duplicates collapsed)")
+
+def main():
+    create_flashcards()
+    metrics.print_summary()
+    metrics.write_reports()
 
 if __name__ == "__main__":
     main()
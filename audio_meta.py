@@ -0,0 +1,154 @@
+"""
+Audio file helpers shared by the TTS and video stages.
+
+Every page MP3 gets a sidecar <name>.mp3.json with its duration, sample rate
+and channel count, so the video stage knows the clip length without decoding
+the audio. A sidecar whose size/mtime no longer match the audio file is ignored.
+"""
+import json
+import os
+import re
+import shutil
+import subprocess
+import wave
+
+
+def metadata_path(audio_path):
+    return f"{audio_path}.json"
+
+
+def _stamp(audio_path):
+    stat = os.stat(audio_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def is_wav(audio_path):
+    # pyttsx3 drivers write WAV data whatever the file extension
+    with open(audio_path, 'rb') as f:
+        return f.read(4) == b'RIFF'
+
+
+def probe_audio(audio_path):
+    """
+    Return {"duration", "sample_rate", "channels"} of an audio file from its header
+    (the wave module for WAV data, ffmpeg's stream info otherwise), or None.
+    """
+    if is_wav(audio_path):
+        with wave.open(audio_path, 'rb') as f:
+            return {"duration": f.getnframes() / f.getframerate(),
+                    "sample_rate": f.getframerate(), "channels": f.getnchannels()}
+
+    from video import find_ffmpeg
+    ffmpeg = find_ffmpeg()
+    if not ffmpeg:
+        return None
+    # Without an output file ffmpeg only reads the header and exits with an error
+    info = subprocess.run([ffmpeg, '-hide_banner', '-i', audio_path], capture_output=True, text=True,
+                          stdin=subprocess.DEVNULL).stderr
+    duration = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', info)
+    stream = re.search(r'Audio: .*?(\d+) Hz, (mono|stereo|\d+ channels)', info)
+    if not duration:
+        return None
+    hours, minutes, seconds = duration.groups()
+    metadata = {"duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+                "sample_rate": None, "channels": None}
+    if stream:
+        layout = stream.group(2)
+        metadata["sample_rate"] = int(stream.group(1))
+        metadata["channels"] = {"mono": 1, "stereo": 2}.get(layout) or int(layout.split()[0])
+    return metadata
+
+
+def write_audio_metadata(audio_path, metadata=None):
+    """Write the sidecar for audio_path, probing the file if metadata isn't given"""
+    metadata = metadata or probe_audio(audio_path)
+    if metadata is None:
+        return None
+    record = {**metadata, **_stamp(audio_path)}
+    temp_path = f"{metadata_path(audio_path)}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(record, f)
+    os.replace(temp_path, metadata_path(audio_path))
+    return record
+
+
+def read_audio_metadata(audio_path):
+    """The sidecar record of audio_path, or None if it is missing or out of date"""
+    try:
+        with open(metadata_path(audio_path), 'r', encoding='utf-8') as f:
+            record = json.load(f)
+        if {key: record.get(key) for key in ("size", "mtime_ns")} != _stamp(audio_path):
+            return None
+        return record
+    except (OSError, ValueError):
+        return None
+
+
+def audio_complete(audio_path):
+    """True if audio_path exists and has an up to date sidecar, which is only written once the audio is complete"""
+    return os.path.exists(audio_path) and read_audio_metadata(audio_path) is not None
+
+
+def copy_audio(source_path, audio_path):
+    """Copy an audio file and give the copy its own sidecar"""
+    metadata = read_audio_metadata(source_path)
+    remove_audio(audio_path)
+    shutil.copyfile(source_path, audio_path)
+    if metadata:
+        metadata = {key: value for key, value in metadata.items() if key not in ("size", "mtime_ns")}
+    return write_audio_metadata(audio_path, metadata)
+
+
+def remove_audio(audio_path):
+    """Delete an audio file and its sidecar if they exist"""
+    for path in (audio_path, metadata_path(audio_path)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def concat_audio(part_paths, output_path):
+    """
+    Join audio parts in order into output_path and return its metadata.
+    With ffmpeg the result is encoded as MP3, otherwise WAV parts are joined
+    with the wave module (like a single pyttsx3 utterance, WAV data in the .mp3).
+    """
+    parts = [probe_audio(path) for path in part_paths]
+    if any(part is None for part in parts):
+        raise RuntimeError("could not read the synthesized audio parts")
+    metadata = {"duration": sum(part["duration"] for part in parts),
+                "sample_rate": parts[0]["sample_rate"], "channels": parts[0]["channels"]}
+
+    if len(part_paths) == 1:
+        os.replace(part_paths[0], output_path)
+        return metadata
+
+    from video import find_ffmpeg
+    ffmpeg = find_ffmpeg()
+    if ffmpeg:
+        list_path = f"{output_path}.parts.txt"
+        with open(list_path, 'w', encoding='utf-8') as f:
+            for path in part_paths:
+                escaped = os.path.abspath(path).replace("'", "'\\''")
+                f.write(f"file '{escaped}'\n")
+        try:
+            result = subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                     '-i', list_path, '-c:a', 'libmp3lame', '-q:a', '4', '-f', 'mp3', output_path],
+                                    capture_output=True, text=True, stdin=subprocess.DEVNULL)
+        finally:
+            os.remove(list_path)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+        return metadata
+
+    if not all(is_wav(path) for path in part_paths):
+        raise RuntimeError("joining non-WAV audio parts needs ffmpeg")
+    with wave.open(part_paths[0], 'rb') as first:
+        params = first.getparams()
+    with wave.open(output_path, 'wb') as out:
+        out.setparams(params)
+        for path in part_paths:
+            with wave.open(path, 'rb') as part:
+                if part.getparams()[:3] != params[:3]:
+                    raise RuntimeError("audio parts have different formats")
+                out.writeframes(part.readframes(part.getnframes()))
+    return metadata
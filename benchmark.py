@@ -0,0 +1,496 @@
+"""
+End-to-end throughput benchmark.
+
+Generates synthetic PDFs, starts a local stand-in for the chat completions API
+and times each pipeline stage (text extraction, LLM, TTS, page rendering and
+video encoding). Results are written as JSON so runs can be compared:
+
+    python benchmark.py --decks 4 --pages 30 --latency 0.2 --error-rate 0.05 -o bench.json
+"""
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_mb():
+    """
+    Peak resident set size of this process and its finished children over their whole
+    lifetime so far, in MB. It never goes down, so a stage's own peak only shows as growth.
+    """
+    if resource is None:
+        return None
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(max(self_rss, child_rss) / scale, 1)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class StageTimer:
+    """Collects per-item latencies for one stage and summarises them"""
+
+    def __init__(self, name):
+        self.name = name
+        self.latencies = []
+        self.errors = 0
+        self.skipped = None
+        self._lock = threading.Lock()
+        self._start = None
+        self._elapsed = 0.0
+        self._rss_before = None
+        self._rss_after = None
+
+    def __enter__(self):
+        self._rss_before = peak_rss_mb()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._elapsed = time.perf_counter() - self._start
+        self._rss_after = peak_rss_mb()
+
+    def time_item(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self.latencies.append(time.perf_counter() - start)
+
+    def result(self):
+        items = len(self.latencies)
+        return {
+            "stage": self.name,
+            "skipped": self.skipped,
+            "items": items,
+            "errors": self.errors,
+            "seconds": round(self._elapsed, 3),
+            "pages_per_sec": round(items / self._elapsed, 2) if self._elapsed and items else None,
+            "p50_ms": round(percentile(self.latencies, 50) * 1000, 1) if items else None,
+            "p95_ms": round(percentile(self.latencies, 95) * 1000, 1) if items else None,
+            # Peak of the whole benchmark process up to the end of this stage, and how much this stage raised it
+            "process_peak_rss_mb": self._rss_after,
+            "peak_rss_growth_mb": (round(self._rss_after - self._rss_before, 1)
+                                   if self._rss_after is not None and self._rss_before is not None else None),
+        }
+
+
+class FakeLLMServer:
+    """
+    Local stand-in for the chat completions endpoint.
+
+    latency: seconds to wait before answering. A streamed answer ("stream": true) starts
+             after a fifth of it and spreads the rest over its chunks
+    error_rate: fraction of requests answered with HTTP 500
+    rate_limit: requests per second allowed before answering 429 (0 = unlimited)
+    """
+
+    def __init__(self, latency=0.1, error_rate=0.0, rate_limit=0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _admit(self):
+        """Returns (status, retry_after) for the next request"""
+        with self._lock:
+            self.requests += 1
+            if self.rate_limit:
+                now = time.monotonic()
+                if now - self._window_start >= 1.0:
+                    self._window_start = now
+                    self._window_count = 0
+                self._window_count += 1
+                if self._window_count > self.rate_limit:
+                    return 429, max(0.0, 1.0 - (now - self._window_start))
+            if self.error_rate and self.random.random() < self.error_rate:
+                return 500, None
+        return 200, None
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real API
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                request = json.loads(body or b'{}')
+                status, retry_after = fake._admit()
+                streamed = status == 200 and request.get("stream")
+                time.sleep(fake.latency * (0.2 if streamed else 1))
+
+                headers = {
+                    "x-ratelimit-limit-requests": str(fake.rate_limit * 60 or 10000),
+                    "x-ratelimit-remaining-requests": "1000",
+                }
+                if status == 200:
+                    prompt = request.get("messages", [{}])[-1].get("content", "")
+                    # Answer packed multi-page prompts with one section per page, like the real model
+                    page_markers = re.findall(r'=== PAGE \d+ ===', prompt)
+                    words = prompt.split()
+                    answer = "Key idea: " + " ".join(words[-40:]) + ". Remember it like a recipe."
+                    if page_markers:
+                        content = "\n\n".join(f"{marker}\n{answer}" for marker in page_markers)
+                    else:
+                        content = answer
+                    payload = {
+                        "id": f"fake-{fake.requests}",
+                        "object": "chat.completion",
+                        "choices": [{"index": 0, "finish_reason": "stop",
+                                     "message": {"role": "assistant", "content": content}}],
+                        "usage": {"prompt_tokens": len(prompt) // 4,
+                                  "completion_tokens": len(content) // 4,
+                                  "total_tokens": (len(prompt) + len(content)) // 4},
+                    }
+                elif status == 429:
+                    headers["retry-after"] = f"{retry_after:.2f}"
+                    payload = {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}}
+                else:
+                    payload = {"error": {"message": "Internal error", "type": "server_error"}}
+
+                if streamed:
+                    self._send_stream(payload, headers, include_usage=bool(request.get("stream_options")))
+                    return
+
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload, headers, include_usage):
+                """Send a completion as server-sent events, a few words per event"""
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+
+                words = re.split(r'(?<=\s)', payload["choices"][0]["message"]["content"])
+                pieces = ["".join(words[index:index + 4]) for index in range(0, len(words), 4)]
+                events = [{"id": payload["id"], "object": "chat.completion.chunk",
+                           "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                          for piece in pieces]
+                events.append({"id": payload["id"], "object": "chat.completion.chunk",
+                               "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+                if include_usage:
+                    events.append({"id": payload["id"], "object": "chat.completion.chunk",
+                                   "choices": [], "usage": payload["usage"]})
+                for event in events:
+                    time.sleep(fake.latency * 0.8 / len(events))
+                    self._write_chunk(f"data: {json.dumps(event)}\n\n")
+                self._write_chunk("data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+LOREM = ("process system data model network memory function structure analysis method theory "
+         "cell energy protein market cost demand supply variable equation proof example").split()
+
+
+def generate_pdf(path, pages, words_per_page=60, seed=0):
+    """Write a synthetic lecture deck with a title and bullet points on every page"""
+    import fitz
+
+    rng = random.Random(seed)
+    doc = fitz.open()
+    for page_number in range(1, pages + 1):
+        page = doc.new_page(width=960, height=540)  # 16:9 slide
+        page.insert_text((40, 60), f"Slide {page_number}: {rng.choice(LOREM).title()} Basics", fontsize=28)
+        y = 110
+        for _ in range(max(1, words_per_page // 10)):
+            line = " ".join(rng.choice(LOREM) for _ in range(10))
+            page.insert_text((60, y), f"- {line}", fontsize=16)
+            y += 28
+        page.insert_text((40, 520), "COURSE 101 - Copyright University", fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def write_silent_wav(path, seconds=2.0, rate=22050):
+    with wave.open(path, 'wb') as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b'\0\0' * int(seconds * rate))
+
+
+def bench_extraction(pdf_paths, index_dir):
+    from text_index import build_text_index
+
+    timer = StageTimer("extraction")
+    indexes = {}
+    with timer:
+        for pdf_path in pdf_paths:
+            indexes[pdf_path] = timer.time_item(build_text_index, pdf_path, index_dir)
+    # Report per page rather than per deck
+    pages = sum(len(index) for index in indexes.values())
+    result = timer.result()
+    result["items"] = pages
+    result["pages_per_sec"] = round(pages / result["seconds"], 2) if result["seconds"] else None
+    return result, indexes
+
+
+def bench_llm(indexes, concurrency):
+    import ai
+    from scheduler import RequestScheduler
+
+    timer = StageTimer("llm")
+    original_query = ai.query
+
+    def timed_query(*args, **kwargs):
+        response = timer.time_item(original_query, *args, **kwargs)
+        if 'choices' not in response:
+            with timer._lock:
+                timer.errors += 1
+        return response
+
+    ai.query = timed_query
+    # A fresh scheduler per run, sized like the limiter, so limits learned earlier don't carry over
+    original_scheduler = ai.scheduler
+    ai.scheduler = RequestScheduler(concurrency)
+    try:
+        async def run_all(limiter):
+            return await asyncio.gather(*(ai.create_brainrot_lecture_async(pdf_path, limiter, index.non_empty())
+                                          for pdf_path, index in indexes.items()))
+        with timer:
+            explanations = asyncio.run(ai.run_with_limit(run_all, concurrency))
+    finally:
+        ai.query = original_query
+        scheduler_stats = ai.scheduler.stats()
+        ai.scheduler = original_scheduler
+
+    # Latency percentiles are per request, throughput is per page (packed requests cover several)
+    result = timer.result()
+    pages = sum(len(deck) for deck in explanations)
+    result["requests"] = result["items"]
+    result["items"] = pages
+    result["pages_per_sec"] = round(pages / result["seconds"], 2) if result["seconds"] else None
+    result["scheduler"] = scheduler_stats
+    return result, explanations
+
+
+def bench_tts(texts, work_dir):
+    timer = StageTimer("tts")
+    try:
+        from voice import Pyttsx3Synthesizer
+        synthesizer = Pyttsx3Synthesizer()
+        with timer:
+            for index, text in enumerate(texts):
+                timer.time_item(synthesizer.synthesize, text, os.path.join(work_dir, f"tts_{index}.mp3"))
+    except Exception as e:
+        timer.skipped = f"{type(e).__name__}: {e}"
+    return timer.result()
+
+
+def bench_rendering(pdf_paths, cache_dir):
+    from render import PageRenderer
+
+    timer = StageTimer("rendering")
+    images = []
+    with timer:
+        for pdf_path in pdf_paths:
+            with PageRenderer(pdf_path, cache_dir=cache_dir) as renderer:
+                for page_number in range(len(renderer.doc)):
+                    images.append(timer.time_item(renderer.render, page_number))
+    return timer.result(), images
+
+
+def bench_encoding(images, work_dir, limit, encoder):
+    from video import create_video_from_image_and_audio
+
+    timer = StageTimer(f"encoding_{encoder}")
+    audio_path = os.path.join(work_dir, "silence.wav")
+    write_silent_wav(audio_path)
+    with timer:
+        for index, image_path in enumerate(images[:limit]):
+            ok = timer.time_item(create_video_from_image_and_audio, image_path, audio_path,
+                                 os.path.join(work_dir, f"clip_{index}.mp4"), encoder)
+            if not ok:
+                timer.errors += 1
+    return timer.result()
+
+
+def run_benchmark(decks=2, pages=20, words_per_page=60, latency=0.1, error_rate=0.0, rate_limit=0,
+                  concurrency=8, encode_pages=5, encoders=("ffmpeg",), stages=None, keep=False):
+    import text_index
+
+    stages = set(stages or ["extraction", "llm", "tts", "rendering", "encoding"])
+    work_dir = tempfile.mkdtemp(prefix="smartstudy-bench-")
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {"decks": decks, "pages": pages, "words_per_page": words_per_page, "latency": latency,
+                   "error_rate": error_rate, "rate_limit": rate_limit, "concurrency": concurrency,
+                   "encode_pages": encode_pages},
+        "stages": [],
+    }
+    server = None
+    # The LLM stage loads the decks' indexes through ai, keep them out of the project's .cache
+    original_index_dir = text_index.TEXT_INDEX_DIR
+    text_index.TEXT_INDEX_DIR = os.path.join(work_dir, "text_index")
+    try:
+        pdf_paths = []
+        for deck in range(decks):
+            pdf_path = os.path.join(work_dir, f"deck{deck + 1}.pdf")
+            generate_pdf(pdf_path, pages, words_per_page, seed=deck)
+            pdf_paths.append(pdf_path)
+
+        stage_result, indexes = bench_extraction(pdf_paths, text_index.TEXT_INDEX_DIR)
+        if "extraction" in stages:
+            results["stages"].append(stage_result)
+
+        explanations = [text for index in indexes.values() for _, text in index.non_empty()]
+        if "llm" in stages:
+            import ai
+            server = FakeLLMServer(latency, error_rate, rate_limit).start()
+            ai.API_URL = server.url
+            ai.response_cache.enabled = False
+            stage_result, deck_explanations = bench_llm(indexes, concurrency)
+            stage_result["server_requests"] = server.requests
+            results["stages"].append(stage_result)
+            explanations = [text for deck in deck_explanations for text in deck]
+
+        if "tts" in stages:
+            results["stages"].append(bench_tts(explanations[:encode_pages], work_dir))
+
+        images = []
+        if "rendering" in stages or "encoding" in stages:
+            stage_result, images = bench_rendering(pdf_paths, os.path.join(work_dir, "rendered"))
+            if "rendering" in stages:
+                results["stages"].append(stage_result)
+
+        if "encoding" in stages:
+            for encoder in encoders:
+                results["stages"].append(bench_encoding(images, work_dir, encode_pages, encoder))
+    finally:
+        text_index.TEXT_INDEX_DIR = original_index_dir
+        if server:
+            server.stop()
+        if keep:
+            print(f"Benchmark files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def print_results(results):
+    print(f"\n{'stage':<18}{'items':>7}{'errors':>8}{'sec':>9}{'pages/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'peak MB':>9}{'+MB':>7}")
+    for stage in results["stages"]:
+        if stage["skipped"]:
+            print(f"{stage['stage']:<18} skipped ({stage['skipped']})")
+            continue
+        values = [stage["items"], stage["errors"], stage["seconds"], stage["pages_per_sec"],
+                  stage["p50_ms"], stage["p95_ms"], stage["process_peak_rss_mb"], stage["peak_rss_growth_mb"]]
+        print(f"{stage['stage']:<18}" + "".join(f"{'-' if v is None else v:>{w}}"
+                                               for v, w in zip(values, (7, 8, 9, 10, 10, 10, 9, 7))))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the PDF -> lecture -> audio -> video pipeline')
+    parser.add_argument('--decks', type=int, default=2, help='Number of synthetic decks (default: 2)')
+    parser.add_argument('--pages', type=int, default=20, help='Pages per deck (default: 20)')
+    parser.add_argument('--words', type=int, default=60, help='Words per page (default: 60)')
+    parser.add_argument('--latency', type=float, default=0.1,
+                      help='Fake API latency in seconds (default: 0.1)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                      help='Fraction of fake API requests that fail with 500 (default: 0)')
+    parser.add_argument('--rate-limit', type=int, default=0,
+                      help='Fake API requests per second before 429s (default: unlimited)')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent API requests (default: 8)')
+    parser.add_argument('--encode-pages', type=int, default=5,
+                      help='Pages to synthesize and encode (default: 5)')
+    parser.add_argument('--encoders', default='ffmpeg',
+                      help='Comma separated video encoders to compare, e.g. ffmpeg,moviepy (default: ffmpeg)')
+    parser.add_argument('--stages', help='Comma separated stages to run (default: all)')
+    parser.add_argument('--output', '-o', help='Write JSON results to this file')
+    parser.add_argument('--keep', action='store_true', help='Keep the generated files')
+
+    args = parser.parse_args()
+
+    results = run_benchmark(
+        decks=args.decks,
+        pages=args.pages,
+        words_per_page=args.words,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        rate_limit=args.rate_limit,
+        concurrency=args.concurrency,
+        encode_pages=args.encode_pages,
+        encoders=args.encoders.split(','),
+        stages=args.stages.split(',') if args.stages else None,
+        keep=args.keep
+    )
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults saved to: {args.output}")
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,133 @@
+"""
+Header, footer and layout noise removed from slide text before it goes into a prompt.
+
+PDF exports put the same course code, lecture title, slide number and
+copyright line on every page, so they end up in every request. Only the first
+and last BOILERPLATE_EDGE_LINES lines of a page can be header or footer, and
+such a line is boilerplate when it repeats in the same place (top or bottom)
+on at least BOILERPLATE_MIN_SHARE of a deck's pages, either
+- word for word, ignoring case and spacing, or
+- with a number that counts up with the page: "Slide 3 of 40" on page 3 and
+  "Slide 17 of 40" on page 17 are the same footer, as are bare page numbers.
+A line of only numbers never repeats word for word, and a year, a table value
+or "Topic 3" on a few pages never counts up with the page, so they are kept:
+
+    pages, stats = strip_boilerplate(index.non_empty())
+    stats  # {"pages": 40, "boilerplate": ["bio 101 - fall 2024", "slide # of #"], "lines_removed": 80, ...}
+
+Lines in the body of a page are never removed, however often they repeat.
+Decks with fewer than BOILERPLATE_MIN_PAGES pages are only cleaned up, there
+is too little to tell boilerplate from a repeated heading. clean_text joins
+words hyphenated across line breaks and collapses runs of spaces and blank lines.
+"""
+import math
+import os
+import re
+from collections import Counter
+
+# BOILERPLATE_STRIP=0 sends page text as it was extracted
+BOILERPLATE_STRIP = os.getenv("BOILERPLATE_STRIP", "1") != "0"
+# Share of a deck's pages a line has to appear on to be stripped
+BOILERPLATE_MIN_SHARE = float(os.getenv("BOILERPLATE_MIN_SHARE", "0.6"))
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "5"))
+# Lines at the top and at the bottom of a page that can be header or footer
+BOILERPLATE_EDGE_LINES = int(os.getenv("BOILERPLATE_EDGE_LINES", "2"))
+
+# "exam-\nple" -> "example", only when the next line goes on in lowercase
+HYPHENATED_BREAK = re.compile(r'(\w)-\n[ \t]*([a-z])')
+NUMBER = re.compile(r'\d+')
+
+
+def normalize_line(line):
+    """The form lines are compared in: lowercase with single spaces"""
+    return " ".join(line.lower().split())
+
+
+def has_words(line):
+    return re.search(r'[^\W\d_]', line) is not None
+
+
+def page_counters(line, page_num):
+    """
+    (line with numbers as #, index of the number, number - page_num) for every number
+    in a line, the same on every page for a slide or page number that counts up with the page
+    """
+    line = normalize_line(line)
+    folded = NUMBER.sub('#', line)
+    return [(folded, index, int(number) - page_num) for index, number in enumerate(NUMBER.findall(line))]
+
+
+def edge_lines(text, count=BOILERPLATE_EDGE_LINES):
+    """(line index, "top" or "bottom", line) of the first and last count non-empty lines of a page"""
+    filled = [(index, line) for index, line in enumerate(text.splitlines()) if line.strip()]
+    edges = [(index, "top", line) for index, line in filled[:count]]
+    edges += [(index, "bottom", line) for index, line in filled[count:][-count:]]
+    return edges
+
+
+def is_boilerplate(boilerplate, where, line, page_num):
+    """Whether an edge line of page page_num matches one of find_boilerplate's keys"""
+    if (where, normalize_line(line)) in boilerplate:
+        return True
+    return any((where, *counter) in boilerplate for counter in page_counters(line, page_num))
+
+
+def clean_text(text):
+    """Join hyphenated line breaks, drop soft hyphens and collapse spaces and blank lines"""
+    text = text.replace('\u00ad', '')
+    text = HYPHENATED_BREAK.sub(r'\1\2', text)
+    # Leading spaces stay, they carry the outline level of PPTX bullets
+    lines = [re.sub(r'(?<=\S)[ \t]+', ' ', line).rstrip() for line in text.splitlines()]
+    return re.sub(r'\n{3,}', '\n\n', "\n".join(lines)).strip()
+
+
+def find_boilerplate(pages, min_share=BOILERPLATE_MIN_SHARE, min_pages=BOILERPLATE_MIN_PAGES,
+                     edge_lines_per_page=BOILERPLATE_EDGE_LINES):
+    """
+    Header and footer lines of (page_num, text) pages, empty for decks under min_pages pages.
+    Keys are (where, line) for lines with words repeated word for word and
+    (where, line with numbers as #, index of the number, offset) for slide and page numbers.
+    """
+    pages = list(pages)
+    if len(pages) < min_pages:
+        return set()
+    counts = Counter()
+    for page_num, text in pages:
+        keys = set()
+        for _, where, line in edge_lines(text, edge_lines_per_page):
+            if has_words(line):
+                keys.add((where, normalize_line(line)))
+            keys.update((where, *counter) for counter in page_counters(line, page_num))
+        counts.update(keys)
+    needed = max(2, math.ceil(min_share * len(pages)))
+    return {key for key, count in counts.items() if count >= needed}
+
+
+def strip_boilerplate(pages, min_share=BOILERPLATE_MIN_SHARE, min_pages=BOILERPLATE_MIN_PAGES,
+                      edge_lines_per_page=BOILERPLATE_EDGE_LINES):
+    """
+    Remove a deck's header and footer lines and clean up every page.
+    Takes (page_num, text) pairs and returns (pages, stats). Pages left without text are dropped.
+    """
+    pages = list(pages)
+    boilerplate = find_boilerplate(pages, min_share, min_pages, edge_lines_per_page)
+    cleaned = []
+    lines_removed = 0
+    for page_num, text in pages:
+        lines = text.splitlines()
+        removed = set()
+        for index, where, line in edge_lines(text, edge_lines_per_page):
+            if is_boilerplate(boilerplate, where, line, page_num):
+                removed.add(index)
+        lines_removed += len(removed)
+        text = clean_text("\n".join(line for index, line in enumerate(lines) if index not in removed))
+        if text:
+            cleaned.append((page_num, text))
+    stats = {
+        "pages": len(pages),
+        "boilerplate": sorted({key[1] for key in boilerplate}),
+        "lines_removed": lines_removed,
+        "chars_before": sum(len(text) for _, text in pages),
+        "chars_after": sum(len(text) for _, text in cleaned),
+    }
+    return cleaned, stats
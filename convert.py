@@ -0,0 +1,274 @@
+"""
+PPTX to PDF conversion backends.
+
+Each backend is a pool of worker threads that each own one converter
+instance (a PowerPoint COM application, or a LibreOffice profile) and reuse
+it for every file they are given:
+
+    with get_converter() as converter:
+        for input_path, output_path, error in converter.convert_many(pairs):
+            ...
+
+"powerpoint" drives PowerPoint over COM and needs Windows with Office.
+"libreoffice" runs headless soffice processes, each with its own user
+profile so several conversions can run at once.
+"""
+import abc
+import os
+import queue
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from pathlib import Path
+import metrics
+
+# "powerpoint", "libreoffice", or "auto" for PowerPoint on Windows and LibreOffice elsewhere
+CONVERTER_BACKEND = os.getenv("CONVERTER_BACKEND", "auto")
+# Concurrent LibreOffice conversions, PowerPoint always uses one application
+CONVERT_WORKERS = int(os.getenv("CONVERT_WORKERS", str(os.cpu_count() or 1)))
+# Seconds one soffice conversion may take before it is killed, and how often a failed file is retried
+CONVERT_TIMEOUT = float(os.getenv("CONVERT_TIMEOUT", "300"))
+CONVERT_RETRIES = int(os.getenv("CONVERT_RETRIES", "1"))
+
+
+class ConversionError(Exception):
+    pass
+
+
+class ConverterPool(abc.ABC):
+    """
+    Worker threads that convert files with a per-thread converter instance.
+    A failed conversion is retried with a fresh instance, since the old one may be stuck.
+    """
+
+    def __init__(self, workers=1, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.retries = retries
+        self._tasks = queue.Queue()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, input_path, output_path, custom=False):
+        """Queue one file. The returned future's result is None on success, otherwise the error."""
+        if len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"converter-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        future = Future()
+        self._tasks.put((os.path.abspath(input_path), os.path.abspath(output_path), custom, future))
+        return future
+
+    def convert(self, input_path, output_path, custom=False):
+        return self.submit(input_path, output_path, custom).result()
+
+    def convert_many(self, pairs, custom=False):
+        """Convert (input_path, output_path) pairs, returning (input_path, output_path, error) for each"""
+        futures = [(input_path, output_path, self.submit(input_path, output_path, custom))
+                   for input_path, output_path in pairs]
+        return [(input_path, output_path, future.result()) for input_path, output_path, future in futures]
+
+    def close(self):
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self):
+        self._thread_started()
+        instance = None
+        try:
+            while True:
+                task = self._tasks.get()
+                if task is None:
+                    break
+                input_path, output_path, custom, future = task
+                if not future.set_running_or_notify_cancel():
+                    continue
+                start = time.perf_counter()
+                error = None
+                for attempt in range(self.retries + 1):
+                    try:
+                        if instance is None:
+                            instance = self._open()
+                        self._convert(instance, input_path, output_path, custom)
+                        if not os.path.exists(output_path):
+                            raise ConversionError("no PDF was written")
+                        error = None
+                        break
+                    except Exception as e:
+                        error = str(e) or type(e).__name__
+                        if attempt < self.retries:
+                            print(f"Converting {os.path.basename(input_path)} failed ({error}), retrying")
+                        self._close(instance)
+                        instance = None
+                metrics.observe("pdf_conversion", time.perf_counter() - start, error=error is not None,
+                                deck=Path(input_path).stem)
+                future.set_result(error)
+        finally:
+            if instance is not None:
+                self._close(instance)
+            self._thread_finished()
+
+    # Overridden by the backends
+
+    def _thread_started(self):
+        pass
+
+    def _thread_finished(self):
+        pass
+
+    @abc.abstractmethod
+    def _open(self):
+        """Start a converter instance for the calling worker thread"""
+
+    @abc.abstractmethod
+    def _convert(self, instance, input_path, output_path, custom):
+        """Convert one file with instance, raising on failure"""
+
+    def _close(self, instance):
+        pass
+
+
+class PowerPointConverter(ConverterPool):
+    """
+    Converts with PowerPoint over COM, keeping the application open between files.
+    PowerPoint only runs one instance per session, so there is a single worker,
+    and a conversion that hangs inside PowerPoint can't be timed out.
+    """
+
+    def __init__(self, workers=1, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES):
+        super().__init__(workers=1, timeout=timeout, retries=retries)
+
+    def _thread_started(self):
+        import comtypes
+        comtypes.CoInitialize()
+
+    def _thread_finished(self):
+        import comtypes
+        comtypes.CoUninitialize()
+
+    def _open(self):
+        import comtypes.client
+        powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
+        powerpoint.Visible = 1
+        return powerpoint
+
+    def _convert(self, powerpoint, input_path, output_path, custom):
+        deck = powerpoint.Presentations.Open(input_path)
+        try:
+            if custom:
+                deck.ExportAsFixedFormat(
+                    Path=output_path,
+                    FixedFormatType=2,  # ppFixedFormatTypePDF
+                    Intent=1,  # ppFixedFormatIntentScreen
+                    OutputType=5,  # ppPrintOutputNotesPages
+                    PrintHiddenSlides=True,
+                    IncludeDocProperties=True,
+                    DocStructureTags=True,
+                    BitmapMissingFonts=True,
+                )
+            else:
+                deck.SaveAs(output_path, 32)  # 32 is the format type for PDF
+        finally:
+            deck.Close()
+
+    def _close(self, powerpoint):
+        if powerpoint is None:
+            return
+        try:
+            powerpoint.Quit()
+        except Exception:
+            pass
+
+
+def find_soffice():
+    """Return the LibreOffice soffice executable, or None"""
+    for name in ("soffice", "libreoffice"):
+        path = shutil.which(name)
+        if path:
+            return path
+    for path in (r"C:\Program Files\LibreOffice\program\soffice.exe",
+                 "/Applications/LibreOffice.app/Contents/MacOS/soffice"):
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def _kill_process_tree(process):
+    # soffice is a launcher for soffice.bin, so the whole tree has to go
+    if sys.platform == "win32":
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        os.killpg(process.pid, signal.SIGKILL)
+    process.wait()
+
+
+class LibreOfficeConverter(ConverterPool):
+    """
+    Converts with headless LibreOffice. Every worker has its own user profile
+    (LibreOffice refuses to run twice on one profile) and output folder.
+    """
+
+    # Impress PDF export options for the custom export: notes pages and hidden slides
+    CUSTOM_FILTER = ('pdf:impress_pdf_Export:{'
+                     '"ExportNotesPages":{"type":"boolean","value":"true"},'
+                     '"ExportOnlyNotesPages":{"type":"boolean","value":"true"},'
+                     '"ExportHiddenSlides":{"type":"boolean","value":"true"}}')
+
+    def __init__(self, workers=CONVERT_WORKERS, timeout=CONVERT_TIMEOUT, retries=CONVERT_RETRIES, soffice=None):
+        super().__init__(workers=workers, timeout=timeout, retries=retries)
+        self.soffice = soffice or find_soffice()
+        if not self.soffice:
+            raise ConversionError("LibreOffice (soffice) not found")
+
+    def _open(self):
+        return tempfile.mkdtemp(prefix="soffice-worker-")
+
+    def _convert(self, worker_dir, input_path, output_path, custom):
+        out_dir = os.path.join(worker_dir, "out")
+        os.makedirs(out_dir, exist_ok=True)
+        command = [
+            self.soffice, f"-env:UserInstallation={Path(worker_dir, 'profile').as_uri()}",
+            "--headless", "--invisible", "--norestore", "--nolockcheck", "--nodefault",
+            "--convert-to", self.CUSTOM_FILTER if custom else "pdf",
+            "--outdir", out_dir, input_path,
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+                                   start_new_session=sys.platform != "win32")
+        try:
+            _, stderr = process.communicate(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            _kill_process_tree(process)
+            raise ConversionError(f"timed out after {self.timeout:g}s")
+        converted = os.path.join(out_dir, f"{Path(input_path).stem}.pdf")
+        if process.returncode != 0 or not os.path.exists(converted):
+            raise ConversionError(f"soffice failed: {stderr.strip() or f'exit code {process.returncode}'}")
+        shutil.move(converted, output_path)
+
+    def _close(self, worker_dir):
+        if worker_dir is not None:
+            shutil.rmtree(worker_dir, ignore_errors=True)
+
+
+def get_converter(backend=None, **options):
+    backend = backend or CONVERTER_BACKEND
+    if backend == "auto":
+        backend = "powerpoint" if sys.platform == "win32" else "libreoffice"
+    if backend == "powerpoint":
+        return PowerPointConverter(**options)
+    if backend == "libreoffice":
+        return LibreOfficeConverter(**options)
+    raise ConversionError(f"Unknown converter backend {backend!r}, set CONVERTER_BACKEND to "
+                          "auto, powerpoint or libreoffice")
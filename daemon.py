@@ -0,0 +1,433 @@
+"""
+Warm worker daemon and its command line client.
+
+The daemon imports everything once, keeps the HTTP connection pool, the
+TTS engines, the loaded page text indexes and a pool of video encoder
+processes alive, and runs submitted jobs one after another. Jobs arrive over
+a local socket as one JSON line and the daemon streams the job's output
+back as JSON lines until it finishes:
+
+    python daemon.py serve
+    python daemon.py submit lectures --pdf "PDF/Lecture 1.pdf"
+    python daemon.py submit lectures --resume
+    python daemon.py submit flashcards media
+    python daemon.py status
+    python daemon.py stop
+
+Each project gets its own daemon. It listens on a Unix socket in
+.cache/daemon/ (localhost TCP on DAEMON_PORT where Unix sockets are missing)
+and writes the address and a random token to .cache/daemon/daemon.json, in a
+directory only its user can read. Clients find the daemon through that file,
+so a client only ever talks to the daemon of the project it runs in, and every
+request has to carry the token. A job carries the client's working directory,
+which has to be the daemon's, and its --report/--prometheus/--profile settings.
+"""
+import hmac
+import json
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import sys
+import threading
+import time
+from contextlib import redirect_stdout
+
+DAEMON_DIR = os.path.join(".cache", "daemon")
+DAEMON_HOST = "127.0.0.1"
+# Only used where Unix sockets are missing
+DAEMON_PORT = int(os.getenv("DAEMON_PORT", "8765"))
+
+# Stages a job can ask for, run in this order: flashcards is menu option 3,
+# lectures option 4 (transcripts, audio and videos) and media option 5
+STAGES = ("flashcards", "lectures", "media")
+
+
+class _JobOutput:
+    """File-like object that forwards complete lines of a job's output to its client"""
+
+    def __init__(self, job, console):
+        self.job = job
+        self.console = console
+        self._buffer = ""
+        self._lock = threading.Lock()
+
+    def write(self, text):
+        self.console.write(text)
+        with self._lock:
+            self._buffer += text
+            *lines, self._buffer = self._buffer.split("\n")
+        for line in lines:
+            self.job.send({"type": "progress", "text": line})
+        return len(text)
+
+    def isatty(self):
+        return False
+
+    def flush(self):
+        self.console.flush()
+        with self._lock:
+            line, self._buffer = self._buffer, ""
+        if line:
+            self.job.send({"type": "progress", "text": line})
+
+
+class Job:
+    def __init__(self, job_id, stages, pdf=None, resume=False, report=None, prometheus=None, profile=False):
+        self.job_id = job_id
+        self.stages = stages
+        self.pdf = pdf
+        self.resume = resume
+        # Metrics settings of the client, paths already resolved against its working directory
+        self.report = report
+        self.prometheus = prometheus
+        self.profile = profile
+        self.messages = queue.Queue()
+
+    def send(self, message):
+        self.messages.put({"job": self.job_id, **message})
+
+
+class Worker:
+    """Holds the warm resources and runs jobs on the thread that created it"""
+
+    def __init__(self, workers=None):
+        # Heavy imports happen once here instead of once per job
+        from concurrent.futures import ProcessPoolExecutor
+        import ai
+        import main as app
+        import metrics
+        from video import VIDEO_WORKERS
+        from voice import get_synthesizer, TTS_RATE
+
+        self.ai = ai
+        self.app = app
+        self.metrics = metrics
+        self.workers = workers or VIDEO_WORKERS
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        # Start the encoder processes and the TTS engines now rather than during the first job
+        for future in [self.pool.submit(os.getpid) for _ in range(self.workers)]:
+            future.result()
+        get_synthesizer(rate=TTS_RATE).warm_up()
+
+    def run(self, job):
+        from pipeline import LecturePipeline
+
+        self.metrics.reset()
+        # An empty path turns the report off, None would keep the previous job's setting
+        self.metrics.configure(report_path=job.report or "", prometheus_path=job.prometheus or "",
+                               profile=job.profile)
+        if "flashcards" in job.stages:
+            self.ai.create_flashcards()
+        if "lectures" in job.stages:
+            if job.pdf and os.path.isfile(job.pdf):
+                pipeline = LecturePipeline(os.path.dirname(job.pdf), pdf_paths=[job.pdf], pool=self.pool,
+                                           resume=job.resume)
+            else:
+                pipeline = LecturePipeline(job.pdf or "PDF", pool=self.pool, resume=job.resume)
+            succeeded, failed = pipeline.run()
+            self.app.print_video_summary(succeeded, failed)
+        if "media" in job.stages:
+            self.app.process_all_transcripts(pool=self.pool, resume=job.resume)
+        if self.metrics.report()["stages"]:
+            self.metrics.print_summary()
+            self.metrics.write_reports()
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            self._reply({"type": "error", "error": "invalid request"})
+            return
+
+        if not hmac.compare_digest(str(request.get("token", "")), self.server.token):
+            self._reply({"type": "error", "error": "invalid token"})
+            return
+
+        command = request.get("command", "submit")
+        if command == "status":
+            self._reply({"type": "status", "queued": self.server.jobs.qsize(),
+                         "running": self.server.running, "pid": os.getpid()})
+            return
+        if command == "stop":
+            self.server.jobs.put(None)
+            self._reply({"type": "stopping"})
+            return
+
+        try:
+            job = _make_job(self.server.next_job_id(), request)
+        except ValueError as e:
+            self._reply({"type": "error", "error": str(e)})
+            return
+        job.send({"type": "queued", "position": self.server.jobs.qsize() + int(self.server.running is not None)})
+        self.server.jobs.put(job)
+        # Relay the job's output until it finishes; the job keeps running if the client goes away
+        while True:
+            message = job.messages.get()
+            try:
+                self._reply(message)
+            except OSError:
+                return
+            if message["type"] == "done":
+                return
+
+    def _reply(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode('utf-8'))
+        self.wfile.flush()
+
+
+def _make_job(job_id, request):
+    """
+    Job for a submit request. Raises ValueError if the request is malformed or comes
+    from another working directory, whose relative paths would mean other files here.
+    """
+    stages = request.get("stages")
+    if not isinstance(stages, list) or not all(isinstance(stage, str) for stage in stages):
+        raise ValueError("stages must be a list of names")
+    stages = [stage for stage in STAGES if stage in stages]
+    if not stages:
+        raise ValueError(f"no stages given, choose from {', '.join(STAGES)}")
+
+    cwd = request.get("cwd")
+    if not isinstance(cwd, str) or not os.path.isdir(cwd) or not os.path.samefile(cwd, os.getcwd()):
+        raise ValueError(f"this daemon serves {os.getcwd()}, run the client there or start a daemon in {cwd}")
+
+    def path(key):
+        value = request.get(key)
+        if value is None:
+            return None
+        if not isinstance(value, str):
+            raise ValueError(f"{key} must be a path")
+        return os.path.join(cwd, value) if value else ""
+
+    def flag(key):
+        value = request.get(key, False)
+        if not isinstance(value, bool):
+            raise ValueError(f"{key} must be true or false")
+        return value
+
+    pdf = path("pdf")
+    if pdf and not os.path.exists(pdf):
+        raise ValueError(f"{pdf} does not exist")
+    return Job(job_id, stages, pdf, flag("resume"), path("report"), path("prometheus"), flag("profile"))
+
+
+class _DaemonServer:
+    daemon_threads = True
+
+    def __init__(self, address, token):
+        super().__init__(address, _Handler)
+        self.token = token
+        self.jobs = queue.Queue()
+        self.running = None
+        self._job_ids = iter(range(1, sys.maxsize))
+        self._id_lock = threading.Lock()
+
+    def next_job_id(self):
+        with self._id_lock:
+            return next(self._job_ids)
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class UnixDaemonServer(_DaemonServer, socketserver.ThreadingUnixStreamServer):
+        pass
+else:
+    UnixDaemonServer = None
+
+
+class TCPDaemonServer(_DaemonServer, socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+
+
+def _info_path(daemon_dir):
+    return os.path.join(daemon_dir, "daemon.json")
+
+
+def read_info(daemon_dir=DAEMON_DIR):
+    """{"address", "token", "pid"} of the project's daemon, or None if none was started here"""
+    try:
+        with open(_info_path(daemon_dir), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def open_server(daemon_dir=DAEMON_DIR, port=DAEMON_PORT):
+    """
+    Bind the project's daemon socket and publish its address and a fresh token in daemon_dir,
+    which only the current user can read
+    """
+    os.makedirs(daemon_dir, mode=0o700, exist_ok=True)
+    os.chmod(daemon_dir, 0o700)
+    token = secrets.token_hex(32)
+    if UnixDaemonServer:
+        # Relative, so the path stays under the length limit of socket addresses
+        address = os.path.relpath(os.path.join(daemon_dir, "daemon.sock"))
+        if os.path.exists(address):
+            os.remove(address)
+        server = UnixDaemonServer(address, token)
+        os.chmod(address, 0o600)
+    else:
+        server = TCPDaemonServer((DAEMON_HOST, port), token)
+        address = list(server.server_address)
+    temp_path = f"{_info_path(daemon_dir)}.tmp"
+    with os.fdopen(os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), 'w', encoding='utf-8') as f:
+        json.dump({"address": address, "token": token, "pid": os.getpid()}, f)
+    os.replace(temp_path, _info_path(daemon_dir))
+    return server
+
+
+def close_server(server, daemon_dir=DAEMON_DIR):
+    server.shutdown()
+    server.server_close()
+    info = read_info(daemon_dir)
+    if info and info.get("pid") == os.getpid():
+        os.remove(_info_path(daemon_dir))
+    if isinstance(server.server_address, str) and os.path.exists(server.server_address):
+        os.remove(server.server_address)
+
+
+def serve(daemon_dir=DAEMON_DIR, port=DAEMON_PORT, workers=None):
+    """Run the daemon until a stop command arrives. Jobs run on the calling thread."""
+    if is_running(daemon_dir):
+        print(f"A daemon is already running for {os.getcwd()}")
+        return
+    server = open_server(daemon_dir, port)
+    print("Warming up...")
+    try:
+        worker = Worker(workers)
+    except BaseException:
+        close_server(server, daemon_dir)
+        raise
+    threading.Thread(target=server.serve_forever, name="daemon-socket", daemon=True).start()
+    print(f"Daemon for {os.getcwd()} listening on {server.server_address} (pid {os.getpid()})")
+
+    console = sys.stdout
+    try:
+        while True:
+            job = server.jobs.get()
+            if job is None:
+                break
+            server.running = job.job_id
+            start = time.perf_counter()
+            ok = True
+            with redirect_stdout(_JobOutput(job, console)):
+                print(f"Job {job.job_id}: {', '.join(job.stages)}" + (f" ({job.pdf})" if job.pdf else ""))
+                try:
+                    worker.run(job)
+                except Exception as e:
+                    ok = False
+                    print(f"Job {job.job_id} failed: {e}")
+                sys.stdout.flush()
+            server.running = None
+            job.send({"type": "done", "ok": ok, "seconds": round(time.perf_counter() - start, 3)})
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_server(server, daemon_dir)
+        worker.close()
+    print("Daemon stopped")
+
+
+def _connect(address, timeout=None):
+    if isinstance(address, str):
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.settimeout(timeout)
+        try:
+            conn.connect(address)
+        except OSError:
+            conn.close()
+            raise
+        return conn
+    return socket.create_connection(tuple(address), timeout=timeout)
+
+
+def request(message, daemon_dir=DAEMON_DIR, timeout=None):
+    """Send one request to the project's daemon and yield the messages it streams back"""
+    info = read_info(daemon_dir)
+    if info is None:
+        raise ConnectionRefusedError(f"no daemon was started in {os.getcwd()}")
+    with _connect(info["address"], timeout) as conn:
+        conn.sendall((json.dumps({**message, "token": info["token"]}) + "\n").encode('utf-8'))
+        with conn.makefile('r', encoding='utf-8') as replies:
+            for line in replies:
+                yield json.loads(line)
+
+
+def is_running(daemon_dir=DAEMON_DIR):
+    try:
+        for message in request({"command": "status"}, daemon_dir, timeout=1):
+            return message["type"] == "status"
+    except (OSError, ValueError):
+        return False
+    return False
+
+
+def submit(stages, pdf=None, daemon_dir=DAEMON_DIR, resume=False, report=None, prometheus=None, profile=False):
+    """
+    Submit a job, print its output as it arrives and return True if it succeeded.
+    Paths are sent as absolute paths of this process's working directory.
+    """
+    def absolute(path):
+        return os.path.abspath(path) if path else path
+
+    job = {"command": "submit", "stages": list(stages), "cwd": os.getcwd(), "pdf": absolute(pdf),
+           "resume": resume, "report": absolute(report), "prometheus": absolute(prometheus), "profile": bool(profile)}
+    for message in request(job, daemon_dir):
+        if message["type"] == "progress":
+            print(message["text"], flush=True)
+        elif message["type"] == "queued" and message["position"]:
+            print(f"Queued behind {message['position']} job(s)")
+        elif message["type"] == "error":
+            print(f"Error: {message['error']}")
+            return False
+        elif message["type"] == "done":
+            print(f"Job {message['job']} {'finished' if message['ok'] else 'failed'} in {message['seconds']}s")
+            return message["ok"]
+    print("Connection to the daemon closed before the job finished")
+    return False
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Warm worker daemon for the lecture pipeline')
+    parser.add_argument('--port', type=int, default=DAEMON_PORT,
+                        help=f'Local TCP port where Unix sockets are missing (default: {DAEMON_PORT})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    serve_parser = commands.add_parser('serve', help='Start the daemon in the foreground')
+    serve_parser.add_argument('--workers', type=int, help='Video encoder processes (default: VIDEO_WORKERS)')
+    submit_parser = commands.add_parser('submit', help='Run stages on the daemon and stream their output')
+    submit_parser.add_argument('stages', nargs='+', choices=STAGES)
+    submit_parser.add_argument('--pdf', help='PDF file or folder for the lectures stage (default: PDF)')
+    submit_parser.add_argument('--resume', action='store_true',
+                               help='Keep the pages an interrupted run finished')
+    submit_parser.add_argument('--report', default=os.getenv("METRICS_REPORT", "run_report.json"),
+                               help='JSON run report (default: run_report.json)')
+    submit_parser.add_argument('--prometheus', default=os.getenv("METRICS_PROMETHEUS") or None,
+                               help='Also write the metrics in Prometheus text format to this file')
+    submit_parser.add_argument('--profile', action='store_true', default=os.getenv("PROFILE", "0") == "1",
+                               help='Run the hot stages under cProfile')
+    commands.add_parser('status', help='Show whether the daemon is running and its queue')
+    commands.add_parser('stop', help='Stop the daemon after the queued jobs')
+
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        serve(port=args.port, workers=args.workers)
+        sys.exit(0)
+    try:
+        if args.command == 'submit':
+            sys.exit(0 if submit(args.stages, args.pdf, resume=args.resume, report=args.report,
+                                 prometheus=args.prometheus, profile=args.profile) else 1)
+        for message in request({"command": args.command}):
+            print(message)
+    except (ConnectionRefusedError, FileNotFoundError):
+        print(f"No daemon is running for {os.getcwd()}, start one here with: python daemon.py serve")
+        sys.exit(1)
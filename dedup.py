@@ -0,0 +1,174 @@
+"""
+Exact and near-duplicate detection for slide pages.
+
+Course decks repeat title slides, agendas, recaps and the same diagram in
+several sections. DuplicateIndex groups pages into clusters whose first page
+is the canonical one:
+
+    index = DuplicateIndex()
+    index.add("Lecture 1/page2", text)
+    index.add("Lecture 4/page7", same_text_other_bullets)
+    index.canonical("Lecture 4/page7")  # "Lecture 1/page2"
+
+Two pages are duplicates when their normalized text is the same, or when the
+64-bit SimHashes of their text differ in at most DEDUP_THRESHOLD bits and they
+contain the same numbers in the same order. Numbers are never ignored: slides
+that differ only in a value ("boils at 100 C" / "boils at 90 C") or a quiz
+question ("2 + 2" / "7 + 5") need explanations of their own. Slide numbers
+and dates in headers and footers are usually gone by the time pages get
+here, see boilerplate.py. Pages with unrelated text are 19 or more bits apart. With
+DEDUP_IMAGES=1 their rendered pages must also look alike: the difference hashes
+of small grayscale renders may differ in at most DEDUP_IMAGE_THRESHOLD bits.
+"""
+import hashlib
+import os
+import re
+
+# DEDUP=0 explains every page on its own even if another page says the same
+DEDUP = os.getenv("DEDUP", "1") != "0"
+# Bits two SimHashes may differ in for the pages to count as near duplicates, 0 for exact duplicates only
+DEDUP_THRESHOLD = int(os.getenv("DEDUP_THRESHOLD", "6"))
+# Also compare how the pages look, so slides with the same text but different diagrams stay apart
+DEDUP_IMAGES = os.getenv("DEDUP_IMAGES", "0") == "1"
+DEDUP_IMAGE_THRESHOLD = int(os.getenv("DEDUP_IMAGE_THRESHOLD", "4"))
+
+SIMHASH_BITS = 64
+
+
+def normalize_text(text):
+    """Lowercase words and numbers only, so spacing, punctuation and bullet characters don't matter"""
+    return " ".join(re.findall(r'\w+', text.lower()))
+
+
+def numbers(text):
+    """The numbers in text, in order"""
+    return tuple(re.findall(r'\d+(?:[.,]\d+)*', text))
+
+
+def _feature_hash(feature):
+    return int.from_bytes(hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(text):
+    """64-bit SimHash of the word trigrams (single words for very short texts) of normalized text"""
+    words = normalize_text(text).split()
+    if len(words) >= 3:
+        features = [" ".join(words[index:index + 3]) for index in range(len(words) - 2)]
+    else:
+        features = words
+    weights = [0] * SIMHASH_BITS
+    for feature in features:
+        value = _feature_hash(feature)
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+def page_image_hash(pdf_path, page_num):
+    """
+    64-bit difference hash of page page_num (1-based) of a PDF: the page is rendered as a
+    36x32 grayscale image, averaged down to 9x8 and each pixel compared with its right neighbour
+    """
+    import fitz
+
+    with fitz.open(pdf_path) as doc:
+        page = doc[page_num - 1]
+        matrix = fitz.Matrix(36 / page.rect.width, 32 / page.rect.height)
+        pix = page.get_pixmap(matrix=matrix, colorspace=fitz.csGRAY, alpha=False)
+    width, height, samples = pix.width, pix.height, pix.samples
+
+    def cell(x, y):
+        # Average of the source pixels that fall into cell (x, y) of the 9x8 grid
+        xs = range(x * width // 9, max((x + 1) * width // 9, x * width // 9 + 1))
+        ys = range(y * height // 8, max((y + 1) * height // 8, y * height // 8 + 1))
+        values = [samples[row * pix.stride + column] for row in ys for column in xs]
+        return sum(values) / len(values)
+
+    grid = [[cell(x, y) for x in range(9)] for y in range(8)]
+    return sum(1 << (y * 8 + x) for y in range(8) for x in range(8) if grid[y][x] > grid[y][x + 1])
+
+
+class DuplicateIndex:
+    """
+    Clusters of duplicate pages, built by adding pages in order. Each page is
+    compared with the canonical page of every cluster so far and joins the
+    first one it matches, otherwise it starts a new cluster.
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, image_threshold=DEDUP_IMAGE_THRESHOLD, use_images=DEDUP_IMAGES):
+        self.threshold = threshold
+        self.image_threshold = image_threshold
+        self.use_images = use_images
+        # Two hashes at most threshold bits apart agree on at least one of threshold + 1 bands
+        self._bands = max(1, min(threshold + 1, SIMHASH_BITS))
+        self._band_bits = SIMHASH_BITS // self._bands
+        self._canonical = {}  # page key -> canonical page key
+        self._members = {}  # canonical page key -> page keys of its cluster, canonical first
+        self._exact = {}  # normalized text hash -> canonical page keys
+        self._by_band = {}  # (band, value) -> canonical page keys
+        self._fingerprints = {}  # canonical page key -> (simhash, numbers, image hash)
+
+    def __len__(self):
+        return len(self._canonical)
+
+    def _band_values(self, signature):
+        mask = (1 << self._band_bits) - 1
+        return [(band, signature >> (band * self._band_bits) & mask) for band in range(self._bands)]
+
+    def _candidates(self, text_hash, signature):
+        yield from self._exact.get(text_hash, [])
+        if self.threshold > 0:
+            for band_value in self._band_values(signature):
+                yield from self._by_band.get(band_value, [])
+
+    def add(self, key, text, pdf_path=None, page_num=None):
+        """
+        Add a page and return the key of its cluster's canonical page (key itself for a new cluster).
+        pdf_path and page_num locate the page for the image comparison when DEDUP_IMAGES is on.
+        """
+        if key in self._canonical:
+            return self._canonical[key]
+        text_hash = hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()
+        signature = simhash(text)
+        page_numbers = numbers(text)
+        image = None
+        if self.use_images and pdf_path and os.path.exists(pdf_path):
+            try:
+                image = page_image_hash(pdf_path, page_num)
+            except Exception as e:
+                print(f"Could not fingerprint page {page_num} of {pdf_path}: {str(e)}")
+
+        for candidate in self._candidates(text_hash, signature):
+            candidate_signature, candidate_numbers, candidate_image = self._fingerprints[candidate]
+            # Equal normalized text means equal SimHashes and numbers, so exact duplicates always pass
+            if hamming(signature, candidate_signature) > self.threshold or page_numbers != candidate_numbers:
+                continue
+            if self.use_images and (image is None or candidate_image is None
+                                    or hamming(image, candidate_image) > self.image_threshold):
+                continue
+            self._canonical[key] = candidate
+            self._members[candidate].append(key)
+            return candidate
+
+        self._canonical[key] = key
+        self._members[key] = [key]
+        self._exact.setdefault(text_hash, []).append(key)
+        for band_value in self._band_values(signature):
+            self._by_band.setdefault(band_value, []).append(key)
+        self._fingerprints[key] = (signature, page_numbers, image)
+        return key
+
+    def canonical(self, key):
+        return self._canonical.get(key, key)
+
+    def members(self, key):
+        """Keys of every page in key's cluster, canonical page first"""
+        return list(self._members.get(self.canonical(key), [key]))
+
+    def duplicate_count(self):
+        """Pages that repeat an earlier page"""
+        return len(self._canonical) - len(self._members)
@@ -0,0 +1,336 @@
+import csv
+import re
+import sqlite3
+import zlib
+import numpy as np
+
+FLASHCARD_DB = "flashcards.db"
+
+# Roman numerals written in capitals, as in "Type II error" or "World War I"
+ROMAN_NUMERAL = re.compile(r'\b(?=[MDCLXVI])M*(C[MD]|D?C{0,3})(X[CL]|L?X{0,3})(I[XV]|V?I{0,3})\b')
+
+# Largest 31-bit prime, MinHash permutations are (a * x + b) mod MERSENNE_PRIME
+MERSENNE_PRIME = (1 << 31) - 1
+
+
+def parse_term_pairs(text):
+    """Split model output in the Term@Definition\\Term@Definition format into (term, definition) pairs"""
+    pairs = []
+    for entry in text.split('\\'):
+        if '@' not in entry:
+            continue
+        term, definition = entry.split('@', 1)
+        term = term.strip()
+        definition = definition.strip()
+        if term and definition:
+            pairs.append((term, definition))
+    return pairs
+
+
+def format_term_pairs(pairs):
+    return '\\'.join(f"{term}@{definition}" for term, definition in pairs)
+
+
+def normalize_term(term):
+    return " ".join(term.lower().split())
+
+
+def _shingles(text, size=3):
+    """Hashes of the character shingles of text, as a uint64 array"""
+    text = f" {text} "
+    if len(text) <= size:
+        grams = {text}
+    else:
+        grams = {text[i:i + size] for i in range(len(text) - size + 1)}
+    return np.fromiter((zlib.crc32(g.encode('utf-8')) & MERSENNE_PRIME for g in grams),
+                       dtype=np.uint64, count=len(grams))
+
+
+def minhash_signatures(texts, num_perm=64, seed=1):
+    """MinHash signature (num_perm values) for each text, as a (len(texts), num_perm) array"""
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+    b = rng.randint(0, MERSENNE_PRIME, size=num_perm).astype(np.uint64)
+    signatures = np.empty((len(texts), num_perm), dtype=np.uint64)
+    for row, text in enumerate(texts):
+        x = _shingles(text)
+        signatures[row] = ((a[:, None] * x[None, :] + b[:, None]) % MERSENNE_PRIME).min(axis=1)
+    return signatures
+
+
+def term_numbers(term):
+    """
+    Numbers and capitalized roman numerals in a term. Terms that differ only in these
+    ("Type I error" and "Type II error") name different things and are never collapsed.
+    """
+    return tuple(match.group(0) for match in re.finditer(r'\d+(?:[.,]\d+)*|' + ROMAN_NUMERAL.pattern, term)
+                 if match.group(0))
+
+
+def candidate_pairs(signatures, threshold=0.7, bands=16):
+    """
+    (i, j, estimated Jaccard similarity) of the rows of a MinHash signature array that
+    share a band and are at least threshold similar. Candidates come from LSH banding,
+    so the cost grows with the number of rows rather than the number of pairs.
+    """
+    if len(signatures) < 2:
+        return
+    rows = signatures.shape[1] // bands
+    for band in range(bands):
+        band_values = np.ascontiguousarray(signatures[:, band * rows:(band + 1) * rows])
+        buckets = {}
+        for index, key in enumerate(map(bytes, band_values)):
+            buckets.setdefault(key, []).append(index)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            first = members[0]
+            others = np.array(members[1:])
+            # Compare every candidate in the bucket against the first in one vectorised step
+            similarity = (signatures[others] == signatures[first]).mean(axis=1)
+            for other, score in zip(others, similarity):
+                if score >= threshold:
+                    yield first, int(other), float(score)
+
+
+class _Groups:
+    """Union-find over indexes, a group's root is its lowest index"""
+
+    def __init__(self, size):
+        self.parent = list(range(size))
+
+    def find(self, i):
+        while self.parent[i] != i:
+            self.parent[i] = self.parent[self.parent[i]]
+            i = self.parent[i]
+        return i
+
+    def union(self, a, b):
+        root_a, root_b = self.find(a), self.find(b)
+        if root_a != root_b:
+            self.parent[max(root_a, root_b)] = min(root_a, root_b)
+        return min(root_a, root_b)
+
+
+def near_duplicate_groups(texts, threshold=0.7, num_perm=64, bands=16):
+    """
+    Group texts whose estimated Jaccard similarity (over character shingles) is at
+    least threshold. Returns a list of the group root index for every text.
+    """
+    groups = _Groups(len(texts))
+    if len(texts) >= 2:
+        for first, other, _ in candidate_pairs(minhash_signatures(texts, num_perm), threshold, bands):
+            groups.union(first, other)
+    return [groups.find(i) for i in range(len(texts))]
+
+
+def fts_query(query):
+    """
+    FTS5 query matching every word of a plain search, with each word quoted as a string
+    so hyphens, apostrophes and words like OR or NEAR are searched for rather than parsed
+    """
+    return " ".join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+
+class FlashcardStore:
+    """
+    SQLite store of term/definition cards from every deck, with full-text search.
+
+    Near-identical cards from different decks are linked to one canonical card by
+    collapse_near_duplicates(); lookups and exports can then skip the copies.
+    """
+
+    def __init__(self, db_path=FLASHCARD_DB):
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        self.conn.row_factory = sqlite3.Row
+        self.has_fts = self._create_schema()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _create_schema(self):
+        self.conn.executescript('''
+            CREATE TABLE IF NOT EXISTS cards (
+                id INTEGER PRIMARY KEY,
+                deck TEXT NOT NULL,
+                term TEXT NOT NULL,
+                definition TEXT NOT NULL,
+                norm_term TEXT NOT NULL,
+                canonical_id INTEGER
+            );
+            CREATE INDEX IF NOT EXISTS cards_deck ON cards(deck);
+            CREATE INDEX IF NOT EXISTS cards_norm_term ON cards(norm_term);
+        ''')
+        try:
+            self.conn.executescript('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS cards_fts
+                    USING fts5(term, definition, content='cards', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS cards_ai AFTER INSERT ON cards BEGIN
+                    INSERT INTO cards_fts(rowid, term, definition) VALUES (new.id, new.term, new.definition);
+                END;
+                CREATE TRIGGER IF NOT EXISTS cards_ad AFTER DELETE ON cards BEGIN
+                    INSERT INTO cards_fts(cards_fts, rowid, term, definition)
+                        VALUES ('delete', old.id, old.term, old.definition);
+                END;
+            ''')
+            return True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5, search falls back to LIKE
+            return False
+
+    def import_pairs(self, deck, text):
+        """Replace a deck's cards with the pairs parsed from model output. Returns the number stored."""
+        pairs = parse_term_pairs(text)
+        with self.conn:
+            self.conn.execute("DELETE FROM cards WHERE deck = ?", (deck,))
+            # Copies of the deleted cards become their own canonical card until the next collapse
+            self.conn.execute("UPDATE cards SET canonical_id = NULL "
+                              "WHERE canonical_id IS NOT NULL AND canonical_id NOT IN (SELECT id FROM cards)")
+            self.conn.executemany(
+                "INSERT INTO cards (deck, term, definition, norm_term) VALUES (?, ?, ?, ?)",
+                [(deck, term, definition, normalize_term(term)) for term, definition in pairs])
+        return len(pairs)
+
+    def import_pairs_dict(self, term_def_pairs):
+        """Import {deck: model output} as written to pairs.txt"""
+        return sum(self.import_pairs(deck, text) for deck, text in term_def_pairs.items())
+
+    def import_pairs_file(self, filename):
+        """Import an existing pairs.txt (deck: pairs blocks separated by blank lines)"""
+        with open(filename, 'r', encoding='utf-8') as f:
+            content = f.read()
+        term_def_pairs = {}
+        for block in content.split("\n\n\n"):
+            if ':' in block:
+                deck, text = block.split(':', 1)
+                term_def_pairs[deck.strip()] = text.strip()
+        return self.import_pairs_dict(term_def_pairs)
+
+    def collapse_near_duplicates(self, threshold=0.7, definition_threshold=0.5):
+        """
+        Link cards from different decks to the oldest card of their group when their terms
+        are near-identical with the same numbers and roman numerals, and their definitions
+        are similar too. A group never holds two cards of one deck.
+        Returns the number of cards marked as duplicates.
+        """
+        rows = self.conn.execute("SELECT id, deck, term, norm_term, definition FROM cards ORDER BY id").fetchall()
+        ids = [row["id"] for row in rows]
+        groups = _Groups(len(rows))
+        if len(rows) >= 2:
+            definitions = minhash_signatures([normalize_term(row["definition"]) for row in rows])
+            decks = [{row["deck"]} for row in rows]
+            for first, other, _ in candidate_pairs(minhash_signatures([row["norm_term"] for row in rows]),
+                                                   threshold):
+                if term_numbers(rows[first]["term"]) != term_numbers(rows[other]["term"]):
+                    continue
+                if (definitions[first] == definitions[other]).mean() < definition_threshold:
+                    continue
+                root_a, root_b = groups.find(first), groups.find(other)
+                if root_a == root_b or decks[root_a] & decks[root_b]:
+                    continue
+                root = groups.union(root_a, root_b)
+                decks[root] = decks[root_a] | decks[root_b]
+        roots = [groups.find(i) for i in range(len(rows))]
+        updates = [(ids[root] if root != index else None, ids[index]) for index, root in enumerate(roots)]
+        with self.conn:
+            self.conn.executemany("UPDATE cards SET canonical_id = ? WHERE id = ?", updates)
+        return sum(1 for canonical, _ in updates if canonical is not None)
+
+    def cards(self, deck=None, include_duplicates=False):
+        sql = "SELECT * FROM cards WHERE 1 = 1"
+        params = []
+        if deck:
+            sql += " AND deck = ?"
+            params.append(deck)
+        if not include_duplicates:
+            sql += " AND canonical_id IS NULL"
+        return self.conn.execute(sql + " ORDER BY deck, id", params).fetchall()
+
+    def lookup(self, term, deck=None):
+        """Cards whose term matches exactly (case and whitespace insensitive)"""
+        sql = "SELECT * FROM cards WHERE norm_term = ?"
+        params = [normalize_term(term)]
+        if deck:
+            sql += " AND deck = ?"
+            params.append(deck)
+        return self.conn.execute(sql, params).fetchall()
+
+    def search(self, query, deck=None, limit=20):
+        """Full-text search over terms and definitions, cards must contain every word of query"""
+        if self.has_fts:
+            query = fts_query(query)
+            if not query:
+                return []
+            sql = ("SELECT cards.* FROM cards_fts JOIN cards ON cards.id = cards_fts.rowid "
+                   "WHERE cards_fts MATCH ?")
+            params = [query]
+        else:
+            sql = "SELECT * FROM cards WHERE (term LIKE ? OR definition LIKE ?)"
+            params = [f"%{query}%", f"%{query}%"]
+        if deck:
+            sql += " AND cards.deck = ?"
+            params.append(deck)
+        sql += " AND cards.canonical_id IS NULL LIMIT ?"
+        params.append(limit)
+        return self.conn.execute(sql, params).fetchall()
+
+    def export_csv(self, filename, deck=None):
+        cards = self.cards(deck)
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["deck", "term", "definition"])
+            for card in cards:
+                writer.writerow([card["deck"], card["term"], card["definition"]])
+        return len(cards)
+
+    def export_anki(self, filename, deck=None):
+        """Tab-separated file for Anki's File > Import, one Anki deck per lecture"""
+        cards = self.cards(deck)
+        with open(filename, 'w', encoding='utf-8', newline='') as f:
+            f.write("#separator:tab\n#html:false\n#deck column:3\n")
+            writer = csv.writer(f, delimiter='\t')
+            for card in cards:
+                writer.writerow([card["term"], card["definition"], card["deck"]])
+        return len(cards)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Query and export the flashcard store')
+    parser.add_argument('--db', default=FLASHCARD_DB, help=f'SQLite database (default: {FLASHCARD_DB})')
+    parser.add_argument('--import-pairs', metavar='FILE', help='Import a pairs.txt file')
+    parser.add_argument('--collapse', action='store_true', help='Collapse near-duplicate terms across decks')
+    parser.add_argument('--threshold', type=float, default=0.7,
+                      help='Term similarity threshold for --collapse (default: 0.7)')
+    parser.add_argument('--definition-threshold', type=float, default=0.5,
+                      help='Definition similarity threshold for --collapse (default: 0.5)')
+    parser.add_argument('--lookup', metavar='TERM', help='Show cards for an exact term')
+    parser.add_argument('--search', metavar='QUERY', help='Full-text search terms and definitions')
+    parser.add_argument('--deck', help='Only use cards from this deck')
+    parser.add_argument('--csv', metavar='FILE', help='Export cards to CSV')
+    parser.add_argument('--anki', metavar='FILE', help='Export cards as an Anki import file')
+
+    args = parser.parse_args()
+
+    with FlashcardStore(args.db) as store:
+        if args.import_pairs:
+            print(f"Imported {store.import_pairs_file(args.import_pairs)} cards from {args.import_pairs}")
+        if args.collapse:
+            print(f"Marked {store.collapse_near_duplicates(args.threshold, args.definition_threshold)} near-duplicate cards")
+        for card in (store.lookup(args.lookup, args.deck) if args.lookup else []):
+            print(f"[{card['deck']}] {card['term']}: {card['definition']}")
+        for card in (store.search(args.search, args.deck) if args.search else []):
+            print(f"[{card['deck']}] {card['term']}: {card['definition']}")
+        if args.csv:
+            print(f"Exported {store.export_csv(args.csv, args.deck)} cards to {args.csv}")
+        if args.anki:
+            print(f"Exported {store.export_anki(args.anki, args.deck)} cards to {args.anki}")
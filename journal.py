@@ -0,0 +1,95 @@
+"""
+Write-ahead journals of finished pages, so an interrupted run loses at most
+the pages that were in flight.
+
+A stage appends one JSON line per page as soon as the page is done, and
+flushes it to disk before moving on:
+
+    journal = PageJournal("transcript", "Lecture 1")
+    journal.append(58, input_hash, explanation)
+
+The deck's real output (transcript file, build manifest) is only written
+once the deck is finished, atomically. After that the journal is discarded.
+If the run dies first, the journal is left in .cache/journal/<stage>/<deck>.jsonl
+and a --resume run takes the pages whose input hash still matches from it
+instead of building them again. A torn last line from a crash is ignored, and
+cut off before the next page is appended so it cannot swallow that entry.
+"""
+import json
+import os
+import threading
+
+JOURNAL_DIR = os.path.join(".cache", "journal")
+
+
+class PageJournal:
+    def __init__(self, stage, deck, journal_dir=JOURNAL_DIR):
+        self.path = os.path.join(journal_dir, stage, f"{deck}.jsonl")
+        self._file = None
+        self._lock = threading.Lock()
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def entries(self):
+        """{page_num: {"page", "hash", ...}} of every journaled page, later lines win"""
+        entries = {}
+        if not self.exists():
+            return entries
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    entries[int(entry["page"])] = entry
+                except (ValueError, KeyError, TypeError):
+                    pass  # Torn last line from an interrupted write
+        return entries
+
+    def completed(self, input_hashes):
+        """Entries of the pages whose journaled input hash matches input_hashes {page_num: input_hash}"""
+        return {page_num: entry for page_num, entry in self.entries().items()
+                if input_hashes.get(page_num) == entry.get("hash")}
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = open(self.path, 'a+b')
+        # A crash mid-append leaves a torn last line, cut it off so the next entry starts on a line of its own
+        end = self._file.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - 4096)
+            self._file.seek(start)
+            newline = self._file.read(position - start).rfind(b"\n")
+            if newline != -1:
+                position = start + newline + 1
+                break
+            position = start
+        if position != end:
+            self._file.truncate(position)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def append(self, page_num, input_hash, text=None):
+        """Record a finished page and make sure it is on disk before returning"""
+        entry = {"page": int(page_num), "hash": input_hash}
+        if text is not None:
+            entry["text"] = text
+        line = (json.dumps(entry, ensure_ascii=False) + "\n").encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                self._open()
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def discard(self):
+        """Delete the journal once the pages in it are part of the deck's finished output"""
+        self.close()
+        if self.exists():
+            os.remove(self.path)
@@ -0,0 +1,246 @@
+"""
+Full-lecture videos stitched together from a deck's page clips.
+
+Page clips are all encoded with the same settings, so they can be joined
+with ffmpeg's concat demuxer without re-encoding (-c copy). Joining is then
+bound by disk speed and takes seconds even for long decks. Each page becomes
+a chapter named after its slide title:
+
+    Short-Form-Videos/Lecture 1/Lecture 1_page1.mp4 ... _page24.mp4
+    -> Full-Lectures/Lecture 1.mp4 with chapters "Slide 1: Introduction", ...
+
+Clips whose codec parameters differ (a clip encoded by moviepy, a deck
+with pages of another size) can't be stream-copied; those decks
+are re-encoded into the format of the first clip instead.
+"""
+import os
+import re
+import subprocess
+from pathlib import Path
+from manifest import hash_text
+from boilerplate import strip_boilerplate, BOILERPLATE_STRIP
+from video import find_ffmpeg
+import metrics
+
+# FULL_LECTURE=0 leaves only the page clips
+FULL_LECTURE = os.getenv("FULL_LECTURE", "1") != "0"
+FULL_LECTURE_DIR = os.getenv("FULL_LECTURE_DIR", "Full-Lectures")
+
+# Longest chapter title taken from a slide's first line
+CHAPTER_TITLE_LENGTH = 60
+
+
+def clip_paths(video_dir, deck, page_count=None):
+    """(page_num, path) of every page clip of a deck in page order, up to page_count pages if given"""
+    deck_dir = os.path.join(video_dir, deck)
+    if not os.path.isdir(deck_dir):
+        return []
+    clips = []
+    for name in os.listdir(deck_dir):
+        match = re.fullmatch(rf'{re.escape(deck)}_page(\d+)\.mp4', name)
+        if match and (page_count is None or int(match.group(1)) <= page_count):
+            clips.append((int(match.group(1)), os.path.join(deck_dir, name)))
+    return sorted(clips)
+
+
+def probe_clip(clip_path, ffmpeg=None):
+    """
+    {"duration", "video", "audio", "width", "height"} of a clip from ffmpeg's stream info, or None.
+    "video" and "audio" are the stream descriptions without bitrates, so two clips can be
+    stream-copied into one file when they are equal.
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    # Without an output file ffmpeg only reads the header and exits with an error
+    info = subprocess.run([ffmpeg, '-hide_banner', '-i', clip_path], capture_output=True, text=True,
+                          stdin=subprocess.DEVNULL).stderr
+    duration = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', info)
+    video = re.search(r'Stream #\S+: Video: (.*)', info)
+    audio = re.search(r'Stream #\S+: Audio: (.*)', info)
+    if not (duration and video and audio):
+        return None
+
+    def parameters(description):
+        # Bitrates vary from clip to clip without affecting whether they can be joined
+        description = re.sub(r',? \d+ kb/s', '', description)
+        return re.sub(r' \((default|attached pic)\)', '', description).strip()
+
+    hours, minutes, seconds = duration.groups()
+    size = re.search(r', (\d+)x(\d+)', video.group(1))
+    return {"duration": int(hours) * 3600 + int(minutes) * 60 + float(seconds),
+            "video": parameters(video.group(1)), "audio": parameters(audio.group(1)),
+            "width": int(size.group(1)) if size else None, "height": int(size.group(2)) if size else None}
+
+
+def _escape_metadata(value):
+    return re.sub(r'([=;#\\\n])', r'\\\1', value)
+
+
+def write_chapters(path, chapters):
+    """Write an ffmetadata file with one chapter per (title, start seconds, end seconds)"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(";FFMETADATA1\n")
+        for title, start, end in chapters:
+            f.write(f"[CHAPTER]\nTIMEBASE=1/1000\nSTART={round(start * 1000)}\nEND={round(end * 1000)}\n")
+            f.write(f"title={_escape_metadata(title)}\n")
+
+
+def _concat_copy(ffmpeg, clips, metadata_path, output_path):
+    list_path = f"{output_path}.clips.txt"
+    with open(list_path, 'w', encoding='utf-8') as f:
+        for path in clips:
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    try:
+        return subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0', '-i', list_path,
+                               '-i', metadata_path, '-map', '0', '-map_metadata', '1', '-map_chapters', '1',
+                               '-c', 'copy', '-movflags', '+faststart', '-f', 'mp4', output_path],
+                              capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    finally:
+        os.remove(list_path)
+
+
+def _concat_reencode(ffmpeg, clips, width, height, metadata_path, output_path):
+    # Every clip is scaled and padded to the first clip's size and its audio resampled,
+    # so the concat filter gets identical streams
+    command = [ffmpeg, '-y', '-loglevel', 'error']
+    for path in clips:
+        command += ['-i', path]
+    command += ['-i', metadata_path]
+    filters = []
+    for index in range(len(clips)):
+        filters.append(f"[{index}:v]scale={width}:{height}:force_original_aspect_ratio=decrease,"
+                       f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps=1,format=yuv420p[v{index}]")
+        filters.append(f"[{index}:a]aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo[a{index}]")
+    inputs = "".join(f"[v{index}][a{index}]" for index in range(len(clips)))
+    filters.append(f"{inputs}concat=n={len(clips)}:v=1:a=1[v][a]")
+    command += ['-filter_complex', ";".join(filters), '-map', '[v]', '-map', '[a]',
+                '-map_metadata', str(len(clips)), '-map_chapters', str(len(clips)),
+                '-c:v', 'libx264', '-tune', 'stillimage', '-preset', 'veryfast', '-c:a', 'aac',
+                '-movflags', '+faststart', '-f', 'mp4', output_path]
+    return subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+
+
+def concat_clips(clips, output_path, ffmpeg=None):
+    """
+    Join (title, clip path) pairs in order into output_path with one chapter per clip.
+    Stream copy when every clip has the same codec parameters, otherwise re-encode.
+    Returns "copy" or "re-encode" for the method used.
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+
+    probes = [probe_clip(path, ffmpeg) for _, path in clips]
+    unreadable = [path for (_, path), probe in zip(clips, probes) if probe is None]
+    if unreadable:
+        raise RuntimeError(f"could not read {unreadable[0]}")
+    chapters = []
+    start = 0.0
+    for (title, _), probe in zip(clips, probes):
+        chapters.append((title, start, start + probe["duration"]))
+        start += probe["duration"]
+
+    metadata_path = f"{output_path}.chapters.txt"
+    temp_path = f"{output_path}.tmp"
+    write_chapters(metadata_path, chapters)
+    paths = [path for _, path in clips]
+    try:
+        method = "copy"
+        result = None
+        if all((probe["video"], probe["audio"]) == (probes[0]["video"], probes[0]["audio"]) for probe in probes):
+            result = _concat_copy(ffmpeg, paths, metadata_path, temp_path)
+        if result is None or result.returncode != 0:
+            method = "re-encode"
+            result = _concat_reencode(ffmpeg, paths, probes[0]["width"] or 1920, probes[0]["height"] or 1080,
+                                      metadata_path, temp_path)
+        if result.returncode != 0:
+            raise RuntimeError(f"ffmpeg concat failed: {result.stderr.strip()}")
+        os.replace(temp_path, output_path)
+    finally:
+        for path in (metadata_path, temp_path):
+            if os.path.exists(path):
+                os.remove(path)
+    return method
+
+
+def chapter_titles(pdf_path):
+    """{page_num: "Slide N: <first line>"} from the deck's page text index, {} if it can't be read"""
+    from text_index import load_text_index
+
+    try:
+        index = load_text_index(pdf_path)
+    except Exception:
+        return {}
+    titles = {}
+    # A header repeated on every slide would otherwise become every chapter's title
+    pages = strip_boilerplate(index.non_empty())[0] if BOILERPLATE_STRIP else index.non_empty()
+    for page_num, text in pages:
+        first_line = next((line.strip() for line in text.splitlines() if line.strip()), "")
+        if len(first_line) > CHAPTER_TITLE_LENGTH:
+            first_line = first_line[:CHAPTER_TITLE_LENGTH - 3].rstrip() + "..."
+        titles[page_num] = f"Slide {page_num}: {first_line}"
+    return titles
+
+
+def assemble_lecture(pdf_path, video_dir, output_dir=FULL_LECTURE_DIR, manifest=None):
+    """
+    Join the page clips of one deck into <output_dir>/<deck>.mp4.
+    Skipped when the clips and titles are unchanged since the last build (with a manifest).
+    Returns None on success or when there was nothing to do, otherwise the error message.
+    """
+    deck = Path(pdf_path).stem
+    titles = chapter_titles(pdf_path) if os.path.exists(pdf_path) else {}
+    page_count = None
+    if os.path.exists(pdf_path):
+        import fitz
+        with fitz.open(pdf_path) as doc:
+            page_count = doc.page_count
+    clips = clip_paths(video_dir, deck, page_count)
+    if not clips:
+        return None
+
+    output_path = os.path.join(output_dir, f"{deck}.mp4")
+    # A clip that was rebuilt or copied has a new size or mtime
+    stamps = []
+    for page_num, path in clips:
+        stat = os.stat(path)
+        stamps.append((page_num, stat.st_size, stat.st_mtime_ns, titles.get(page_num, "")))
+    input_hash = hash_text(*stamps)
+    if manifest and manifest.is_up_to_date("lecture", deck, input_hash, output_path):
+        print(f"Full lecture for {deck} is up to date, skipping")
+        return None
+
+    os.makedirs(output_dir, exist_ok=True)
+    try:
+        with metrics.span("lecture_concat", deck=deck, pages=len(clips)):
+            method = concat_clips([(titles.get(page_num, f"Slide {page_num}"), path) for page_num, path in clips],
+                                  output_path)
+    except Exception as e:
+        print(f"Failed to create full lecture for {deck}: {str(e)}")
+        return str(e)
+    print(f"Created full lecture: {output_path} ({len(clips)} chapters, {method})")
+    if manifest:
+        manifest.record("lecture", deck, input_hash)
+    return None
+
+
+def failed_decks(failed):
+    """Decks named in a list of (label, error) pairs, whose labels are "<deck> page <N>" or the deck name"""
+    return {label.rsplit(" page ", 1)[0] for label, _ in failed}
+
+
+def assemble_lectures(pdf_paths, video_dir, output_dir=FULL_LECTURE_DIR, manifest=None, skip=()):
+    """
+    Full-lecture videos for several decks, except the decks named in skip.
+    Returns a list of (deck, error) for the decks that failed.
+    """
+    failed = []
+    for pdf_path in pdf_paths:
+        deck = Path(pdf_path).stem
+        if deck in skip:
+            print(f"Some pages of {deck} failed, not creating its full lecture")
+            continue
+        error = assemble_lecture(pdf_path, video_dir, output_dir, manifest)
+        if error:
+            failed.append((f"{deck} full lecture", error))
+    return failed
@@ -1,12 +1,19 @@
-import comtypes.client
 import os
 import sys
-import subprocess
 import re
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
 from pathlib import Path
-from voice import convert_text_to_mp3_pyttsx3
-from moviepy.editor import ImageClip, AudioFileClip, CompositeVideoClip
-import fitz  # PyMuPDF for PDF handling
+from voice import get_synthesizer, reuse_audio, synthesize_distinct, TTS_RATE, TTS_SETTINGS
+from manifest import BuildManifest, hash_text
+from render import PageRenderer
+from convert import get_converter, ConversionError
+from transcript import iter_pages, find_transcripts, parse_legacy_transcript
+from video import encode_clip, plan_clip, collect_clip, copy_clip, VIDEO_WORKERS, VIDEO_MAX_IN_FLIGHT
+from lecture import assemble_lectures, failed_decks, FULL_LECTURE
+from journal import PageJournal
+from audio_meta import audio_complete
+import metrics
 
 
 '''
@@ -22,104 +29,76 @@ pip install gtts pyttsx3
 '''
 
 def ppt_to_pdf_default(input_file_name, output_file_name):
-    powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
-    powerpoint.Visible = 1
-
-    try:
-        deck = powerpoint.Presentations.Open(input_file_name)
-        deck.SaveAs(output_file_name, 32)  # 32 is the format type for PDF
-        print(f"Successfully converted {input_file_name} to {output_file_name}")
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-    finally:
-        try:
-            deck.Close()
-        except:
-            pass
-        powerpoint.Quit()
+    with get_converter() as converter:
+        report_conversion(input_file_name, output_file_name, converter.convert(input_file_name, output_file_name))
 
 def ppt_to_pdf_custom(input_file_name, output_file_name):
-    powerpoint = comtypes.client.CreateObject("Powerpoint.Application")
-    powerpoint.Visible = 1
+    with get_converter() as converter:
+        report_conversion(input_file_name, output_file_name,
+                          converter.convert(input_file_name, output_file_name, custom=True), custom=True)
 
-    try:
-        deck = powerpoint.Presentations.Open(input_file_name)
-        
-        export_options = {
-            "Path": output_file_name,
-            "FixedFormatType": 2,  # ppFixedFormatTypePDF
-            "Intent": 1,  # ppFixedFormatIntentScreen
-            "OutputType": 5,  # ppPrintOutputNotesPages
-            "PrintHiddenSlides": True,
-            "IncludeDocProperties": True,
-            "DocStructureTags": True,
-            "BitmapMissingFonts": True,
-        }
-
-        deck.ExportAsFixedFormat(**export_options)
-        print(f"Successfully converted {input_file_name} to {output_file_name} with custom settings")
-
-    except Exception as e:
-        print(f"An error occurred: {str(e)}")
-    finally:
-        try:
-            deck.Close()
-        except:
-            pass
-        powerpoint.Quit()
+def report_conversion(input_file_name, output_file_name, error, custom=False):
+    if error:
+        print(f"An error occurred converting {input_file_name}: {error}")
+    else:
+        print(f"Successfully converted {input_file_name} to {output_file_name}"
+              + (" with custom settings" if custom else ""))
 
 def process_folder(input_folder, output_folder, use_custom=False):
+    """Convert every PPTX in input_folder, several at once when the backend allows it"""
     if not os.path.exists(output_folder):
         os.makedirs(output_folder)
 
-    for filename in os.listdir(input_folder):
-        if filename.lower().endswith('.pptx'):
-            input_path = os.path.join(input_folder, filename)
-            output_path = os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.pdf")
-            
-            if use_custom:
-                ppt_to_pdf_custom(input_path, output_path)
-            else:
-                ppt_to_pdf_default(input_path, output_path)
+    pairs = [(os.path.join(input_folder, filename),
+              os.path.join(output_folder, f"{os.path.splitext(filename)[0]}.pdf"))
+             for filename in os.listdir(input_folder) if filename.lower().endswith('.pptx')]
+    try:
+        with get_converter() as converter:
+            for input_path, output_path, error in converter.convert_many(pairs, custom=use_custom):
+                report_conversion(input_path, output_path, error, custom=use_custom)
+    except ConversionError as e:
+        print(f"An error occurred: {str(e)}")
+
+def run_on_daemon(stage, resume=False):
+    """
+    Hand a stage to this project's warm daemon (daemon.py) if one is running, with the
+    report, Prometheus and profile settings of this run. Returns False if there is none.
+    """
+    import daemon
+    if not daemon.is_running():
+        return False
+    print("Submitting to the running daemon...")
+    daemon.submit([stage], resume=resume, report=metrics.config["report_path"],
+                  prometheus=metrics.config["prometheus_path"], profile=metrics.config["profile"])
+    return True
 
 def run_ai_script():
+    # Runs in this process (or the daemon) instead of starting a fresh interpreter for ai.py
+    if run_on_daemon("flashcards"):
+        return
     try:
-        subprocess.run([sys.executable, "ai.py"], check=True)
-        print("AI script executed successfully.")
-    except subprocess.CalledProcessError as e:
-        print(f"Error running AI script: {e}")
+        import ai
+        ai.create_flashcards()
+        print("AI analysis finished successfully.")
+    except Exception as e:
+        print(f"Error running AI analysis: {e}")
 
 def extract_page_content(content):
     """
     Extract page content from the transcript format with PAGE markers.
-    Returns a list of tuples (page_number, content).
+    Returns a list of tuples (page_number, content), with page_number a string as it
+    always was here. transcript.parse_legacy_transcript gives the page numbers as ints.
     """
-    # Match content between PAGE markers
-    pattern = r'PAGE (\d+):\n-{20}\n(.*?)\n-{20}'
-    matches = re.finditer(pattern, content, re.DOTALL)
-    
-    pages = []
-    for match in matches:
-        page_num = match.group(1)
-        page_content = match.group(2).strip()
-        if page_content:  # Only include non-empty pages
-            pages.append((page_num, page_content))
-    
-    return pages
+    return [(str(page_num), page_content) for page_num, page_content in parse_legacy_transcript(content)]
 
-def create_audio_from_transcript(transcript_path):
+def create_audio_from_transcript(transcript_path, manifest=None, resume=False):
     """
     Create MP3 files for each page in a transcript file.
+    Pages whose text is unchanged since their MP3 was last built are skipped
+    when a build manifest is given. Finished pages are journaled as they are
+    written, and with resume the pages an interrupted run finished are kept.
     """
     print(f"\nProcessing transcript: {transcript_path}")
-    
-    # Read the transcript content
-    try:
-        with open(transcript_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-    except UnicodeDecodeError:
-        with open(transcript_path, 'r', encoding='latin-1') as f:
-            content = f.read()
 
     # Create audio directory structure
     pdf_name = Path(transcript_path).stem
@@ -129,91 +108,91 @@ def create_audio_from_transcript(transcript_path):
     # Create directories if they don't exist
     os.makedirs(pdf_audio_dir, exist_ok=True)
 
-    # Extract pages and their content
-    pages = extract_page_content(content)
-    
-    if not pages:
+    journal = PageJournal("audio", pdf_name)
+    journaled = journal.entries() if resume else {}
+    if journal.exists() and not resume:
+        print(f"Discarding the journal of an interrupted run of {pdf_name} (use --resume to keep it)")
+        journal.discard()
+
+    # Work out which pages need (re)building, streaming pages out of the transcript
+    to_build = []
+    found_pages = False
+    for page_num, page_content in iter_pages(transcript_path):
+        found_pages = True
+        if page_content.strip():
+            output_mp3 = os.path.join(pdf_audio_dir, f"{pdf_name}_page{page_num}.mp3")
+            manifest_key = f"{pdf_name}/page{page_num}"
+            input_hash = hash_text(TTS_SETTINGS, page_content)
+            if manifest and manifest.is_up_to_date("audio", manifest_key, input_hash, output_mp3):
+                print(f"Audio for page {page_num} is up to date, skipping")
+                continue
+            if journaled.get(page_num, {}).get("hash") == input_hash and audio_complete(output_mp3):
+                print(f"Audio for page {page_num} was finished before the interruption, skipping")
+                if manifest:
+                    manifest.record("audio", manifest_key, input_hash)
+                continue
+            # A page that says exactly what another page said gets a copy of its audio
+            source = reuse_audio(manifest, base_audio_dir, output_mp3, input_hash) if manifest else None
+            if source:
+                print(f"Audio for page {page_num} repeats {source}, copied")
+                manifest.record("audio", manifest_key, input_hash)
+                continue
+            to_build.append((page_num, page_content, output_mp3, manifest_key, input_hash))
+
+    if not found_pages:
         print(f"No valid page content found in {transcript_path}")
         return
+    if not to_build:
+        finish_audio_journal(journal, manifest)
+        return
 
-    # Process each page
-    for page_num, page_content in pages:
-        if page_content.strip():
-            # Create temporary text file for the page content
-            temp_txt_path = os.path.join(pdf_audio_dir, f"temp_page_{page_num}.txt")
-            with open(temp_txt_path, 'w', encoding='utf-8') as f:
-                f.write(page_content)
+    # Convert to MP3 with the shared engine, many pages per synthesis cycle.
+    # Each cycle's pages are journaled before the next one starts.
+    synthesizer = get_synthesizer(rate=TTS_RATE)
+    for start in range(0, len(to_build), synthesizer.batch_size):
+        batch = to_build[start:start + synthesizer.batch_size]
+        try:
+            written = set(synthesize_distinct(
+                synthesizer, [(page_content, output_mp3) for _, page_content, output_mp3, _, _ in batch]))
+        except Exception as e:
+            print(f"Error creating audio for {pdf_name}: {str(e)}")
+            journal.close()
+            return
 
-            # Convert to MP3
-            output_mp3 = os.path.join(pdf_audio_dir, f"{pdf_name}_page{page_num}.mp3")
-            try:
-                convert_text_to_mp3_pyttsx3(temp_txt_path, output_mp3)
+        for page_num, _, output_mp3, manifest_key, input_hash in batch:
+            if output_mp3 in written:
+                journal.append(page_num, input_hash)
                 print(f"Created audio for page {page_num}: {output_mp3}")
-            except Exception as e:
-                print(f"Error creating audio for page {page_num}: {str(e)}")
-            finally:
-                # Clean up temporary text file
-                if os.path.exists(temp_txt_path):
-                    os.remove(temp_txt_path)
-
-def extract_page_from_pdf(pdf_path, page_number, output_path):
-    """
-    Extract a single page from a PDF and save it as an image
-    """
-    try:
-        doc = fitz.open(pdf_path)
-        page = doc[page_number]
-        pix = page.get_pixmap(matrix=fitz.Matrix(300/72, 300/72))  # 300 DPI
-        pix.save(output_path)
-        doc.close()
-        return True
-    except Exception as e:
-        print(f"Error extracting PDF page: {str(e)}")
-        return False
+                if manifest:
+                    manifest.record("audio", manifest_key, input_hash)
+            else:
+                print(f"Error creating audio for page {page_num}: no output written")
+    finish_audio_journal(journal, manifest)
 
-def create_video_from_image_and_audio(image_path, audio_path, output_path):
-    """
-    Create a video from a still image and an audio file
-    """
-    try:
-        # Load the audio to get its duration
-        audio = AudioFileClip(audio_path)
-        
-        # Create video from the image with the same duration as the audio
-        video = ImageClip(image_path).set_duration(audio.duration)
-        
-        # Combine video and audio
-        final_video = video.set_audio(audio)
-        
-        # Write the video file
-        final_video.write_videofile(output_path, 
-                                  fps=1,  # 1 fps is enough for still image
-                                  codec='libx264',
-                                  audio_codec='aac')
-        
-        # Close the clips
-        audio.close()
-        video.close()
-        final_video.close()
-        
-        return True
-    except Exception as e:
-        print(f"Error creating video: {str(e)}")
-        return False
+def finish_audio_journal(journal, manifest):
+    """Save the manifest, which now holds the journaled pages, and drop the journal"""
+    if manifest:
+        manifest.save()
+    journal.discard()
 
-def process_pdf_to_videos(pdf_path, audio_dir, video_dir):
+def plan_pdf_video_jobs(pdf_path, audio_dir, video_dir, manifest=None):
     """
-    Create videos for each page of a PDF with corresponding audio
+    Render the pages of a PDF that have audio and return the video jobs still to encode.
+    Pages whose audio and rendered image are unchanged since their video was
+    last built are skipped when a build manifest is given.
+    Returns (jobs, failed) where failed lists (label, error) for pages that couldn't be prepared.
     """
     pdf_name = Path(pdf_path).stem
     pdf_video_dir = os.path.join(video_dir, pdf_name)
     os.makedirs(pdf_video_dir, exist_ok=True)
-    
-    # Temporary directory for page images
-    temp_img_dir = os.path.join(pdf_video_dir, "temp_images")
-    os.makedirs(temp_img_dir, exist_ok=True)
-    
+
+    jobs = []
+    failed = []
+    renderer = None
     try:
+        # The PDF is opened once for the whole deck and pages are rendered at video resolution
+        renderer = PageRenderer(pdf_path)
+
         # Get list of audio files and extract their actual page numbers
         audio_files = []
         for f in os.listdir(os.path.join(audio_dir, pdf_name)):
@@ -227,37 +206,106 @@ def process_pdf_to_videos(pdf_path, audio_dir, video_dir):
         audio_files.sort(key=lambda x: x[1])
         
         for audio_file, actual_page_num in audio_files:
-            # Paths setup
             audio_path = os.path.join(audio_dir, pdf_name, audio_file)
-            img_path = os.path.join(temp_img_dir, f"page_{actual_page_num}.png")
-            video_path = os.path.join(pdf_video_dir, f"{pdf_name}_page{actual_page_num}.mp4")
-            
-            print(f"\nProcessing page {actual_page_num} of {pdf_name}")
-            
-            # Extract PDF page as image (subtract 1 from page_num for 0-based index)
-            if extract_page_from_pdf(pdf_path, actual_page_num - 1, img_path):
-                # Create video
-                if create_video_from_image_and_audio(img_path, audio_path, video_path):
-                    print(f"Created video: {video_path}")
-                else:
-                    print(f"Failed to create video for page {actual_page_num}")
-            else:
-                print(f"Failed to extract page {actual_page_num} from PDF")
-                
-            # Clean up temporary image
-            if os.path.exists(img_path):
-                os.remove(img_path)
-                
-        # Clean up temporary image directory
-        os.rmdir(temp_img_dir)
+
+            # Render PDF page as image (subtract 1 from page_num for 0-based index)
+            try:
+                img_path = renderer.render(actual_page_num - 1)
+            except Exception as e:
+                print(f"Failed to extract page {actual_page_num} from PDF: {str(e)}")
+                failed.append((f"{pdf_name} page {actual_page_num}", f"page extraction failed: {str(e)}"))
+                continue
+
+            job = plan_clip(pdf_name, actual_page_num, img_path, audio_path, video_dir, manifest)
+            if job:
+                jobs.append(job)
         
     except Exception as e:
         print(f"Error processing PDF to videos: {str(e)}")
+        failed.append((pdf_name, str(e)))
+    finally:
+        if renderer:
+            renderer.close()
 
-def process_all_to_videos():
+    return jobs, failed
+
+def run_video_jobs(jobs, manifest=None, workers=None, max_in_flight=None, pool=None):
+    """
+    Encode video jobs across a pool of worker processes.
+    At most max_in_flight jobs are submitted at a time. A failing or crashing
+    job is reported and does not stop the others. An existing process pool can be
+    passed in to reuse its warm workers, otherwise one is started for this call.
+    Returns (succeeded, failed) lists of labels and (label, error) pairs.
+    """
+    workers = workers or VIDEO_WORKERS
+    max_in_flight = max(max_in_flight or VIDEO_MAX_IN_FLIGHT, workers)
+    succeeded = []
+    failed = []
+    # Jobs with the same image and audio as an earlier job get a copy of its clip
+    encoded = {}
+    copies = []
+
+    def collect(future):
+        job = pending.pop(future)
+        error = collect_clip(future, job, manifest)
+        if error is None:
+            succeeded.append(job["label"])
+        else:
+            failed.append((job["label"], error))
+
+    pending = {}
+    with (nullcontext(pool) if pool else ProcessPoolExecutor(max_workers=workers)) as pool:
+        for job in jobs:
+            if job["input_hash"] in encoded:
+                copies.append((encoded[job["input_hash"]], job))
+                continue
+            encoded[job["input_hash"]] = job
+            # Wait for a slot before queueing more work
+            while len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    collect(future)
+            future = pool.submit(encode_clip, job["image_path"], job["audio_path"], job["video_path"])
+            pending[future] = job
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                collect(future)
+
+    failed_labels = dict(failed)
+    for source, job in copies:
+        error = failed_labels.get(source["label"]) or copy_clip(source["video_path"], job, manifest)
+        if error is None:
+            succeeded.append(job["label"])
+        else:
+            failed.append((job["label"], error))
+    return succeeded, failed
+
+def print_video_summary(succeeded, failed):
+    print(f"\nVideo summary: {len(succeeded)} created, {len(failed)} failed")
+    for label, error in failed:
+        print(f"  FAILED {label}: {error}")
+
+def process_pdf_to_videos(pdf_path, audio_dir, video_dir, manifest=None, workers=None):
+    """
+    Create videos for each page of a PDF with corresponding audio, and join them into the full lecture
     """
-    Process all PDFs and their corresponding audio files into videos
+    jobs, failed = plan_pdf_video_jobs(pdf_path, audio_dir, video_dir, manifest)
+    succeeded, encode_failed = run_video_jobs(jobs, manifest, workers)
+    failed += encode_failed
+    if FULL_LECTURE:
+        failed += assemble_lectures([pdf_path], video_dir, manifest=manifest, skip=failed_decks(failed))
+    return succeeded, failed
+
+def process_all_to_videos(manifest=None, workers=None, pool=None):
     """
+    Process all PDFs and their corresponding audio files into videos.
+    Page clips from every deck share one worker pool.
+    """
+    if manifest is None:
+        manifest = BuildManifest()
+
     pdf_dir = "PDF"
     audio_dir = "audio"
     video_dir = "Short-Form-Videos"
@@ -273,20 +321,34 @@ def process_all_to_videos():
     
     pdfs = [f for f in os.listdir(pdf_dir) if f.endswith('.pdf')]
     
+    jobs = []
+    failed = []
     for pdf_file in pdfs:
         pdf_path = os.path.join(pdf_dir, pdf_file)
         pdf_name = Path(pdf_file).stem
         
         # Check if corresponding audio directory exists
         if os.path.exists(os.path.join(audio_dir, pdf_name)):
-            print(f"\nProcessing {pdf_file} to create videos...")
-            process_pdf_to_videos(pdf_path, audio_dir, video_dir)
+            print(f"\nPreparing {pdf_file} to create videos...")
+            deck_jobs, deck_failed = plan_pdf_video_jobs(pdf_path, audio_dir, video_dir, manifest)
+            jobs.extend(deck_jobs)
+            failed.extend(deck_failed)
         else:
             print(f"No audio files found for {pdf_file}. Skipping...")
 
-def process_all_transcripts():
+    print(f"\nEncoding {len(jobs)} videos with {workers or VIDEO_WORKERS} workers...")
+    succeeded, encode_failed = run_video_jobs(jobs, manifest, workers, pool=pool)
+    if FULL_LECTURE:
+        pdf_paths = [os.path.join(pdf_dir, pdf_file) for pdf_file in pdfs]
+        encode_failed += assemble_lectures(pdf_paths, video_dir, manifest=manifest,
+                                           skip=failed_decks(failed + encode_failed))
+    manifest.save()
+    print_video_summary(succeeded, failed + encode_failed)
+
+def process_all_transcripts(pool=None, resume=False):
     """
-    Process all transcript files in the Transcripts directory and create videos
+    Process all transcript files in the Transcripts directory and create videos.
+    resume keeps the audio pages an interrupted run finished.
     """
     transcripts_dir = "Transcripts"
     if not os.path.exists(transcripts_dir):
@@ -295,19 +357,26 @@ def process_all_transcripts():
 
     print("\nStep 1: Processing transcripts to create audio files...")
     
-    transcript_files = [f for f in os.listdir(transcripts_dir) if f.endswith('.txt')]
-    if not transcript_files:
+    transcript_paths = find_transcripts(transcripts_dir)
+    if not transcript_paths:
         print("No transcript files found in the Transcripts directory.")
         return
 
-    for transcript_file in transcript_files:
-        transcript_path = os.path.join(transcripts_dir, transcript_file)
-        create_audio_from_transcript(transcript_path)
+    manifest = BuildManifest()
+    for transcript_path in transcript_paths:
+        create_audio_from_transcript(transcript_path, manifest, resume)
+        manifest.save()
     
     print("\nStep 2: Creating videos from PDF pages and audio...")
-    process_all_to_videos()
+    process_all_to_videos(manifest, pool=pool)
 
-def create_brainrot_lectures():
+# "streaming" overlaps the transcript, audio and video stages page by page (pipeline.py),
+# "staged" finishes each stage for every deck before starting the next
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "streaming")
+
+def create_brainrot_lectures(resume=False):
+    if PIPELINE_MODE == "streaming" and run_on_daemon("lectures", resume):
+        return
     try:
         import ai
         pdf_folder = "PDF"
@@ -316,11 +385,19 @@ def create_brainrot_lectures():
             return
             
         print("Creating Brainrot Lectures...")
-        ai.process_all_pdfs_brainrot(pdf_folder)
+        if PIPELINE_MODE == "streaming":
+            # Transcripts, audio and videos are built page by page, all stages at once
+            from pipeline import LecturePipeline
+            succeeded, failed = LecturePipeline(pdf_folder, resume=resume).run()
+            print_video_summary(succeeded, failed)
+            print("\nTranscripts, audio and videos are in 'Transcripts', 'audio' and 'Short-Form-Videos'")
+            return
+
+        ai.process_all_pdfs_brainrot(pdf_folder, resume=resume)
         print("Brainrot Lectures have been created in the 'Transcripts' folder")
         
         # After creating transcripts, process them into audio files
-        process_all_transcripts()
+        process_all_transcripts(resume=resume)
         print("\nAudio files have been created in the 'audio' directory")
         print("\nVideo files have been created in the 'Short-Form-Videos' directory")
         
@@ -334,7 +411,30 @@ def get_user_choice(prompt, valid_options):
             return choice
         print(f"Invalid choice. Please enter one of: {', '.join(valid_options)}")
 
+def parse_args():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='PowerPoint to PDF converter with AI analysis and video generation')
+    parser.add_argument('--profile', action='store_true',
+                      help='Run the hot stages under cProfile and save profiles/<stage>.prof')
+    parser.add_argument('--report', default=metrics.config["report_path"],
+                      help='JSON run report with per-stage timings, tokens and cost (default: run_report.json)')
+    parser.add_argument('--prometheus', help='Also write the metrics in Prometheus text format to this file')
+    parser.add_argument('--resume', action='store_true',
+                      help='Keep the transcript and audio pages an interrupted run finished instead of redoing them')
+    return parser.parse_args()
+
+def finish_run_metrics():
+    """Print and save the metrics of the last menu action, then start fresh for the next one"""
+    if metrics.report()["stages"]:
+        metrics.print_summary()
+        metrics.write_reports()
+    metrics.reset()
+
 def main():
+    args = parse_args()
+    metrics.configure(report_path=args.report, prometheus_path=args.prometheus, profile=args.profile)
+
     script_dir = os.path.dirname(os.path.abspath(__file__))
     input_folder = os.path.join(script_dir, 'PPTX')
     output_folder = os.path.join(script_dir, 'PDF')
@@ -366,11 +466,15 @@ def main():
         elif choice == '3':
             run_ai_script()
         elif choice == '4':
-            create_brainrot_lectures()
+            create_brainrot_lectures(args.resume)
         elif choice == '5':
-            process_all_transcripts()
+            if not run_on_daemon("media", args.resume):
+                process_all_transcripts(resume=args.resume)
         else:
             print("Invalid choice. Please try again.")
+            continue
+
+        finish_run_metrics()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
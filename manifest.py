@@ -0,0 +1,93 @@
+import hashlib
+import json
+import os
+import threading
+
+MANIFEST_PATH = os.path.join(".cache", "manifest.json")
+
+
+def hash_text(*parts):
+    """Hash one or more strings into a hex digest"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def page_output_path(folder, key, extension):
+    """Output path of the page with manifest key "<deck>/page<N>", like audio/<deck>/<deck>_page<N>.mp3"""
+    deck, page = key.rsplit("/", 1)
+    return os.path.join(folder, deck, f"{deck}_{page}.{extension}")
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """Hash a file's contents without loading it all into memory"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BuildManifest:
+    """
+    Records the hash of every input that went into each page-level output
+    (transcript page, MP3, MP4) so a later run can skip pages whose inputs
+    have not changed since the output was built.
+
+    Entries are stored per stage as {key: input_hash}, where key is usually
+    "<deck>/page<N>".
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                print(f"Could not read build manifest {path}, rebuilding everything")
+                self.entries = {}
+
+    def is_up_to_date(self, stage, key, input_hash, output_path=None):
+        """True if output_path exists and was built from exactly input_hash"""
+        if output_path is not None and not os.path.exists(output_path):
+            return False
+        with self._lock:
+            return self.entries.get(stage, {}).get(key) == input_hash
+
+    def record(self, stage, key, input_hash):
+        with self._lock:
+            self.entries.setdefault(stage, {})[key] = input_hash
+
+    def find_output(self, stage, input_hash, output_path_for):
+        """
+        Path of an existing output of stage that was built from input_hash, or None.
+        output_path_for(key) gives the output path of an entry. Lets a page reuse the
+        output of another page with exactly the same inputs.
+        """
+        with self._lock:
+            keys = [key for key, value in self.entries.get(stage, {}).items() if value == input_hash]
+        for key in keys:
+            path = output_path_for(key)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def forget(self, stage, key):
+        with self._lock:
+            self.entries.get(stage, {}).pop(key, None)
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(temp_path, self.path)
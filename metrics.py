@@ -0,0 +1,222 @@
+"""
+Per-stage timing, token and cost instrumentation.
+
+Wrap work in span() to time it:
+
+    with metrics.span("render", deck="Lecture 1", page=3):
+        ...
+
+Labels set with label_context() apply to every span opened inside it, also
+across asyncio tasks and executor threads that copy the context. Aggregates
+are written with write_reports() as a JSON run report and, optionally, a
+Prometheus text exposition file. With profiling enabled, the stages listed in
+PROFILED_STAGES are also run under cProfile and dumped to profiles/<stage>.prof.
+"""
+import contextvars
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+
+# USD per 1K tokens (prompt, completion)
+MODEL_PRICES = {
+    "gpt-3.5-turbo": (0.0005, 0.0015),
+}
+
+# Stages that run in this process and spend their time in Python (LLM requests mostly
+# wait on the network and video encoding runs in worker processes)
+PROFILED_STAGES = {"text_extraction", "tts", "render"}
+
+_labels = contextvars.ContextVar("metrics_labels", default={})
+_lock = threading.Lock()
+_profiling = threading.local()
+
+config = {
+    "report_path": os.getenv("METRICS_REPORT", "run_report.json"),
+    "prometheus_path": os.getenv("METRICS_PROMETHEUS") or None,
+    "profile": os.getenv("PROFILE", "0") == "1",
+    "profile_dir": "profiles",
+}
+
+_stages = {}
+_spans = []
+_tokens = {}
+_profiles = {}
+_run_started = time.time()
+
+
+def configure(report_path=None, prometheus_path=None, profile=None):
+    if report_path is not None:
+        config["report_path"] = report_path
+    if prometheus_path is not None:
+        config["prometheus_path"] = prometheus_path
+    if profile is not None:
+        config["profile"] = profile
+
+
+@contextmanager
+def label_context(**labels):
+    """Attach labels (deck, page...) to every span opened inside this block"""
+    token = _labels.set({**_labels.get(), **labels})
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def observe(stage, seconds, error=False, **labels):
+    """Record a span that was timed elsewhere (for example in a worker process)"""
+    labels = {**_labels.get(), **labels}
+    with _lock:
+        stats = _stages.setdefault(stage, {"count": 0, "errors": 0, "total_seconds": 0.0,
+                                           "min_seconds": None, "max_seconds": 0.0})
+        stats["count"] += 1
+        stats["errors"] += int(error)
+        stats["total_seconds"] += seconds
+        stats["min_seconds"] = seconds if stats["min_seconds"] is None else min(stats["min_seconds"], seconds)
+        stats["max_seconds"] = max(stats["max_seconds"], seconds)
+        _spans.append({"stage": stage, "seconds": round(seconds, 4), "error": error,
+                       **{key: value for key, value in labels.items() if value is not None}})
+
+
+@contextmanager
+def span(stage, **labels):
+    """Time the enclosed block as one span of stage"""
+    profiler = _start_profile(stage)
+    start = time.perf_counter()
+    error = False
+    try:
+        yield
+    except BaseException:
+        error = True
+        raise
+    finally:
+        observe(stage, time.perf_counter() - start, error, **labels)
+        _stop_profile(stage, profiler)
+
+
+def record_tokens(model, usage):
+    """Add the usage block of a chat completion response to the token and cost totals"""
+    if not usage:
+        return
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    prompt_tokens = usage.get("prompt_tokens", 0)
+    completion_tokens = usage.get("completion_tokens", 0)
+    with _lock:
+        totals = _tokens.setdefault(model, {"requests": 0, "prompt_tokens": 0,
+                                            "completion_tokens": 0, "cost_usd": 0.0})
+        totals["requests"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["completion_tokens"] += completion_tokens
+        totals["cost_usd"] += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+
+def _start_profile(stage):
+    # cProfile only sees the thread that enabled it, and only one profiler per thread
+    if not config["profile"] or stage not in PROFILED_STAGES or getattr(_profiling, "active", False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:  # Another profiler is already running
+        return None
+    _profiling.active = True
+    return profiler
+
+
+def _stop_profile(stage, profiler):
+    if profiler is None:
+        return
+    profiler.disable()
+    _profiling.active = False
+    with _lock:
+        if stage in _profiles:
+            _profiles[stage].add(profiler)
+        else:
+            _profiles[stage] = pstats.Stats(profiler)
+
+
+def report():
+    with _lock:
+        stages = {}
+        for stage, stats in _stages.items():
+            stages[stage] = {**stats, "mean_seconds": stats["total_seconds"] / stats["count"]}
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_run_started)),
+            "wall_seconds": round(time.time() - _run_started, 3),
+            "stages": stages,
+            "tokens": {model: dict(totals) for model, totals in _tokens.items()},
+            "spans": list(_spans),
+        }
+
+
+def prometheus_text():
+    lines = [
+        "# HELP smartstudy_stage_seconds_total Time spent in each pipeline stage",
+        "# TYPE smartstudy_stage_seconds_total counter",
+    ]
+    data = report()
+    for stage, stats in sorted(data["stages"].items()):
+        lines.append(f'smartstudy_stage_seconds_total{{stage="{stage}"}} {stats["total_seconds"]:.6f}')
+    lines += ["# HELP smartstudy_stage_spans_total Spans recorded per stage",
+              "# TYPE smartstudy_stage_spans_total counter"]
+    for stage, stats in sorted(data["stages"].items()):
+        lines.append(f'smartstudy_stage_spans_total{{stage="{stage}"}} {stats["count"]}')
+    lines += ["# HELP smartstudy_stage_errors_total Failed spans per stage",
+              "# TYPE smartstudy_stage_errors_total counter"]
+    for stage, stats in sorted(data["stages"].items()):
+        lines.append(f'smartstudy_stage_errors_total{{stage="{stage}"}} {stats["errors"]}')
+    lines += ["# HELP smartstudy_llm_tokens_total Tokens used per model and kind",
+              "# TYPE smartstudy_llm_tokens_total counter"]
+    for model, totals in sorted(data["tokens"].items()):
+        lines.append(f'smartstudy_llm_tokens_total{{model="{model}",kind="prompt"}} {totals["prompt_tokens"]}')
+        lines.append(f'smartstudy_llm_tokens_total{{model="{model}",kind="completion"}} {totals["completion_tokens"]}')
+    lines += ["# HELP smartstudy_llm_cost_usd_total Estimated API cost",
+              "# TYPE smartstudy_llm_cost_usd_total counter"]
+    for model, totals in sorted(data["tokens"].items()):
+        lines.append(f'smartstudy_llm_cost_usd_total{{model="{model}"}} {totals["cost_usd"]:.6f}')
+    return "\n".join(lines) + "\n"
+
+
+def write_reports():
+    """Write the JSON run report, the Prometheus file and profiles, whichever are configured"""
+    if not _stages:
+        return
+    if config["report_path"]:
+        with open(config["report_path"], 'w', encoding='utf-8') as f:
+            json.dump(report(), f, indent=2)
+        print(f"Run report written to {config['report_path']}")
+    if config["prometheus_path"]:
+        with open(config["prometheus_path"], 'w', encoding='utf-8') as f:
+            f.write(prometheus_text())
+        print(f"Prometheus metrics written to {config['prometheus_path']}")
+    if _profiles:
+        os.makedirs(config["profile_dir"], exist_ok=True)
+        with _lock:
+            for stage, stats in _profiles.items():
+                stats.dump_stats(os.path.join(config["profile_dir"], f"{stage}.prof"))
+        print(f"cProfile output written to {config['profile_dir']}/")
+
+
+def print_summary():
+    data = report()
+    print("\nStage timings:")
+    for stage, stats in sorted(data["stages"].items()):
+        print(f"  {stage:<16} {stats['count']:>5} spans  {stats['total_seconds']:>9.2f}s total  "
+              f"{stats['mean_seconds']:>7.3f}s mean  {stats['errors']} errors")
+    for model, totals in data["tokens"].items():
+        print(f"  {model}: {totals['prompt_tokens']} prompt + {totals['completion_tokens']} completion tokens, "
+              f"~${totals['cost_usd']:.4f}")
+
+
+def reset():
+    global _run_started
+    with _lock:
+        _stages.clear()
+        _spans.clear()
+        _tokens.clear()
+        _profiles.clear()
+    _run_started = time.time()
@@ -0,0 +1,418 @@
+"""
+Streaming lecture pipeline.
+
+Every page moves through explanation -> audio -> clip as soon as its upstream
+result exists, instead of each stage waiting for the previous one to finish
+all decks:
+
+    LLM requests (asyncio, own thread) -> audio queue -> TTS (calling thread)
+        -> clip queue -> render + encode (worker processes)
+
+With LLM_STREAM (the default) the responses are streamed and every sentence
+goes down the audio queue as soon as it is written. TTS starts on it right
+away and joins the page's sentences once the whole explanation arrives, so the
+first audio exists after the first sentence rather than the whole response.
+
+The queues are bounded, so a stage that falls behind holds back the stages
+feeding it rather than letting finished pages pile up in memory. If the audio
+stage fails the run is cancelled: the explanation stage stops instead of
+waiting on a queue nobody reads, and run() returns with the failure. TTS runs on
+the thread that called run() because the pyttsx3 drivers are tied to the
+thread that created the engine.
+"""
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import nullcontext
+from pathlib import Path
+
+import ai
+import metrics
+from dedup import DEDUP
+from audio_meta import audio_complete, remove_audio
+from journal import PageJournal
+from manifest import BuildManifest, hash_text
+from render import PageRenderer
+from voice import get_synthesizer, join_parts, reuse_audio, synthesize_distinct, TTS_RATE, TTS_SETTINGS
+from video import encode_clip, plan_clip, collect_clip, copy_clip, VIDEO_WORKERS, VIDEO_MAX_IN_FLIGHT
+from lecture import assemble_lectures, failed_decks, FULL_LECTURE, FULL_LECTURE_DIR
+
+# Pages that may wait between two stages before the upstream stage blocks
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))
+
+# End-of-stream marker passed down the queues
+_DONE = object()
+
+
+class PipelineCancelled(RuntimeError):
+    """Raised in the explanation stage when the stage it feeds has failed"""
+
+
+class LecturePipeline:
+    """
+    Builds transcripts, audio and page clips for every PDF in pdf_folder with
+    the three stages running at the same time. Pages that are up to date in
+    the build manifest pass through a stage without being rebuilt.
+
+        LecturePipeline("PDF").run()
+
+    pdf_paths limits the run to some of the PDFs, and pool reuses an existing
+    process pool for encoding instead of starting one. stream=False waits for
+    complete responses instead of narrating sentences as they are written.
+    Once every clip of a deck is encoded they are joined into one video in
+    lecture_dir, unless full_lecture is False.
+
+    Explanations and MP3s are journaled page by page (see journal.py) until the
+    run finishes. resume=True keeps the pages an interrupted run finished.
+    """
+
+    def __init__(self, pdf_folder="PDF", transcripts_folder="Transcripts", audio_dir="audio",
+                 video_dir="Short-Form-Videos", manifest=None, max_concurrency=ai.MAX_CONCURRENT_REQUESTS,
+                 workers=None, max_in_flight=None, queue_size=PIPELINE_QUEUE_SIZE, pdf_paths=None, pool=None,
+                 stream=ai.LLM_STREAM, full_lecture=FULL_LECTURE, lecture_dir=FULL_LECTURE_DIR, resume=False):
+        self.pdf_folder = pdf_folder
+        self.transcripts_folder = transcripts_folder
+        self.audio_dir = audio_dir
+        self.video_dir = video_dir
+        self.manifest = manifest if manifest is not None else BuildManifest()
+        self.max_concurrency = max_concurrency
+        self.workers = workers or VIDEO_WORKERS
+        self.max_in_flight = max(max_in_flight or VIDEO_MAX_IN_FLIGHT, self.workers)
+        self.audio_queue = queue.Queue(maxsize=queue_size)
+        self.clip_queue = queue.Queue(maxsize=queue_size)
+        self.pdf_paths = pdf_paths
+        self.pool = pool
+        self.stream = stream
+        self.full_lecture = full_lecture
+        self.lecture_dir = lecture_dir
+        self.resume = resume
+        # Audio journal of every deck in the run and the pages journaled by an interrupted run,
+        # {pdf_name: PageJournal} and {pdf_name: {page_num: entry}}
+        self._audio_journals = {}
+        self._journaled_audio = {}
+        self.succeeded = []
+        self.failed = []
+        # Sentence parts synthesized so far for pages whose explanation is still streaming,
+        # {(pdf_path, page_num): [(sentence, part_file, future)]}
+        self._streamed = {}
+        self._start = None
+        self.first_audio = None
+        self._cancelled = threading.Event()
+
+    def run(self):
+        """Run all three stages and return (succeeded, failed) like main.run_video_jobs"""
+        for folder in (self.transcripts_folder, self.audio_dir, self.video_dir):
+            os.makedirs(folder, exist_ok=True)
+        pdf_paths = self.pdf_paths or ai.list_decks(self.pdf_folder)
+        self._open_audio_journals(pdf_paths)
+        self._start = time.perf_counter()
+
+        producer = threading.Thread(target=self._explain, args=(pdf_paths,), name="pipeline-llm", daemon=True)
+        encoder = threading.Thread(target=self._encode, name="pipeline-video", daemon=True)
+        producer.start()
+        encoder.start()
+        try:
+            self._synthesize()
+        except Exception as e:
+            print(f"Error creating audio: {str(e)}")
+            self.failed.append(("audio stage", str(e)))
+            self._cancelled.set()
+        finally:
+            self.clip_queue.put(_DONE)
+            encoder.join()
+        producer.join()
+
+        if self.full_lecture:
+            self.failed += assemble_lectures(pdf_paths, self.video_dir, self.lecture_dir, self.manifest,
+                                             skip=failed_decks(self.failed))
+        self.manifest.save()
+        # The manifest now has every page the audio journals recorded
+        for journal in self._audio_journals.values():
+            journal.discard()
+        print(f"AI response {ai.response_cache.stats()}")
+        print(f"API {ai.scheduler.stats()}")
+        return self.succeeded, self.failed
+
+    def _put_audio(self, item):
+        """Put item on the audio queue, waiting while it is full unless the run is cancelled"""
+        while not self._cancelled.is_set():
+            try:
+                self.audio_queue.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                pass
+        raise PipelineCancelled("the audio stage failed")
+
+    def _open_audio_journals(self, pdf_paths):
+        for pdf_path in pdf_paths:
+            pdf_name = Path(pdf_path).stem
+            journal = PageJournal("audio", pdf_name)
+            if self.resume:
+                self._journaled_audio[pdf_name] = journal.entries()
+            elif journal.exists():
+                print(f"Discarding the audio journal of an interrupted run of {pdf_name} (use --resume to keep it)")
+                journal.discard()
+            self._audio_journals[pdf_name] = journal
+
+    # Stage 1: explanations, on an event loop in the producer thread
+
+    def _explain(self, pdf_paths):
+        shared = None
+
+        async def run_all(limiter):
+            decks = asyncio.gather(*(self._explain_deck(pdf_path, limiter, shared) for pdf_path in pdf_paths),
+                                   return_exceptions=True)
+            # Requests still waiting are dropped once the run is cancelled, their pages have nowhere to go
+            while not decks.done():
+                if self._cancelled.is_set():
+                    decks.cancel()
+                    break
+                await asyncio.wait({decks}, timeout=0.2)
+            try:
+                results = await decks
+            except asyncio.CancelledError:
+                return
+            for pdf_path, result in zip(pdf_paths, results):
+                if isinstance(result, PipelineCancelled):
+                    continue
+                if isinstance(result, Exception):
+                    print(f"Error creating transcript for {pdf_path}: {result}")
+                    self.failed.append((Path(pdf_path).stem, f"transcript failed: {result}"))
+
+        try:
+            if DEDUP:
+                shared = ai.SharedExplanations.build(pdf_paths, self.transcripts_folder, self.manifest)
+            asyncio.run(ai.run_with_limit(run_all, self.max_concurrency))
+            if shared:
+                print(f"Explanations {shared.stats()}")
+        finally:
+            try:
+                self._put_audio(_DONE)
+            except PipelineCancelled:
+                pass
+
+    async def _explain_deck(self, pdf_path, limiter, shared=None):
+        loop = asyncio.get_running_loop()
+
+        async def on_page(page_num, explanation):
+            # Waits off the event loop while the audio queue is full
+            await loop.run_in_executor(None, self._put_audio, (pdf_path, page_num, explanation, True))
+
+        def on_sentence(page_num, sentence):
+            # Called on the request's worker thread, so it can wait here
+            self._put_audio((pdf_path, page_num, sentence, False))
+
+        await ai.brainrot_deck_async(pdf_path, self.transcripts_folder, limiter, self.manifest, on_page,
+                                     on_sentence if self.stream else None, shared, self.resume)
+
+    # Stage 2: speech, on the calling thread
+
+    def _synthesize(self):
+        synthesizer = get_synthesizer(rate=TTS_RATE)
+        finished = False
+        try:
+            while not finished:
+                batch = []
+                item = self.audio_queue.get()
+                # Synthesize whatever else is already waiting in the same engine cycle,
+                # without holding back the first page for more to arrive
+                while True:
+                    if item is _DONE:
+                        finished = True
+                        break
+                    if item[3]:
+                        batch.append(item[:3])
+                    else:
+                        self._synthesize_sentence(synthesizer, *item[:3])
+                    if len(batch) >= synthesizer.batch_size:
+                        break
+                    try:
+                        item = self.audio_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                self._synthesize_batch(synthesizer, batch)
+        finally:
+            # Sentences of pages whose request failed part way
+            for parts in self._streamed.values():
+                self._discard_parts(parts)
+            self._streamed.clear()
+
+    def _audio_path(self, pdf_path, page_num):
+        pdf_name = Path(pdf_path).stem
+        return os.path.join(self.audio_dir, pdf_name, f"{pdf_name}_page{page_num}.mp3")
+
+    def _synthesize_sentence(self, synthesizer, pdf_path, page_num, sentence):
+        parts = self._streamed.setdefault((pdf_path, page_num), [])
+        output_mp3 = self._audio_path(pdf_path, page_num)
+        os.makedirs(os.path.dirname(output_mp3), exist_ok=True)
+        # pyttsx3 writes WAV data, name the parts accordingly
+        part_file = f"{output_mp3}.stream{len(parts)}.wav"
+        try:
+            future = synthesizer.submit_part(sentence, part_file)
+        except Exception as e:
+            print(f"Error creating audio: {str(e)}")
+            return
+        future.add_done_callback(lambda _: self._audio_written())
+        parts.append((sentence, part_file, future))
+
+    def _audio_written(self):
+        if self.first_audio is None:
+            self.first_audio = time.perf_counter() - self._start
+            metrics.observe("first_audio", self.first_audio)
+            print(f"First audio after {self.first_audio:.2f}s")
+
+    def _discard_parts(self, parts):
+        wait([future for _, _, future in parts])
+        for _, part_file, _ in parts:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+
+    def _join_streamed(self, parts, text, output_mp3):
+        """Join the streamed sentence parts of a page into output_mp3 if they make up the whole text"""
+        streamed_text = " ".join(sentence for sentence, _, _ in parts)
+        if streamed_text.split() != text.split() or any(future.exception() for _, _, future in parts):
+            self._discard_parts(parts)
+            return False
+        remove_audio(output_mp3)
+        return join_parts([part_file for _, part_file, _ in parts], output_mp3)
+
+    def _synthesize_batch(self, synthesizer, batch):
+        to_build = []
+        for pdf_path, page_num, text in batch:
+            parts = self._streamed.pop((pdf_path, page_num), None)
+            if not text.strip():
+                continue
+            pdf_name = Path(pdf_path).stem
+            output_mp3 = self._audio_path(pdf_path, page_num)
+            manifest_key = f"{pdf_name}/page{page_num}"
+            input_hash = hash_text(TTS_SETTINGS, text)
+            journaled = self._journaled_audio.get(pdf_name, {}).get(page_num, {})
+            if self.manifest.is_up_to_date("audio", manifest_key, input_hash, output_mp3) or (
+                    journaled.get("hash") == input_hash and audio_complete(output_mp3)):
+                if parts:
+                    self._discard_parts(parts)
+                self.manifest.record("audio", manifest_key, input_hash)
+                self.clip_queue.put((pdf_path, page_num, output_mp3))
+                continue
+            os.makedirs(os.path.dirname(output_mp3), exist_ok=True)
+            # A page that says exactly what another page said gets a copy of its audio
+            source = reuse_audio(self.manifest, self.audio_dir, output_mp3, input_hash)
+            if source:
+                if parts:
+                    self._discard_parts(parts)
+                print(f"Audio for {pdf_name} page {page_num} repeats {source}, copied")
+                self._audio_done(pdf_path, page_num, output_mp3, manifest_key, input_hash)
+                continue
+            if parts and self._join_streamed(parts, text, output_mp3):
+                self._audio_done(pdf_path, page_num, output_mp3, manifest_key, input_hash)
+                continue
+            to_build.append((pdf_path, page_num, text, output_mp3, manifest_key, input_hash))
+        if not to_build:
+            return
+
+        try:
+            written = set(synthesize_distinct(
+                synthesizer, [(text, output_mp3) for _, _, text, output_mp3, _, _ in to_build]))
+        except Exception as e:
+            print(f"Error creating audio: {str(e)}")
+            written = set()
+
+        for pdf_path, page_num, _, output_mp3, manifest_key, input_hash in to_build:
+            if output_mp3 in written:
+                self._audio_written()
+                self._audio_done(pdf_path, page_num, output_mp3, manifest_key, input_hash)
+            else:
+                self.failed.append((f"{Path(pdf_path).stem} page {page_num}", "no audio written"))
+
+    def _audio_done(self, pdf_path, page_num, output_mp3, manifest_key, input_hash):
+        print(f"Created audio: {output_mp3}")
+        self._audio_journals[Path(pdf_path).stem].append(page_num, input_hash)
+        self.manifest.record("audio", manifest_key, input_hash)
+        self.clip_queue.put((pdf_path, page_num, output_mp3))
+
+    # Stage 3: render in the encoder thread, encode in worker processes
+
+    def _encode(self):
+        renderers = {}
+        pending = {}
+        # Clips with the same image and audio as an earlier clip are copied from it after the encoding,
+        # {input_hash: (first job, error or None once it finished)}
+        encoded = {}
+        copies = []
+
+        def collect(futures):
+            for future in futures:
+                job = pending.pop(future)
+                error = collect_clip(future, job, self.manifest)
+                encoded[job["input_hash"]] = (job, error)
+                if error is None:
+                    self.succeeded.append(job["label"])
+                else:
+                    self.failed.append((job["label"], error))
+
+        def copy(job):
+            source, error = encoded[job["input_hash"]]
+            error = error or copy_clip(source["video_path"], job, self.manifest)
+            if error is None:
+                self.succeeded.append(job["label"])
+            else:
+                self.failed.append((job["label"], error))
+
+        finished = False
+        try:
+            with (nullcontext(self.pool) if self.pool else ProcessPoolExecutor(max_workers=self.workers)) as pool:
+                while True:
+                    try:
+                        # Poll while clips are encoding so they are reported as they finish
+                        item = self.clip_queue.get(timeout=0.5 if pending else None)
+                    except queue.Empty:
+                        collect([future for future in pending if future.done()])
+                        continue
+                    if item is _DONE:
+                        finished = True
+                        break
+
+                    job = self._plan_clip(renderers, *item)
+                    if job is None:
+                        continue
+                    if job["input_hash"] in encoded:
+                        copies.append(job)
+                        continue
+                    encoded[job["input_hash"]] = (job, None)
+                    while len(pending) >= self.max_in_flight:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        collect(done)
+                    future = pool.submit(encode_clip, job["image_path"], job["audio_path"], job["video_path"])
+                    pending[future] = job
+
+                while pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+            for job in copies:
+                copy(job)
+        except Exception as e:
+            print(f"Error creating videos: {str(e)}")
+            self.failed.append(("video stage", str(e)))
+            # Keep draining so the audio stage never blocks on a full queue, unless it already finished
+            while not finished:
+                finished = self.clip_queue.get() is _DONE
+        finally:
+            for renderer in renderers.values():
+                renderer.close()
+
+    def _plan_clip(self, renderers, pdf_path, page_num, audio_path):
+        pdf_name = Path(pdf_path).stem
+        try:
+            # Each PDF is opened once and kept open for the rest of the run
+            if pdf_path not in renderers:
+                renderers[pdf_path] = PageRenderer(pdf_path)
+                os.makedirs(os.path.join(self.video_dir, pdf_name), exist_ok=True)
+            img_path = renderers[pdf_path].render(page_num - 1)
+        except Exception as e:
+            print(f"Failed to extract page {page_num} from {pdf_name}: {str(e)}")
+            self.failed.append((f"{pdf_name} page {page_num}", f"page extraction failed: {str(e)}"))
+            return None
+        return plan_clip(pdf_name, page_num, img_path, audio_path, self.video_dir, self.manifest)
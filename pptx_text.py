@@ -0,0 +1,163 @@
+"""
+Slide text straight from a .pptx file, without converting it to PDF first.
+
+A .pptx is a zip of XML parts. iter_slides() walks the slides in
+presentation order and yields (page_num, text) like
+text_index.PageTextIndex.non_empty(), reading one slide at a time. Titles
+come first, bullets are indented by their outline level, tables are written
+a row per line and the speaker notes follow the slide text.
+
+Hidden slides are skipped by default since the default PDF export leaves
+them out, so page N here is page N of the PDF.
+"""
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+
+NS = {
+    "p": "http://schemas.openxmlformats.org/presentationml/2006/main",
+    "a": "http://schemas.openxmlformats.org/drawingml/2006/main",
+    "r": "http://schemas.openxmlformats.org/officeDocument/2006/relationships",
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+NOTES_REL_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+TITLE_PLACEHOLDERS = {"title", "ctrTitle"}
+# Placeholders that repeat on every slide and say nothing about its content
+SKIPPED_PLACEHOLDERS = {"sldNum", "dt", "ftr", "hdr", "sldImg"}
+
+
+def _relationships(archive, part):
+    """{relationship id: (type, target part)} for a part of the package"""
+    folder, name = posixpath.split(part)
+    try:
+        rels_xml = archive.read(posixpath.join(folder, "_rels", f"{name}.rels"))
+    except KeyError:
+        return {}
+    rels = {}
+    for rel in ET.fromstring(rels_xml).findall("rel:Relationship", NS):
+        target = rel.get("Target")
+        # Targets are relative to the part's folder, or to the package root when they start with /
+        if target.startswith("/"):
+            target = posixpath.normpath(target.lstrip("/"))
+        else:
+            target = posixpath.normpath(posixpath.join(folder, target))
+        rels[rel.get("Id")] = (rel.get("Type"), target)
+    return rels
+
+
+def _slide_parts(archive):
+    """Slide part names in presentation order"""
+    presentation = ET.fromstring(archive.read("ppt/presentation.xml"))
+    rels = _relationships(archive, "ppt/presentation.xml")
+    return [rels[slide_id.get(f"{{{NS['r']}}}id")][1]
+            for slide_id in presentation.findall("p:sldIdLst/p:sldId", NS)]
+
+
+def _paragraph_text(paragraph):
+    # Line breaks inside a paragraph become spaces
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == f"{{{NS['a']}}}t":
+            parts.append(node.text or "")
+        elif node.tag == f"{{{NS['a']}}}br":
+            parts.append(" ")
+    return "".join(parts).strip()
+
+
+def _placeholder_type(shape):
+    placeholder = shape.find("p:nvSpPr/p:nvPr/p:ph", NS)
+    if placeholder is None:
+        return None
+    # A placeholder without a type is a body placeholder
+    return placeholder.get("type", "body")
+
+
+def _shape_lines(shape, bulleted):
+    lines = []
+    for paragraph in shape.findall("p:txBody/a:p", NS):
+        text = _paragraph_text(paragraph)
+        if not text:
+            continue
+        properties = paragraph.find("a:pPr", NS)
+        level = int(properties.get("lvl", "0")) if properties is not None else 0
+        no_bullet = properties is not None and properties.find("a:buNone", NS) is not None
+        prefix = "- " if bulleted and not no_bullet else ""
+        lines.append("  " * level + prefix + text)
+    return lines
+
+
+def _table_lines(frame):
+    lines = []
+    for row in frame.iter(f"{{{NS['a']}}}tr"):
+        cells = [" ".join(filter(None, (_paragraph_text(p) for p in cell.iter(f"{{{NS['a']}}}p"))))
+                 for cell in row.findall("a:tc", NS)]
+        if any(cells):
+            lines.append(" | ".join(cells))
+    return lines
+
+
+def _tree_lines(tree, titles, body, notes_only=False):
+    """Collect the text of every shape in a shape tree, recursing into groups"""
+    for child in tree:
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "grpSp":
+            _tree_lines(child, titles, body, notes_only)
+        elif tag == "sp":
+            placeholder = _placeholder_type(child)
+            if notes_only:
+                if placeholder == "body":
+                    body.extend(_shape_lines(child, bulleted=False))
+            elif placeholder in TITLE_PLACEHOLDERS:
+                titles.extend(_shape_lines(child, bulleted=False))
+            elif placeholder not in SKIPPED_PLACEHOLDERS:
+                # Body placeholders have bullets from the layout, plain text boxes don't
+                body.extend(_shape_lines(child, bulleted=placeholder in ("body", "obj")))
+        elif tag == "graphicFrame" and not notes_only:
+            body.extend(_table_lines(child))
+
+
+def _slide_text(archive, slide_part, include_notes, include_hidden):
+    """Text of one slide, or None for a hidden slide that is left out"""
+    slide = ET.fromstring(archive.read(slide_part))
+    if slide.get("show") == "0" and not include_hidden:
+        return None
+    titles, body = [], []
+    _tree_lines(slide.find("p:cSld/p:spTree", NS), titles, body)
+    text = "\n".join(titles + body)
+
+    if include_notes:
+        notes_parts = [target for rel_type, target in _relationships(archive, slide_part).values()
+                       if rel_type == NOTES_REL_TYPE]
+        if notes_parts:
+            notes = []
+            _tree_lines(ET.fromstring(archive.read(notes_parts[0])).find("p:cSld/p:spTree", NS),
+                        [], notes, notes_only=True)
+            if notes:
+                text += ("\n\n" if text else "") + "Speaker notes:\n" + "\n".join(notes)
+    return text
+
+
+def iter_slides(pptx_path, include_notes=True, include_hidden=False):
+    """
+    Yield (page_num, text) for every slide with text, reading slides only as they are requested.
+    Pages are numbered from 1 over the slides that appear in the PDF.
+    """
+    with zipfile.ZipFile(pptx_path) as archive:
+        page_num = 0
+        for slide_part in _slide_parts(archive):
+            text = _slide_text(archive, slide_part, include_notes, include_hidden)
+            if text is None:
+                continue
+            page_num += 1
+            if text.strip():
+                yield page_num, text
+
+
+def count_slides(pptx_path, include_hidden=False):
+    """Number of slides (pages of the exported PDF), including those without text"""
+    with zipfile.ZipFile(pptx_path) as archive:
+        if include_hidden:
+            return len(_slide_parts(archive))
+        return sum(1 for slide_part in _slide_parts(archive)
+                   if ET.fromstring(archive.read(slide_part)).get("show") != "0")
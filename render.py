@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+import fitz  # PyMuPDF for PDF handling
+from manifest import hash_file
+import metrics
+
+# Slides are only ever shown at video resolution, so render straight to it
+VIDEO_SIZE = (1920, 1080)
+RENDER_CACHE_DIR = os.path.join(".cache", "rendered_pages")
+
+
+class PageRenderer:
+    """
+    Opens a PDF once and renders its pages as PNGs that fit inside target_size.
+
+    Rendered pages are kept in cache_dir/<deck>/ and reused by later runs as
+    long as the PDF and target size are unchanged. Use as a context manager so
+    the document is closed when done:
+
+        with PageRenderer(pdf_path) as renderer:
+            img_path = renderer.render(0)
+    """
+
+    def __init__(self, pdf_path, target_size=VIDEO_SIZE, cache_dir=RENDER_CACHE_DIR):
+        self.pdf_path = pdf_path
+        self.target_size = target_size
+        self.deck_cache_dir = os.path.join(cache_dir, Path(pdf_path).stem)
+        self.pdf_hash = hash_file(pdf_path)[:16]
+        self._doc = None
+        os.makedirs(self.deck_cache_dir, exist_ok=True)
+        self._prune_stale()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def doc(self):
+        # Only open the document when a page actually needs rendering
+        if self._doc is None:
+            self._doc = fitz.open(self.pdf_path)
+        return self._doc
+
+    def _cache_suffix(self):
+        width, height = self.target_size
+        return f"_{width}x{height}_{self.pdf_hash}.png"
+
+    def _prune_stale(self):
+        """Remove renders of older versions of this PDF or other target sizes"""
+        suffix = self._cache_suffix()
+        for name in os.listdir(self.deck_cache_dir):
+            if name.endswith('.png') and not name.endswith(suffix):
+                os.remove(os.path.join(self.deck_cache_dir, name))
+
+    def cached_path(self, page_number):
+        return os.path.join(self.deck_cache_dir, f"page{page_number + 1}{self._cache_suffix()}")
+
+    def render(self, page_number):
+        """Return the path of a PNG of page_number (0-based), rendering it only if not cached"""
+        output_path = self.cached_path(page_number)
+        if os.path.exists(output_path):
+            return output_path
+
+        with metrics.span("render", deck=Path(self.pdf_path).stem, page=page_number + 1):
+            page = self.doc[page_number]
+            width, height = self.target_size
+            zoom = min(width / page.rect.width, height / page.rect.height)
+            pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+
+            # Write to a temp name first so an interrupted run never leaves a truncated cache entry
+            temp_path = f"{output_path}.tmp.png"
+            pix.save(temp_path)
+            os.replace(temp_path, output_path)
+        return output_path
+
+    def close(self):
+        if self._doc is not None:
+            self._doc.close()
+            self._doc = None
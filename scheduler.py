@@ -0,0 +1,188 @@
+"""
+Rate-limit-aware admission for API requests.
+
+Every request takes a slot from the RequestScheduler before it is sent:
+
+    with scheduler.slot(estimated_tokens) as slot:
+        response = session.post(...)
+        slot.record(response.status_code, response.headers, used_tokens)
+
+A slot is only handed out while
+- fewer than `limit` requests are in flight. The limit is adapted AIMD style:
+  +1/limit per success (about +1 per round trip), halved on a 429 or 503.
+- starts are at least 60/RPM seconds apart and the tokens started in the last
+  minute stay under the TPM budget. Providers enforce a per-minute limit over
+  shorter periods, so a whole minute's requests sent at once still get 429s.
+  The budgets come from LLM_RPM/LLM_TPM or the x-ratelimit-limit-* headers.
+- the server hasn't said it is out of requests or tokens
+  (x-ratelimit-remaining-*) or asked to wait (retry-after).
+"""
+import random
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Status codes worth retrying, anything else is final
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# Status codes that mean we are sending too fast
+THROTTLE_STATUS = {429, 503}
+
+
+def parse_duration(value):
+    """Seconds in a rate limit header value: "1.5", "20ms", "6m0s", "1h2m3.5s". None if unparsable."""
+    if value is None:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts or "".join(number + unit for number, unit in parts) != value:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def _header_int(headers, name):
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class _Slot:
+    def __init__(self, scheduler, window_entry):
+        self.scheduler = scheduler
+        self.window_entry = window_entry
+        self.retry_after = None
+
+    def record(self, status, headers=None, used_tokens=None):
+        """Report the outcome of the request (status None for a connection error)"""
+        self.retry_after = self.scheduler._record(status, headers or {}, used_tokens, self.window_entry)
+
+
+class RequestScheduler:
+    def __init__(self, max_concurrency=8, initial_concurrency=None, rpm=None, tpm=None,
+                 backoff_base=1.0, backoff_cap=60.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(min(initial_concurrency or self.max_concurrency, self.max_concurrency))
+        self.rpm = rpm
+        self.tpm = tpm
+        self._configured = (rpm is not None, tpm is not None)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.in_flight = 0
+        self._window = deque()  # [start time, tokens] of requests started in the last minute
+        self._resume_at = 0.0
+        self._last_decrease = 0.0
+        self._remaining_requests = None
+        self._remaining_tokens = None
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._condition = threading.Condition()
+        self._random = random.Random()
+        self.counts = {"requests": 0, "throttled": 0, "failed": 0}
+
+    @contextmanager
+    def slot(self, tokens=0):
+        """Wait until a request of about `tokens` tokens may start, and hold a slot while it runs"""
+        slot = _Slot(self, self._acquire(tokens))
+        try:
+            yield slot
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def _wait_time(self, tokens, now):
+        """Seconds until the request may start, 0 if it may start now"""
+        while self._window and now - self._window[0][0] >= 60:
+            self._window.popleft()
+        # Server-reported budgets are only valid until their reset time
+        if now >= self._requests_reset_at:
+            self._remaining_requests = None
+        if now >= self._tokens_reset_at:
+            self._remaining_tokens = None
+        waits = [self._resume_at - now]
+        if self.rpm and self._window:
+            waits.append(self._window[-1][0] + 60 / self.rpm - now)
+        if self.tpm and self._window and sum(t for _, t in self._window) + tokens > self.tpm:
+            waits.append(self._window[0][0] + 60 - now)
+        if self._remaining_requests is not None and self._remaining_requests <= 0:
+            waits.append(self._requests_reset_at - now)
+        if self._remaining_tokens is not None and self._remaining_tokens < tokens:
+            waits.append(self._tokens_reset_at - now)
+        return max(waits)
+
+    def _acquire(self, tokens):
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                # Woken early when a slot frees up or a response updates the budgets
+                self._condition.wait(timeout=wait if wait > 0 else None)
+            self.in_flight += 1
+            self.counts["requests"] += 1
+            entry = [now, tokens]
+            self._window.append(entry)
+            if self._remaining_requests is not None:
+                self._remaining_requests -= 1
+            if self._remaining_tokens is not None:
+                self._remaining_tokens -= tokens
+            return entry
+
+    def _record(self, status, headers, used_tokens, window_entry):
+        headers = {name.lower(): value for name, value in headers.items()}
+        now = time.monotonic()
+        with self._condition:
+            # Budgets the server tells us about, unless they were set explicitly
+            limit_requests = _header_int(headers, "x-ratelimit-limit-requests")
+            limit_tokens = _header_int(headers, "x-ratelimit-limit-tokens")
+            if limit_requests and not self._configured[0]:
+                self.rpm = limit_requests
+            if limit_tokens and not self._configured[1]:
+                self.tpm = limit_tokens
+
+            remaining_requests = _header_int(headers, "x-ratelimit-remaining-requests")
+            if remaining_requests is not None:
+                self._remaining_requests = remaining_requests
+                self._requests_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-requests")) or 1.0)
+            remaining_tokens = _header_int(headers, "x-ratelimit-remaining-tokens")
+            if remaining_tokens is not None:
+                self._remaining_tokens = remaining_tokens
+                self._tokens_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-tokens")) or 1.0)
+
+            # Replace the estimate with the real usage for the TPM window
+            if used_tokens is not None:
+                window_entry[1] = used_tokens
+
+            retry_after = parse_duration(headers.get("retry-after"))
+            if status in THROTTLE_STATUS:
+                self.counts["throttled"] += 1
+                # Requests sent before the last decrease saw the old limit, one burst halves it once
+                if window_entry[0] >= self._last_decrease:
+                    self.limit = max(1.0, self.limit / 2)
+                    self._last_decrease = now
+                if retry_after:
+                    self._resume_at = max(self._resume_at, now + retry_after)
+            elif status is not None and status < 400:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            else:
+                self.counts["failed"] += 1
+            self._condition.notify_all()
+        return retry_after
+
+    def backoff(self, attempt, retry_after=None):
+        """Jittered exponential backoff for retry number `attempt` (0-based), at least retry_after"""
+        delay = self._random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def stats(self):
+        with self._condition:
+            return (f"requests: {self.counts['requests']}, throttled: {self.counts['throttled']}, "
+                    f"failed: {self.counts['failed']}, concurrency limit: {self.limit:.1f}")
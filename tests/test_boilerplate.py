@@ -0,0 +1,34 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from boilerplate import normalize_line, strip_boilerplate
+
+
+def test_normalize_line_keeps_numbers():
+    assert normalize_line("  Slide 3   of 40 ") == "slide 3 of 40"
+
+
+def test_strip_boilerplate_removes_headers_and_footers_only():
+    pages = []
+    for page_num in range(1, 9):
+        body = f"Topic {(page_num + 1) // 2}\nThe war began in\n1914\nand ended in\n1918\nNotes"
+        pages.append((page_num, f"BIO 101 - Fall 2024\n{body}\nSlide {page_num} of 8\n{page_num + 2}"))
+    cleaned, stats = strip_boilerplate(pages)
+
+    assert [page_num for page_num, _ in cleaned] == list(range(1, 9))
+    for page_num, text in cleaned:
+        assert text.splitlines() == [f"Topic {(page_num + 1) // 2}", "The war began in", "1914",
+                                     "and ended in", "1918", "Notes"]
+    assert stats["lines_removed"] == 8 * 3
+    assert stats["boilerplate"] == ["#", "bio 101 - fall 2024", "slide # of #"]
+
+
+def test_numbers_repeated_at_page_edges_are_kept():
+    battles = ["Marne", "Ypres", "Verdun", "Somme", "Jutland", "Gallipoli", "Tannenberg"]
+    pages = [(page_num, f"Year\n1914\n{battle}\n1918") for page_num, battle in enumerate(battles, start=1)]
+    cleaned, stats = strip_boilerplate(pages)
+
+    assert [text for _, text in cleaned] == [f"1914\n{battle}\n1918" for battle in battles]
+    assert stats["boilerplate"] == ["year"]
@@ -0,0 +1,17 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import ResponseCache
+
+
+def test_overwriting_an_entry_keeps_the_size_estimate(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_bytes=10_000)
+    cache.put("first", {"text": "x" * 100})
+    cache.put("second", {"text": "y" * 100})
+    for _ in range(50):
+        cache.put("second", {"text": "z" * 100})
+
+    assert cache._total_bytes == cache._scan_size()
+    assert cache.get("first") == {"text": "x" * 100}
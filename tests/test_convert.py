@@ -0,0 +1,13 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from convert import ConversionError, get_converter
+
+
+def test_unknown_backend_is_a_conversion_error():
+    with pytest.raises(ConversionError, match="CONVERTER_BACKEND"):
+        get_converter("keynote")
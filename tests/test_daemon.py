@@ -0,0 +1,63 @@
+import json
+import os
+import stat
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import daemon
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    server = daemon.open_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    daemon.close_server(server)
+
+
+def test_daemon_files_are_private(server):
+    assert stat.S_IMODE(os.stat(daemon.DAEMON_DIR).st_mode) == 0o700
+    assert stat.S_IMODE(os.stat(os.path.join(daemon.DAEMON_DIR, "daemon.json")).st_mode) == 0o600
+    assert daemon.is_running()
+
+
+def test_requests_need_the_token(server):
+    info = daemon.read_info()
+    with daemon._connect(info["address"], timeout=5) as conn:
+        conn.sendall(b'{"command": "stop", "token": "guess"}\n')
+        reply = json.loads(conn.makefile('r').readline())
+    assert reply == {"type": "error", "error": "invalid token"}
+    assert server.jobs.empty()
+
+
+def test_jobs_from_another_directory_are_refused(server, tmp_path):
+    other = tmp_path / "other checkout"
+    other.mkdir()
+    replies = list(daemon.request({"command": "submit", "stages": ["media"], "cwd": str(other)}, timeout=5))
+    assert replies[0]["type"] == "error" and "this daemon serves" in replies[0]["error"]
+    assert server.jobs.empty()
+
+
+def test_job_paths_resolve_against_the_client_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "PDF").mkdir()
+    job = daemon._make_job(1, {"stages": ["lectures", "bogus"], "cwd": str(tmp_path), "pdf": "PDF",
+                               "report": "out/report.json", "prometheus": None, "profile": True})
+    assert job.stages == ["lectures"]
+    assert job.pdf == str(tmp_path / "PDF")
+    assert job.report == str(tmp_path / "out" / "report.json")
+    assert job.prometheus is None and job.profile and not job.resume
+    with pytest.raises(ValueError):
+        daemon._make_job(2, {"stages": ["media"], "cwd": str(tmp_path), "profile": "yes"})
+    with pytest.raises(ValueError):
+        daemon._make_job(3, {"stages": ["lectures"], "cwd": str(tmp_path), "pdf": "missing.pdf"})
+
+
+def test_no_daemon_in_another_project(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert not daemon.is_running()
@@ -0,0 +1,27 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dedup import DuplicateIndex, normalize_text
+
+
+def test_normalize_text_keeps_numbers():
+    assert normalize_text("Boiling point: 100 C") == "boiling point 100 c"
+
+
+def test_slides_differing_only_in_values_stay_apart():
+    index = DuplicateIndex()
+    assert index.add("a/page1", "Water boils at 100 C at sea level") == "a/page1"
+    assert index.add("a/page2", "Water boils at 90 C at sea level") == "a/page2"
+    assert index.add("a/page3", "Quiz: what is 2 + 2?") == "a/page3"
+    assert index.add("a/page4", "Quiz: what is 7 + 5?") == "a/page4"
+    assert index.duplicate_count() == 0
+
+
+def test_same_text_with_other_punctuation_is_a_duplicate():
+    index = DuplicateIndex()
+    text = "Enzymes lower the activation energy of reactions (by 50 kJ) and are not consumed"
+    index.add("a/page1", text)
+    assert index.add("b/page4", "- ENZYMES lower the activation energy of reactions, by 50 kJ, and are not consumed.") \
+        == "a/page1"
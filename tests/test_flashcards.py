@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flashcards import FlashcardStore, fts_query
+
+
+@pytest.fixture
+def store(tmp_path):
+    with FlashcardStore(str(tmp_path / "cards.db")) as store:
+        store.import_pairs("Biology", "Cell-membrane@Barrier that controls what enters and leaves a cell\\"
+                                      "DNA@Molecule that carries genetic information\\"
+                                      "Ribosome@Where proteins are built, it's in the cytoplasm")
+        yield store
+
+
+def test_fts_query_quotes_every_word():
+    assert fts_query('cell-membrane what\'s "x"') == '"cell-membrane" "what\'s" """x"""'
+    assert fts_query("   ") == ""
+
+
+@pytest.mark.parametrize("query, term", [
+    ("cell-membrane", "Cell-membrane"),
+    ("what's", None),
+    ("it's cytoplasm", "Ribosome"),
+    ("DNA OR", None),
+    ("DNA", "DNA"),
+    ('"genetic', "DNA"),
+    ("NEAR(", None),
+])
+def test_search_accepts_punctuation_and_operators(store, query, term):
+    results = store.search(query)
+    assert [card["term"] for card in results] == ([term] if term else [])
+
+
+def test_search_with_empty_query(store):
+    assert store.search("  ") == []
+
+
+def collapsed_terms(tmp_path, decks):
+    with FlashcardStore(str(tmp_path / "collapse.db")) as store:
+        for deck, text in decks.items():
+            store.import_pairs(deck, text)
+        store.collapse_near_duplicates()
+        return sorted(card["term"] for card in store.cards())
+
+
+@pytest.mark.parametrize("first, second", [
+    ("Type I error@Rejecting a null hypothesis that is true",
+     "Type II error@Failing to reject a null hypothesis that is false"),
+    ("World War I@Global war fought from 1914 to 1918",
+     "World War II@Global war fought from 1939 to 1945"),
+])
+def test_collapse_keeps_terms_with_different_numerals(tmp_path, first, second):
+    terms = collapsed_terms(tmp_path, {"Statistics": first, "History": second})
+    assert terms == sorted([first.split("@")[0], second.split("@")[0]])
+
+
+def test_collapse_needs_similar_definitions(tmp_path):
+    terms = collapsed_terms(tmp_path, {"Biology": "Cell membrane@Barrier that controls what enters a cell",
+                                       "Physics": "Cell membranes@Thin film across an electrochemical cell"})
+    assert terms == ["Cell membrane", "Cell membranes"]
+
+
+def test_collapse_links_copies_from_other_decks_only(tmp_path):
+    definition = "Barrier that controls what enters and leaves a cell"
+    terms = collapsed_terms(tmp_path, {"Lecture 1": f"Cell membrane@{definition}\\Cell membranes@{definition}",
+                                       "Lecture 2": f"Cell Membrane@{definition}"})
+    assert terms == ["Cell membrane", "Cell membranes"]
@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import PageJournal
+
+
+def test_append_after_torn_tail(tmp_path):
+    journal = PageJournal("transcript", "Lecture 1", str(tmp_path))
+    journal.append(1, "a", "one")
+    journal.append(2, "b", "two")
+    journal.close()
+    with open(journal.path, 'ab') as f:
+        f.write(b'{"page": 3, "hash": "c", "te')
+
+    journal = PageJournal("transcript", "Lecture 1", str(tmp_path))
+    assert sorted(journal.entries()) == [1, 2]
+    journal.append(3, "c", "three")
+    journal.append(4, "d", "four")
+    journal.close()
+
+    entries = PageJournal("transcript", "Lecture 1", str(tmp_path)).entries()
+    assert sorted(entries) == [1, 2, 3, 4]
+    assert entries[3]["text"] == "three"
+
+
+def test_append_after_torn_first_line(tmp_path):
+    journal = PageJournal("audio", "Lecture 1", str(tmp_path))
+    os.makedirs(os.path.dirname(journal.path))
+    with open(journal.path, 'wb') as f:
+        f.write(b'{"page": 1, "ha')
+    journal.append(1, "a")
+    journal.close()
+
+    assert journal.completed({1: "a"}) == {1: {"page": 1, "hash": "a"}}
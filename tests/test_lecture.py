@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+import wave
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_meta import concat_audio
+from lecture import concat_clips
+from video import create_video_ffmpeg, find_ffmpeg
+
+ffmpeg = find_ffmpeg()
+pytestmark = pytest.mark.skipif(not ffmpeg, reason="needs ffmpeg")
+
+
+def write_wav(path, seconds):
+    # Silence in the format pyttsx3 writes
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(22050)
+        f.writeframes(b'\0\0' * int(22050 * seconds))
+
+
+def test_single_and_multi_part_pages_are_joined_by_stream_copy(tmp_path):
+    image_path = str(tmp_path / "slide.png")
+    subprocess.run([ffmpeg, '-y', '-loglevel', 'error', '-f', 'lavfi', '-i', 'color=c=white:s=320x240',
+                    '-frames:v', '1', image_path], check=True, stdin=subprocess.DEVNULL)
+    clips = []
+    for page_num, part_count in ((1, 1), (2, 3)):
+        parts = []
+        for index in range(part_count):
+            parts.append(str(tmp_path / f"page{page_num}_part{index}.wav"))
+            write_wav(parts[-1], 2)
+        audio_path = str(tmp_path / f"page{page_num}.mp3")
+        metadata = concat_audio(parts, audio_path)
+        clip_path = str(tmp_path / f"page{page_num}.mp4")
+        create_video_ffmpeg(image_path, audio_path, clip_path, ffmpeg, metadata["duration"])
+        clips.append((f"Slide {page_num}", clip_path))
+
+    assert concat_clips(clips, str(tmp_path / "lecture.mp4"), ffmpeg) == "copy"
@@ -0,0 +1,40 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The pipeline imports the TTS engines, which are only there in a full install
+pipeline = pytest.importorskip("pipeline")
+
+
+class StubManifest:
+    def save(self):
+        pass
+
+
+def test_run_returns_when_synthesis_fails(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(pipeline, "DEDUP", False)
+
+    async def explain_deck(pdf_path, transcripts_folder, limiter, manifest, on_page=None, *args):
+        # Far more pages than the audio queue holds
+        for page_num in range(1, 50):
+            await on_page(page_num, f"Page {page_num}")
+
+    def synthesize():
+        raise OSError("journal is not writable")
+
+    monkeypatch.setattr(pipeline.ai, "brainrot_deck_async", explain_deck)
+    lecture = pipeline.LecturePipeline(manifest=StubManifest(), queue_size=2, pdf_paths=["Lecture 1.pdf"],
+                                       full_lecture=False, workers=1)
+    monkeypatch.setattr(lecture, "_synthesize", synthesize)
+
+    runner = threading.Thread(target=lecture.run, daemon=True)
+    runner.start()
+    runner.join(timeout=10)
+
+    assert not runner.is_alive()
+    assert ("audio stage", "journal is not writable") in lecture.failed
@@ -0,0 +1,49 @@
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pptx_text import count_slides, iter_slides
+
+P = 'xmlns:p="http://schemas.openxmlformats.org/presentationml/2006/main"'
+A = 'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main"'
+R = 'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+RELS = 'xmlns="http://schemas.openxmlformats.org/package/2006/relationships"'
+SLIDE_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/slide"
+NOTES_TYPE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/notesSlide"
+
+
+def shape(text, placeholder=None):
+    ph = f'<p:ph type="{placeholder}"/>' if placeholder else ''
+    return (f'<p:sp><p:nvSpPr><p:nvPr>{ph}</p:nvPr></p:nvSpPr>'
+            f'<p:txBody><a:p><a:r><a:t>{text}</a:t></a:r></a:p></p:txBody></p:sp>')
+
+
+def part(root, shapes):
+    return f'<{root} {P} {A}><p:cSld><p:spTree>{shapes}</p:spTree></p:cSld></{root}>'
+
+
+@pytest.mark.parametrize("slide_target, notes_target", [
+    ("slides/slide1.xml", "../notesSlides/notesSlide1.xml"),
+    ("/ppt/slides/slide1.xml", "/ppt/notesSlides/notesSlide1.xml"),
+])
+def test_relationship_targets_relative_and_package_absolute(tmp_path, slide_target, notes_target):
+    path = str(tmp_path / "deck.pptx")
+    with zipfile.ZipFile(path, 'w') as archive:
+        archive.writestr("ppt/presentation.xml",
+                         f'<p:presentation {P} {R}><p:sldIdLst><p:sldId id="256" r:id="rId2"/></p:sldIdLst>'
+                         '</p:presentation>')
+        archive.writestr("ppt/_rels/presentation.xml.rels",
+                         f'<Relationships {RELS}><Relationship Id="rId2" Type="{SLIDE_TYPE}" '
+                         f'Target="{slide_target}"/></Relationships>')
+        archive.writestr("ppt/slides/slide1.xml", part("p:sld", shape("Mitosis", "title") + shape("Cell division")))
+        archive.writestr("ppt/slides/_rels/slide1.xml.rels",
+                         f'<Relationships {RELS}><Relationship Id="rId1" Type="{NOTES_TYPE}" '
+                         f'Target="{notes_target}"/></Relationships>')
+        archive.writestr("ppt/notesSlides/notesSlide1.xml", part("p:notes", shape("Mention the phases", "body")))
+
+    assert list(iter_slides(path)) == [(1, "Mitosis\nCell division\n\nSpeaker notes:\nMention the phases")]
+    assert count_slides(path) == 1
@@ -0,0 +1,107 @@
+import json
+import os
+from pathlib import Path
+import fitz  # PyMuPDF for PDF handling
+from manifest import hash_text
+import metrics
+
+TEXT_INDEX_DIR = os.path.join(".cache", "text_index")
+
+# Indexes already loaded by this process, by absolute PDF path
+_loaded = {}
+
+
+class PageTextIndex:
+    """
+    Text of every page of one PDF, extracted once with PyMuPDF.
+
+    Pages are numbered like the PDF itself (1-based, empty pages included), so
+    page N here is always page N - 1 of fitz / render.PageRenderer.
+    Each entry is {"page": N, "text": ..., "hash": ...}.
+    """
+
+    def __init__(self, pdf_path, pages, source_stamp):
+        self.pdf_path = pdf_path
+        self.pages = pages
+        self.source_stamp = source_stamp
+        self._by_number = {entry["page"]: entry for entry in pages}
+
+    def __len__(self):
+        return len(self.pages)
+
+    def get(self, page_num):
+        return self._by_number.get(page_num)
+
+    def text(self, page_num):
+        entry = self._by_number.get(page_num)
+        return entry["text"] if entry else ""
+
+    def non_empty(self):
+        """(page_num, text) for every page that has text"""
+        return [(entry["page"], entry["text"]) for entry in self.pages if entry["text"].strip()]
+
+    def full_text(self):
+        return "".join(entry["text"] for entry in self.pages)
+
+
+def _source_stamp(pdf_path):
+    # Size + mtime is enough to notice a re-exported PDF without reading it
+    stat = os.stat(pdf_path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _index_path(pdf_path, index_dir):
+    return os.path.join(index_dir, f"{Path(pdf_path).stem}.json")
+
+
+def build_text_index(pdf_path, index_dir=None):
+    """
+    Extract every page's text in a single pass and save the index next to the other caches
+    (index_dir, by default TEXT_INDEX_DIR as it is when called)
+    """
+    index_dir = index_dir or TEXT_INDEX_DIR
+    pages = []
+    with metrics.span("text_extraction", deck=Path(pdf_path).stem), fitz.open(pdf_path) as doc:
+        for page_number, page in enumerate(doc, 1):
+            text = page.get_text()
+            pages.append({"page": page_number, "text": text, "hash": hash_text(text)})
+
+    index = PageTextIndex(pdf_path, pages, _source_stamp(pdf_path))
+
+    os.makedirs(index_dir, exist_ok=True)
+    index_path = _index_path(pdf_path, index_dir)
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({"source": index.source_stamp, "pages": pages}, f, ensure_ascii=False)
+    os.replace(temp_path, index_path)
+    _loaded[os.path.abspath(pdf_path)] = index
+    return index
+
+
+def load_text_index(pdf_path, index_dir=None):
+    """
+    Return the page text index for a PDF, reusing the in-memory or on-disk copy
+    when the PDF hasn't changed and extracting it otherwise.
+    """
+    index_dir = index_dir or TEXT_INDEX_DIR
+    stamp = _source_stamp(pdf_path)
+    key = os.path.abspath(pdf_path)
+    index = _loaded.get(key)
+    if index is not None and index.source_stamp == stamp:
+        return index
+
+    index = None
+    index_path = _index_path(pdf_path, index_dir)
+    if os.path.exists(index_path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("source") == stamp:
+                index = PageTextIndex(pdf_path, data["pages"], stamp)
+        except (OSError, ValueError, KeyError):
+            index = None
+
+    if index is None:
+        index = build_text_index(pdf_path, index_dir)
+    _loaded[key] = index
+    return index
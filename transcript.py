@@ -0,0 +1,184 @@
+"""
+Transcript files.
+
+The structured format is JSON Lines, one {"page": N, "text": "..."} object per
+page, written as each page is ready. A sidecar <name>.idx.json maps page numbers
+to byte offsets so a single page can be read without parsing the whole file.
+
+The older .txt format (PAGE N: between dash lines) is still readable.
+"""
+import json
+import os
+import re
+import shutil
+
+
+TRANSCRIPT_EXTENSIONS = ('.jsonl', '.txt')
+
+
+def index_path_for(transcript_path):
+    return os.path.splitext(transcript_path)[0] + ".idx.json"
+
+
+class TranscriptWriter:
+    """
+    Appends pages to a JSONL transcript and keeps its page offset index up to date.
+
+        with TranscriptWriter("Transcripts/deck.jsonl") as writer:
+            writer.append(1, "explanation...")
+
+    With atomic=True the pages go to <path>.tmp, which replaces path when the
+    writer is closed, so readers never see a half-written transcript. Leaving
+    the with block with an exception keeps the old transcript.
+    """
+
+    def __init__(self, path, append=False, atomic=False):
+        self.path = path
+        self.index_path = index_path_for(path)
+        self.offsets = {}
+        self._write_path = f"{path}.tmp" if atomic else path
+        if append and os.path.exists(path):
+            if atomic:
+                shutil.copyfile(path, self._write_path)
+            self.offsets = build_offset_index(path)
+        self._file = open(self._write_path, 'ab' if append else 'wb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is not None and self._write_path != self.path:
+            self._file.close()
+            os.remove(self._write_path)
+            return
+        self.close()
+
+    def append(self, page_num, text):
+        line = json.dumps({"page": int(page_num), "text": text}, ensure_ascii=False) + "\n"
+        self.offsets[int(page_num)] = self._file.tell()
+        self._file.write(line.encode('utf-8'))
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._write_path != self.path:
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self._write_path, self.path)
+        else:
+            self._file.close()
+        write_offset_index(self.index_path, self.offsets)
+
+
+def write_offset_index(index_path, offsets):
+    temp_path = f"{index_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({str(page): offset for page, offset in sorted(offsets.items())}, f)
+    os.replace(temp_path, index_path)
+
+
+def build_offset_index(path):
+    """Scan a JSONL transcript and return {page_num: byte offset}; later lines for a page win"""
+    offsets = {}
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            try:
+                page_num = int(json.loads(line)["page"])
+                offsets[page_num] = offset
+            except (ValueError, KeyError, TypeError):
+                pass  # Ignore a torn last line from an interrupted write
+            offset += len(line)
+    return offsets
+
+
+def load_offset_index(path):
+    index_path = index_path_for(path)
+    if os.path.exists(index_path) and os.path.getmtime(index_path) >= os.path.getmtime(path):
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                return {int(page): offset for page, offset in json.load(f).items()}
+        except (OSError, ValueError):
+            pass
+    offsets = build_offset_index(path)
+    write_offset_index(index_path, offsets)
+    return offsets
+
+
+def read_page(path, page_num):
+    """Return the text of one page of a transcript, or None if it isn't there"""
+    if not path.endswith('.jsonl'):
+        return dict(iter_pages(path)).get(int(page_num))
+
+    offset = load_offset_index(path).get(int(page_num))
+    if offset is None:
+        return None
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.readline())["text"]
+
+
+def iter_pages(path):
+    """Yield (page_num, text) for every non-empty page of a .jsonl or legacy .txt transcript"""
+    if path.endswith('.jsonl'):
+        yield from _iter_jsonl_pages(path)
+    else:
+        yield from parse_legacy_transcript(_read_text(path))
+
+
+def _iter_jsonl_pages(path):
+    # If a page was written more than once only its latest line counts
+    offsets = load_offset_index(path)
+    latest = set(offsets.values())
+    with open(path, 'rb') as f:
+        offset = 0
+        for line in f:
+            if offset in latest:
+                entry = json.loads(line)
+                if entry["text"].strip():
+                    yield int(entry["page"]), entry["text"].strip()
+            offset += len(line)
+
+
+def _read_text(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read()
+    except UnicodeDecodeError:
+        with open(path, 'r', encoding='latin-1') as f:
+            return f.read()
+
+
+def parse_legacy_transcript(content):
+    """
+    Extract page content from the .txt transcript format with PAGE markers.
+    Returns a list of tuples (page_number, content).
+    """
+    # Match content between PAGE markers
+    pattern = r'PAGE (\d+):\n-{20}\n(.*?)\n-{20}'
+    matches = re.finditer(pattern, content, re.DOTALL)
+
+    pages = []
+    for match in matches:
+        page_num = int(match.group(1))
+        page_content = match.group(2).strip()
+        if page_content:  # Only include non-empty pages
+            pages.append((page_num, page_content))
+
+    return pages
+
+
+def find_transcripts(transcripts_dir):
+    """
+    Return transcript paths in transcripts_dir, one per deck.
+    A deck's .jsonl transcript is preferred over a legacy .txt one.
+    """
+    by_deck = {}
+    for filename in sorted(os.listdir(transcripts_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext not in TRANSCRIPT_EXTENSIONS:
+            continue
+        if stem not in by_deck or ext == '.jsonl':
+            by_deck[stem] = os.path.join(transcripts_dir, filename)
+    return list(by_deck.values())
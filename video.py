@@ -0,0 +1,188 @@
+import os
+import shutil
+import subprocess
+import time
+from manifest import hash_text, hash_file, page_output_path
+from audio_meta import read_audio_metadata
+import metrics
+
+# "ffmpeg" muxes the still image and audio directly, "moviepy" composites frames in Python.
+# ffmpeg falls back to moviepy if it is missing or fails.
+VIDEO_ENCODER = os.getenv("VIDEO_ENCODER", "ffmpeg")
+
+# Number of worker processes encoding page clips, and how many clips may be queued
+# or encoding at once (bounds the memory held by pending jobs)
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", str(os.cpu_count() or 1)))
+VIDEO_MAX_IN_FLIGHT = int(os.getenv("VIDEO_MAX_IN_FLIGHT", str(VIDEO_WORKERS * 2)))
+
+
+def find_ffmpeg():
+    """Return the ffmpeg executable on PATH, or the one bundled with moviepy (imageio-ffmpeg)"""
+    ffmpeg = shutil.which("ffmpeg")
+    if ffmpeg:
+        return ffmpeg
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return None
+
+
+def create_video_ffmpeg(image_path, audio_path, output_path, ffmpeg=None, duration=None):
+    """
+    Create a video from a still image and an audio file with a single ffmpeg call.
+    The image is looped at 1 fps and the audio is always encoded to AAC: TTS engines and
+    chunked synthesis leave WAV or MP3 pages, and only clips with the same audio format
+    can be joined into a full lecture without re-encoding.
+    A known audio duration cuts the clip exactly instead of at the next whole frame.
+    """
+    ffmpeg = ffmpeg or find_ffmpeg()
+    if not ffmpeg:
+        raise RuntimeError("ffmpeg executable not found")
+
+    command = [
+        ffmpeg, '-y', '-loglevel', 'error',
+        '-loop', '1', '-framerate', '1', '-i', image_path,
+        '-i', audio_path,
+        '-map', '0:v', '-map', '1:a',
+        '-c:v', 'libx264', '-tune', 'stillimage', '-preset', 'veryfast',
+        # libx264 with yuv420p needs even dimensions
+        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac',
+        '-shortest', '-movflags', '+faststart',
+    ]
+    if duration:
+        command += ['-t', f"{duration:.3f}"]
+    command.append(output_path)
+    # ffmpeg reads commands from stdin, which stops a process running in the background
+    result = subprocess.run(command, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    if result.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {result.stderr.strip()}")
+
+
+def create_video_moviepy(image_path, audio_path, output_path):
+    """
+    Create a video from a still image and an audio file by compositing frames in moviepy
+    """
+    from moviepy.editor import ImageClip, AudioFileClip
+
+    # Load the audio to get its duration
+    audio = AudioFileClip(audio_path)
+
+    # Create video from the image with the same duration as the audio
+    video = ImageClip(image_path).set_duration(audio.duration)
+
+    # Combine video and audio
+    final_video = video.set_audio(audio)
+
+    # Write the video file
+    final_video.write_videofile(output_path,
+                              fps=1,  # 1 fps is enough for still image
+                              codec='libx264',
+                              audio_codec='aac')
+
+    # Close the clips
+    audio.close()
+    video.close()
+    final_video.close()
+
+
+def create_video_from_image_and_audio(image_path, audio_path, output_path, encoder=None):
+    """
+    Create a video from a still image and an audio file
+    """
+    encoder = encoder or VIDEO_ENCODER
+    # The duration comes from the sidecar written by the TTS stage, if there is one
+    # (moviepy has to load the audio to mux it anyway)
+    metadata = read_audio_metadata(audio_path)
+    duration = metadata["duration"] if metadata else None
+    if encoder == 'ffmpeg':
+        try:
+            create_video_ffmpeg(image_path, audio_path, output_path, duration=duration)
+            return True
+        except Exception as e:
+            print(f"ffmpeg encode failed ({str(e)}), falling back to moviepy")
+
+    try:
+        create_video_moviepy(image_path, audio_path, output_path)
+        return True
+    except Exception as e:
+        print(f"Error creating video: {str(e)}")
+        return False
+
+
+def encode_clip(image_path, audio_path, output_path, encoder=None):
+    """
+    Worker-process entry point: encode one clip and return (ok, seconds).
+    The timing is returned rather than recorded because metrics live in the parent process.
+    """
+    start = time.perf_counter()
+    ok = create_video_from_image_and_audio(image_path, audio_path, output_path, encoder)
+    return ok, time.perf_counter() - start
+
+
+def plan_clip(pdf_name, page_num, image_path, audio_path, video_dir, manifest=None):
+    """
+    Video job for one page, or None if its clip was built from the same image
+    and audio before (when a build manifest is given). A page whose image and
+    audio are the same as another page's gets a copy of that page's clip.
+    """
+    video_path = os.path.join(video_dir, pdf_name, f"{pdf_name}_page{page_num}.mp4")
+    label = f"{pdf_name} page {page_num}"
+    manifest_key = f"{pdf_name}/page{page_num}"
+    input_hash = hash_text(hash_file(image_path), hash_file(audio_path))
+    if manifest and manifest.is_up_to_date("video", manifest_key, input_hash, video_path):
+        print(f"Video for {label} is up to date, skipping")
+        return None
+
+    job = {
+        "label": label,
+        "deck": pdf_name,
+        "page": page_num,
+        "image_path": image_path,
+        "audio_path": audio_path,
+        "video_path": video_path,
+        "manifest_key": manifest_key,
+        "input_hash": input_hash,
+    }
+    source = manifest.find_output("video", input_hash, lambda key: page_output_path(video_dir, key, "mp4")) \
+        if manifest else None
+    if source and os.path.abspath(source) != os.path.abspath(video_path) and copy_clip(source, job, manifest) is None:
+        return None
+    return job
+
+
+def copy_clip(source_path, job, manifest=None):
+    """
+    Give job a copy of the clip at source_path, which was encoded from the same image and audio.
+    Returns None on success, otherwise the error message.
+    """
+    try:
+        shutil.copyfile(source_path, job["video_path"])
+    except OSError as e:
+        print(f"Failed to copy video for {job['label']}: {str(e)}")
+        return str(e)
+    print(f"Video for {job['label']} repeats {source_path}, copied")
+    if manifest:
+        manifest.record("video", job["manifest_key"], job["input_hash"])
+    return None
+
+
+def collect_clip(future, job, manifest=None):
+    """
+    Report the result of an encode_clip future for job and record it in the manifest.
+    Returns None on success, otherwise the error message.
+    """
+    try:
+        ok, seconds = future.result()
+        error = None if ok else "encoder reported failure"
+        metrics.observe("video_encode", seconds, error=not ok, deck=job["deck"], page=job["page"])
+    except Exception as e:
+        error = str(e) or type(e).__name__
+    if error is None:
+        print(f"Created video: {job['video_path']}")
+        if manifest:
+            manifest.record("video", job["manifest_key"], job["input_hash"])
+    else:
+        print(f"Failed to create video for {job['label']}: {error}")
+    return error
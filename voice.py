@@ -1,7 +1,26 @@
 from gtts import gTTS
 import pyttsx3
 import os
+import re
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
 from pathlib import Path
+from audio_meta import concat_audio, copy_audio, write_audio_metadata, remove_audio
+from manifest import page_output_path
+import metrics
+
+TTS_RATE = 200
+
+# "chunked" splits pages into sentence chunks synthesized by TTS_WORKERS processes and joins them,
+# "single" speaks each page as one utterance on one engine
+TTS_MODE = os.getenv("TTS_MODE", "chunked")
+TTS_WORKERS = int(os.getenv("TTS_WORKERS", str(min(4, os.cpu_count() or 1))))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "400"))
+
+# Settings of the pyttsx3 synthesizer used by the lecture pipeline, part of every audio page's input hash,
+# so changing any of them rebuilds the audio. The chunk size only matters when pages are chunked.
+TTS_SETTINGS = f"pyttsx3:rate={TTS_RATE}:mode={TTS_MODE}" + (
+    f":chunk_chars={TTS_CHUNK_CHARS}" if TTS_MODE == "chunked" else "")
 
 def convert_text_to_mp3_gtts(input_file, output_file=None, lang='en', accent='com'):
     """
@@ -30,6 +49,300 @@ def convert_text_to_mp3_gtts(input_file, output_file=None, lang='en', accent='co
     
     return str(output_file)
 
+class Pyttsx3Synthesizer:
+    """
+    Keeps one warmed-up pyttsx3 engine alive and synthesizes many texts per
+    runAndWait cycle, straight from strings (no temporary text files).
+
+    Usage:
+        synth = Pyttsx3Synthesizer(rate=200)
+        synth.synthesize_many([(text1, "page1.mp3"), (text2, "page2.mp3")])
+    """
+
+    def __init__(self, rate=200, voice_id=None, batch_size=16):
+        self.rate = rate
+        self.voice_id = voice_id
+        self.batch_size = batch_size
+        self._engine = None
+        self._queued = []
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            self._engine = pyttsx3.init()
+            self._engine.setProperty('rate', self.rate)
+            if self.voice_id:
+                self._engine.setProperty('voice', self.voice_id)
+        return self._engine
+
+    def queue(self, text, output_file):
+        """Queue text to be saved to output_file on the next flush"""
+        self.engine.save_to_file(text, str(output_file))
+        self._queued.append(str(output_file))
+        if len(self._queued) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Synthesize everything queued in a single runAndWait cycle"""
+        if not self._queued:
+            return []
+        done, self._queued = self._queued, []
+        with metrics.span("tts", pages=len(done)):
+            self.engine.runAndWait()
+        return done
+
+    def synthesize(self, text, output_file):
+        self.queue(text, output_file)
+        self.flush()
+        return str(output_file)
+
+    def synthesize_many(self, items, write_metadata=True):
+        """
+        Synthesize (text, output_file) pairs in batches of batch_size.
+        Returns the list of output files that were written.
+        """
+        written = []
+        for text, output_file in items:
+            # Remove stale output so only files written by this batch are reported
+            remove_audio(output_file)
+            self.queue(text, output_file)
+        self.flush()
+        for _, output_file in items:
+            if os.path.exists(output_file):
+                if write_metadata:
+                    write_audio_metadata(output_file)
+                written.append(str(output_file))
+        return written
+
+    def submit_part(self, text, part_file):
+        """
+        Synthesize one sentence part of a page that is still being written, see join_parts.
+        pyttsx3 engines belong to the calling thread, so this runs now and returns a finished future.
+        """
+        future = Future()
+        start = time.perf_counter()
+        written = self.synthesize_many([(text, part_file)], write_metadata=False)
+        future.set_result((written, time.perf_counter() - start))
+        return future
+
+    def warm_up(self):
+        self.engine
+
+
+# Sentence ends, or line breaks, that split_sentences and SentenceStream split on
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+
+def split_sentences(text, max_chars=TTS_CHUNK_CHARS):
+    """
+    Split text into chunks of whole sentences (or lines) of at most max_chars
+    characters. A single sentence longer than max_chars is kept whole.
+    """
+    sentences = [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+class SentenceStream:
+    """
+    Collects text as it is streamed in and calls on_sentence(sentence) for
+    every sentence (or line) once it is complete, splitting like split_sentences.
+    A sentence is complete when the whitespace after it arrives, or on close().
+    """
+
+    def __init__(self, on_sentence):
+        self.on_sentence = on_sentence
+        self._buffer = ""
+
+    def feed(self, text):
+        self._buffer += text
+        *sentences, self._buffer = SENTENCE_BOUNDARY.split(self._buffer)
+        for sentence in sentences:
+            if sentence.strip():
+                self.on_sentence(sentence.strip())
+
+    def close(self):
+        sentence, self._buffer = self._buffer.strip(), ""
+        if sentence:
+            self.on_sentence(sentence)
+
+
+def join_parts(part_files, output_file):
+    """
+    Join synthesized parts in order into output_file and write its metadata sidecar.
+    The parts are deleted either way. Returns True if output_file was written.
+    """
+    try:
+        if all(os.path.exists(part_file) for part_file in part_files):
+            with metrics.span("tts_concat", pages=1):
+                metadata = concat_audio(part_files, output_file)
+            write_audio_metadata(output_file, metadata)
+            return True
+    except Exception as e:
+        print(f"Error joining audio for {output_file}: {str(e)}")
+    finally:
+        for part_file in part_files:
+            if os.path.exists(part_file):
+                os.remove(part_file)
+    return False
+
+
+def _synthesize_parts(rate, voice_id, items):
+    """Worker-process entry point: synthesize (text, part_file) pairs on this process's engine"""
+    start = time.perf_counter()
+    written = get_pyttsx3_synthesizer(rate, voice_id).synthesize_many(items, write_metadata=False)
+    return written, time.perf_counter() - start
+
+
+def _observe_part(future):
+    if future.exception() is not None:
+        metrics.observe("tts", 0.0, error=True, pages=1)
+    else:
+        metrics.observe("tts", future.result()[1], pages=1)
+
+
+class ChunkedSynthesizer:
+    """
+    Splits each page into sentence chunks, synthesizes the chunks of all pages
+    on a pool of worker processes (one pyttsx3 engine each) and joins every
+    page's chunks into its MP3. Same interface as Pyttsx3Synthesizer.
+
+    The pool is started on first use and kept for the life of the synthesizer.
+    """
+
+    def __init__(self, rate=200, voice_id=None, workers=TTS_WORKERS, chunk_chars=TTS_CHUNK_CHARS, batch_size=16):
+        self.rate = rate
+        self.voice_id = voice_id
+        self.workers = max(1, workers)
+        self.chunk_chars = chunk_chars
+        self.batch_size = batch_size
+        self._pool = None
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def warm_up(self):
+        """Start the worker processes and their engines now instead of on the first page"""
+        futures = [self.pool.submit(_synthesize_parts, self.rate, self.voice_id, []) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def synthesize(self, text, output_file):
+        self.synthesize_many([(text, output_file)])
+        return str(output_file)
+
+    def synthesize_many(self, items):
+        """
+        Synthesize (text, output_file) pairs, returning the list of output files that were written.
+        Each written file gets its metadata sidecar (see audio_meta.py).
+        """
+        pages = []
+        parts = []
+        for text, output_file in items:
+            output_file = str(output_file)
+            remove_audio(output_file)
+            # pyttsx3 writes WAV data, name the parts accordingly
+            page_parts = [(chunk, f"{output_file}.part{index}.wav")
+                          for index, chunk in enumerate(split_sentences(text, self.chunk_chars) or [text])]
+            pages.append((output_file, [part_file for _, part_file in page_parts]))
+            parts.extend(page_parts)
+        if not parts:
+            return []
+
+        # Spread the parts over at least one task per worker, interleaved so the
+        # chunks of one long page end up on different workers
+        task_count = max(self.workers, -(-len(parts) // 4))
+        tasks = [parts[index::task_count] for index in range(task_count) if parts[index::task_count]]
+        futures = {self.pool.submit(_synthesize_parts, self.rate, self.voice_id, task): task for task in tasks}
+        for future in as_completed(futures):
+            try:
+                _, seconds = future.result()
+                metrics.observe("tts", seconds, pages=len(futures[future]))
+            except Exception as e:
+                metrics.observe("tts", 0.0, error=True, pages=len(futures[future]))
+                print(f"Error synthesizing audio chunks: {str(e)}")
+
+        return [output_file for output_file, part_files in pages if join_parts(part_files, output_file)]
+
+    def submit_part(self, text, part_file):
+        """
+        Start synthesizing one sentence part of a page that is still being written,
+        returning a future. The page's parts are joined with join_parts once it is complete.
+        """
+        future = self.pool.submit(_synthesize_parts, self.rate, self.voice_id, [(text, str(part_file))])
+        future.add_done_callback(_observe_part)
+        return future
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+def synthesize_distinct(synthesizer, items):
+    """
+    synthesizer.synthesize_many for (text, output_file) pairs, speaking every distinct
+    text once and copying its audio to the other files with the same text
+    """
+    first = {}
+    for text, output_file in items:
+        first.setdefault(text, str(output_file))
+    written = set(synthesizer.synthesize_many([(text, output_file) for text, output_file in first.items()]))
+    for text, output_file in items:
+        output_file = str(output_file)
+        if output_file != first[text] and first[text] in written:
+            try:
+                copy_audio(first[text], output_file)
+                written.add(output_file)
+            except OSError as e:
+                print(f"Error copying audio to {output_file}: {str(e)}")
+    return [str(output_file) for _, output_file in items if str(output_file) in written]
+
+def reuse_audio(manifest, audio_dir, output_mp3, input_hash):
+    """
+    Copy the MP3 of another page that was built from the same text and settings to output_mp3.
+    Returns the path that was copied, or None if no page has matching audio.
+    """
+    source = manifest.find_output("audio", input_hash, lambda key: page_output_path(audio_dir, key, "mp3"))
+    if source is None or os.path.abspath(source) == os.path.abspath(output_mp3):
+        return None
+    try:
+        copy_audio(source, output_mp3)
+    except OSError as e:
+        print(f"Error copying audio from {source}: {str(e)}")
+        return None
+    return source
+
+
+_synthesizers = {}
+
+def get_pyttsx3_synthesizer(rate=200, voice_id=None):
+    """Return the shared synthesizer for these settings, creating it on first use"""
+    key = (rate, voice_id)
+    if key not in _synthesizers:
+        _synthesizers[key] = Pyttsx3Synthesizer(rate, voice_id)
+    return _synthesizers[key]
+
+def get_synthesizer(rate=TTS_RATE, voice_id=None, mode=None):
+    """The shared synthesizer the pipeline uses, chunked or single utterance depending on TTS_MODE"""
+    mode = mode or TTS_MODE
+    if mode != "chunked":
+        return get_pyttsx3_synthesizer(rate, voice_id)
+    key = ("chunked", rate, voice_id)
+    if key not in _synthesizers:
+        _synthesizers[key] = ChunkedSynthesizer(rate, voice_id)
+    return _synthesizers[key]
+
 def convert_text_to_mp3_pyttsx3(input_file, output_file=None, rate=200, voice_id=None):
     """
     Convert text file to MP3 using pyttsx3 (speed control available).
@@ -50,16 +363,6 @@ def convert_text_to_mp3_pyttsx3(input_file, output_file=None, rate=200, voice_id
     if output_file is None:
         output_file = input_path.with_suffix('.mp3')
     
-    # Initialize the text-to-speech engine
-    engine = pyttsx3.init()
-    
-    # Set the speech rate
-    engine.setProperty('rate', rate)
-    
-    # Set voice if specified
-    if voice_id:
-        engine.setProperty('voice', voice_id)
-    
     # Read the text file
     try:
         with open(input_file, 'r', encoding='utf-8') as file:
@@ -73,10 +376,13 @@ def convert_text_to_mp3_pyttsx3(input_file, output_file=None, rate=200, voice_id
     
     # Save as MP3
     print(f"Saving MP3 to: {output_file}")
-    engine.save_to_file(text, str(output_file))
-    engine.runAndWait()
-    
-    return str(output_file)
+    return convert_string_to_mp3_pyttsx3(text, output_file, rate, voice_id)
+
+def convert_string_to_mp3_pyttsx3(text, output_file, rate=200, voice_id=None):
+    """
+    Convert a string to MP3 using the shared pyttsx3 engine, without a text file round trip.
+    """
+    return get_pyttsx3_synthesizer(rate, voice_id).synthesize(text, output_file)
 
 def list_available_voices():
     """List all available voices with their IDs."""